@@ -1,32 +1,94 @@
+import importlib
 import os
-import logging.config
+import logging
 from datetime import datetime
+
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_bootstrap import Bootstrap
 
 
 from config import Config
 
-app = Flask(__name__)
-app.config.from_object(Config)
+bootstrap = Bootstrap()
+database = SQLAlchemy()
+
+# The analysis and ingest stack, which requests only need once they sync or analyze an account.
+# Prefork servers can import it once up front with preload() so the workers share it.
+PRELOAD_MODULES = ('app.analyzer', 'app.jobs', 'app.psql', 'app.wanikani')
+
+
+def create_app(config_class=Config) -> Flask:
+    """
+    Creates and configures the application.
+
+    Parameters
+    ----------
+    config_class : type
+        The configuration to load - defaults to Config.
+
+    Returns
+    -------
+    Flask
+        The application.
+
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+
+    bootstrap.init_app(app)
+    database.init_app(app)
+
+    # Alembic is slow to import and only needed by the `flask db` commands, so skip it when serving requests.
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, database)
+
+    _configure_logging(app)
+
+    from app import metrics
+    metrics.init_app(app)
+
+    from app.streaming import RenderCache
+    app.extensions['render_cache'] = RenderCache(max_bytes=app.config['RENDER_CACHE_BYTES'])
+
+    from app import models
+    from app.routes import main
+    app.register_blueprint(main)
+
+    from app.cli import register_commands
+    register_commands(app)
+
+    if app.config['PRELOAD']:
+        preload()
+
+    return app
+
+
+def preload():
+    """
+    Imports the analysis and ingest stack ahead of the first request that needs it.
+    Call it in the master process of a prefork server, before the workers are forked.
 
-bootstrap = Bootstrap(app)
+    Returns
+    -------
+    None
 
-database = SQLAlchemy(app)
-migrate = Migrate(app, database)
+    """
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
 
-if not os.path.exists('logs'):
-    os.mkdir('logs')
 
-file_handler = logging.FileHandler('logs/{:%Y-%m-%d}.log'.format(datetime.utcnow()))
-file_handler.setFormatter(
-    logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-)
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('Wanikani analyzer starting...')
+def _configure_logging(app: Flask):
+    if not os.path.exists('logs'):
+        os.mkdir('logs')
 
-from app import routes, models
+    file_handler = logging.FileHandler('logs/{:%Y-%m-%d}.log'.format(datetime.utcnow()))
+    file_handler.setFormatter(
+        logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.setLevel(logging.INFO)
+    app.logger.info('Wanikani analyzer starting...')
@@ -1,12 +1,26 @@
-import json
 import logging
 import pprint
 from datetime import datetime
 from typing import Union
 
 
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
 from app import database
+from app.locks import SingleFlight, advisory_lock
+from app.metrics import INGEST_WRITES, INGESTED_ROWS, PHASE_SECONDS, timed
 from app.models import Account, LevelProgression, Assignment, Stage, Review, Subject
+from app.partitioning import is_partitioned
+from app.progress import Progress
+from app.wanikani import DATE_FORMAT
+
+# Concurrent syncs and analyses of the same account within this process share a single result.
+_in_flight = SingleFlight()
+
+# The number of seconds an account's synced data is reused for before it's synced from the API again.
+CACHE_SECONDS = 10 * 60
 
 
 class Analyzer:
@@ -20,11 +34,69 @@ class Analyzer:
         The WaniKani client initialized using an API key.
     db : PostgresClient
         The Postgres DB client.
+    progress : Progress
+        Optionally receives the sync progress as pages are ingested.
+    batch_size : int
+        The number of rows written per statement during ingest - defaults to INGEST_BATCH_SIZE.
+    rewrite : bool
+        Always ingest, and overwrite existing rows even if WaniKani hasn't changed them, e.g. when replaying archived
+        payloads after fixing the processing.
     """
-    def __init__(self, wanikani, db):  # Duck-typed for easier mocking and dependency injection.
+    # The blocks each section's analysis is made of, mapped to the methods that compute them.
+    SECTIONS = {
+        'level_progressions': {
+            'totals': '_level_progression_totals',
+            'levels': '_level_progression_levels',
+            'aggregates': '_level_progression_aggregates'
+        },
+        'assignments': {
+            'totals': '_assignment_totals',
+            'aggregates': '_assignment_aggregates',
+            'assignments': '_assignment_durations'
+        },
+        'reviews': {
+            'totals': '_review_totals',
+            'aggregates': '_review_aggregates'
+        }
+    }
+
+    # The blocks that take the number of highest and lowest values to include.
+    TOP_N_BLOCKS = {'aggregates'}
+
+    # The answer types leeches can be ranked by, mapped to the subject_accuracy columns they're ranked on.
+    LEECH_ANSWERS = {
+        'meaning': 'incorrect_meaning_answers',
+        'reading': 'incorrect_reading_answers'
+    }
+
+    # The bin widths the review forecast supports, as Postgres date_trunc units and intervals.
+    FORECAST_BINS = {
+        'hour': '1 hour',
+        'day': '1 day'
+    }
+
+    # The table each endpoint is ingested into and the columns that are overwritten when a row already exists.
+    # Existing rows are only overwritten when their data_updated_at has changed.
+    INGESTED_TABLES = {
+        'level_progressions': (LevelProgression, ('started_at', 'passed_at', 'completed_at',
+                                                  'pass_duration', 'complete_duration', 'data_updated_at')),
+        'assignments': (Assignment, ('srs_stage', 'started_at', 'passed_at', 'burned_at', 'available_at',
+                                     'pass_duration', 'complete_duration', 'data_updated_at')),
+        'reviews': (Review, ('starting_srs_stage', 'ending_srs_stage',
+                             'incorrect_meaning_answers', 'incorrect_reading_answers', 'data_updated_at'))
+    }
+
+    def __init__(self, wanikani, db, progress: Progress = None, batch_size: int = None,
+                 rewrite: bool = False):  # Duck-typed for easier mocking and dependency injection.
         self._client = wanikani
         self._db = db
+        self._progress = progress or Progress()
+        self._batch_size = batch_size
+        self._rewrite = rewrite
         self._cache = {}
+        self.ingest_stats = {}
+        self.cache_stats = {}
+        self.user_info = None
 
     def analyze_user_info(self) -> dict:
         """
@@ -36,48 +108,316 @@ class Analyzer:
             JSON containing all the user data.
 
         """
-        self._initialize_static_info()
+        summary = self.sync_user_info()
+        user = Account.query.get(summary['id'])
 
-        user = self._process_user(user_info=self._client.get_user())
+        user_stats = {
+            'user': summary,
+            'level_progressions': self._analyze_level_progressions(user=user),
+            'assignments': self._analyze_assignments(user=user),
+            'reviews': self._analyze_reviews(user=user)
+        }
 
-        # Query the API for newer info if we're past our 10 minute cache time or if the data doesn't exist.
-        if not self._cache[user.id]:
-            logging.info('Processing new data...')
-            print('======== LEVEL PROGRESSION DATA ========')
+        pretty_print(user_stats)
 
-            for page in self._client.get_level_progressions():
-                self._process_level_progressions(user=user, progressions=page)
+        return user_stats
 
-            database.session.flush()
+    def sync_user_info(self, user_info: dict = None) -> dict:
+        """
+        Syncs the user's data from the WaniKani API without analyzing it.
+        Concurrent syncs of the same user within this process are coalesced before the database is touched, so the
+        callers waiting on another one's sync don't use a connection meanwhile.
 
-            print('\n======== ASSIGNMENT PROGRESS DATA ========')
+        Parameters
+        ----------
+        user_info : dict
+            The user info from a recent get_user call for the same API key, which saves the request when the cached
+            data is fresh - defaults to requesting it.
 
-            for page in self._client.get_assignments():
-                self._process_assignments(user=user, assignments=page)
+        Returns
+        -------
+        dict
+            JSON containing the user's account info.
 
-            database.session.flush()
+        """
+        if user_info is None:
+            with timed(PHASE_SECONDS, 'get_user', phase='get_user'):
+                user_info = self._client.get_user()
 
-            print('\n======== REVIEW DATA ========')
+        self.user_info = user_info
 
-            for page in self._client.get_reviews():
-                self._process_reviews(user=user, reviews=page)
+        return _in_flight.do(f"sync:{user_info['username']}", lambda: self._sync(user_info=user_info))
 
-            database.session.commit()
+    def analyze(self, user: Account, section: str, block: str = None, top: int = 3):
+        """
+        Analyzes one section of the user's data, or one block within the section.
+        Concurrent requests for the same analysis within this process share a single result.
 
-        user_stats = {
-            'user': {
-                'level': user.level,
-                'username': user.username,
-                'start_date': user.start_date
-            },
-            'level_progressions': self._analyze_level_progressions(user=user),
-            'assignments': self._analyze_assignments(user=user),
-            'reviews': self._analyze_reviews(user=user)
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        section : str
+            One of the keys of Analyzer.SECTIONS.
+        block : str
+            One of the section's blocks - defaults to the whole section.
+        top : int
+            The number of highest and lowest values to include in aggregates.
+
+        Returns
+        -------
+        Union[dict, list]
+            The result of the analysis in JSON format.
+
+        """
+        if block is None:
+            analysis = getattr(self, f'_analyze_{section}')
+        else:
+            analysis = getattr(self, Analyzer.SECTIONS[section][block])
+
+        arguments = {'user': user}
+
+        if block is None or block in Analyzer.TOP_N_BLOCKS:
+            arguments['top'] = top
+
+        phase = f'analyze.{section}' if block is None else f'analyze.{section}.{block}'
+
+        with timed(PHASE_SECONDS, 'analyze', phase=phase):
+            return _in_flight.do(f'analyze:{user.id}:{section}:{block}:{top}', lambda: analysis(**arguments))
+
+    def _extremes(self, sql: str, user: Account, top: int) -> tuple:
+        """
+        Gets the highest and lowest N rows of a query, where N is arbitrary.
+
+        Parameters
+        ----------
+        sql : str
+            The query, ending with the ORDER BY clause with a {direction} placeholder after each key.
+            Ties are broken by the later keys, so both engines and repeated calls return the same rows.
+        user : Account
+            The user's Account ORM object.
+        top : int
+            The number of highest and lowest rows to get.
+
+        Returns
+        -------
+        tuple
+            The highest rows and the lowest rows, each with the most extreme value first.
+
+        """
+        return tuple(
+            self._db.query_all(f'{sql.format(direction=direction)} LIMIT %(top)s', {'user_id': user.id, 'top': top})
+            for direction in ('DESC', 'ASC')
+        )
+
+    def _sync(self, user_info: dict) -> dict:
+        """
+        Syncs the user's data if the cached data is stale.
+        The per-user lock makes other processes wait for an in-progress sync and then reuse its data.
+
+        Parameters
+        ----------
+        user_info : dict
+            The JSON containing the user info.
+
+        Returns
+        -------
+        dict
+            JSON containing the user's account info.
+
+        """
+        with timed(PHASE_SECONDS, 'static_info', phase='static_info'):
+            self._initialize_static_info()
+
+        with advisory_lock(self._db, f"sync:{user_info['username']}"):
+            user = self._process_user(user_info=user_info)
+
+            # Query the API for newer info if we're past our 10 minute cache time or if the data doesn't exist.
+            if not self._cache[user.id]:
+                logging.info('Processing new data...')
+                print('======== LEVEL PROGRESSION DATA ========')
+                self._ingest('level_progressions', self._client.get_level_progressions(), self._process_level_progressions, user)
+
+                print('\n======== ASSIGNMENT PROGRESS DATA ========')
+                self._ingest('assignments', self._client.get_assignments(), self._process_assignments, user)
+
+                print('\n======== REVIEW DATA ========')
+                reviewed = self._ingest('reviews', self._client.get_reviews(), self._process_reviews, user,
+                                        returning='assignment_id')
+
+                with timed(PHASE_SECONDS, 'rollup', phase='rollup.subject_accuracy'):
+                    self._refresh_subject_accuracy(user, assignment_ids=reviewed)
+
+                with timed(PHASE_SECONDS, 'commit', phase='commit'):
+                    database.session.commit()
+
+                # Replicas have the new data once they've replayed this far, so reads can wait for them to catch up.
+                user.synced_lsn = database.session.execute(database.text('SELECT pg_current_wal_lsn()::TEXT')).scalar()
+                database.session.commit()
+
+        return {
+            'id': user.id,
+            'level': user.level,
+            'username': user.username,
+            'start_date': user.start_date
         }
 
-        pretty_print(user_stats)
+    def _ingest(self, endpoint: str, pages, process, user: Account, returning: str = None) -> set:
+        """
+        Writes every page of an endpoint's data for the user.
+        Rows are upserted batch_size at a time with bulk statements rather than as ORM objects, so the session's
+        identity map doesn't grow with the user's history and memory stays bounded however many reviews there are.
+        Everything is still committed together once the sync finishes.
+        The number of rows inserted, updated and skipped as unchanged is added to ingest_stats.
 
-        return user_stats
+        Parameters
+        ----------
+        endpoint : str
+            One of the keys of INGESTED_TABLES, for the table, progress and metrics.
+        pages : Iterator[dict]
+            The JSON responses for each page.
+        process : Callable
+            Converts a page into rows - called with the user and the page.
+        user : Account
+            The user's Account ORM object.
+        returning : str
+            A column to collect the values of from the inserted and updated rows, e.g. to update rollups.
+
+        Returns
+        -------
+        set
+            The returning column's values, if any.
+
+        """
+        model, updated_columns = self.INGESTED_TABLES[endpoint]
+        batch_size = self._batch_size or current_app.config['INGEST_BATCH_SIZE']
+        # Partitioned tables are keyed by (user_id, id), which the upsert has to name as its conflict target.
+        key = ('user_id', 'id') if is_partitioned(model.__tablename__) else ('id',)
+        stats = self.ingest_stats[endpoint] = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        written = set()
+        batch = []
+
+        def write(rows):
+            counts, values = self._upsert(model, rows, key, updated_columns, returning=returning)
+            written.update(values)
+
+            for result, count in counts.items():
+                stats[result] += count
+
+            self._progress.batch_written(counts)
+
+        self._progress.start_endpoint(endpoint)
+
+        with timed(PHASE_SECONDS, 'ingest', phase=f'ingest.{endpoint}'):
+            for page in pages:
+                batch += process(user, page)
+
+                while len(batch) >= batch_size:
+                    write(batch[:batch_size])
+                    del batch[:batch_size]
+
+                self._progress.page_processed(page)
+                INGESTED_ROWS.inc(len(page['data']), endpoint=endpoint)
+
+            if batch:
+                write(batch)
+
+        for result, rows in stats.items():
+            INGEST_WRITES.inc(rows, endpoint=endpoint, result=result)
+
+        logging.info(f"Ingested {endpoint}: {stats['inserted']} inserted, {stats['updated']} updated, "
+                     f"{stats['skipped']} unchanged.")
+
+        return written
+
+    def _upsert(self, model: database.Model, rows: list, key: tuple, updated_columns: tuple,
+                returning: str = None) -> tuple:
+        """
+        Inserts the rows in one statement, updating the existing rows whose data_updated_at has changed.
+        Unchanged rows are left alone, so they don't create dead tuples, WAL or index churn, unless rewriting.
+
+        Parameters
+        ----------
+        model : database.Model
+            The model of the table to write to.
+        rows : list
+            The rows as dicts of column values.
+        key : tuple
+            The columns of the table's primary key.
+        updated_columns : tuple
+            The columns to overwrite in rows that have changed.
+        returning : str
+            A column to return the values of from the inserted and updated rows.
+
+        Returns
+        -------
+        tuple
+            The number of rows inserted, updated and skipped, and the returning column's values.
+
+        """
+        table = model.__table__
+        statement = insert(table).values(rows)
+        changed = table.c.data_updated_at.is_distinct_from(statement.excluded.data_updated_at)
+        statement = statement.on_conflict_do_update(
+            index_elements=key,
+            set_={column: statement.excluded[column] for column in updated_columns},
+            where=None if self._rewrite else changed
+        ).returning(table.c.id, *([table.c[returning]] if returning else []))
+
+        with timed(PHASE_SECONDS, 'write', phase='write'):
+            # Partitioned tables can't return xmax, so tell inserts from updates by which keys already existed.
+            # The batch belongs to one user, which also prunes the lookup to that user's partition.
+            existing = set(database.session.execute(
+                select(table.c.id).where(table.c.user_id == rows[0]['user_id'],
+                                         table.c.id.in_([row['id'] for row in rows]))
+            ).scalars())
+            written = database.session.execute(statement).all()
+
+        updated = sum(row[0] in existing for row in written)
+        counts = {'inserted': len(written) - updated, 'updated': updated, 'skipped': len(rows) - len(written)}
+
+        return counts, [row[1] for row in written] if returning else []
+
+    def _refresh_subject_accuracy(self, user: Account, assignment_ids: set):
+        """
+        Recomputes the user's subject_accuracy rollup for the subjects of the given assignments.
+        Only subjects whose reviews were just inserted or updated are recomputed, in batches, so a re-sync costs
+        as much as what changed rather than the user's whole review history.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        assignment_ids : set
+            The assignments whose reviews changed.
+
+        Returns
+        -------
+        None
+
+        """
+        assignment_ids = sorted(assignment_ids)
+        batch_size = self._batch_size or current_app.config['INGEST_BATCH_SIZE']
+
+        for start in range(0, len(assignment_ids), batch_size):
+            database.session.execute(
+                database.text(
+                    "INSERT INTO subject_accuracy (user_id, subject_id, reviews, incorrect_meaning_answers, "
+                    "incorrect_reading_answers, last_stage_change) "
+                    "SELECT a.user_id, a.subject_id, COUNT(*), COALESCE(SUM(r.incorrect_meaning_answers), 0), "
+                    "COALESCE(SUM(r.incorrect_reading_answers), 0), "
+                    "(ARRAY_AGG(r.ending_srs_stage - r.starting_srs_stage ORDER BY r.id DESC))[1] "
+                    "FROM assignment a JOIN review r ON r.user_id = a.user_id AND r.assignment_id = a.id "
+                    "WHERE a.user_id = :user_id AND a.id = ANY(:assignment_ids) "
+                    "GROUP BY a.user_id, a.subject_id "
+                    "ON CONFLICT (user_id, subject_id) DO UPDATE SET "
+                    "reviews = excluded.reviews, "
+                    "incorrect_meaning_answers = excluded.incorrect_meaning_answers, "
+                    "incorrect_reading_answers = excluded.incorrect_reading_answers, "
+                    "last_stage_change = excluded.last_stage_change"
+                ),
+                {'user_id': user.id, 'assignment_ids': assignment_ids[start:start + batch_size]}
+            )
 
     def _initialize_static_info(self):
         """
@@ -88,17 +428,18 @@ class Analyzer:
         None
 
         """
-        # Only need to populate the subjects once.
-        if self._db.query_one('SELECT COUNT(*) FROM subject')['count'] == 0:
-            logging.info('Processing subject info...')
-            for page in self._client.get_subjects():
-                self._process_subjects(subjects=page)
+        # Only need to populate the subjects once, so make sure concurrent first runs don't both do it.
+        with advisory_lock(self._db, 'static_info'):
+            if self._db.query_one('SELECT COUNT(*) FROM subject')['count'] == 0:
+                logging.info('Processing subject info...')
+                for page in self._client.get_subjects():
+                    self._process_subjects(subjects=page)
 
-        if self._db.query_one('SELECT COUNT(*) FROM stage')['count'] == 0:
-            logging.info('Processing SRS stage info...')
-            self._process_srs_stages(stages=self._client.get_srs_stages())  # No need to paginate since there are so few.
+            if self._db.query_one('SELECT COUNT(*) FROM stage')['count'] == 0:
+                logging.info('Processing SRS stage info...')
+                self._process_srs_stages(stages=self._client.get_srs_stages())  # No need to paginate since there are so few.
 
-        database.session.commit()
+            database.session.commit()
 
     def _calculate_time_delta(self, first_date: Union[str, datetime], second_date: Union[str, datetime]) -> Union[float, None]:
         """
@@ -151,16 +492,22 @@ class Analyzer:
 
         current_time = datetime.utcnow()
 
+        # Rewrites don't come from the API, so they neither use nor reset the cache time.
+        if user and self._rewrite:
+            self._cache[user.id] = False
+            return user
+
         if user:
             last_queried_time = user.last_queried
             time_since_last_query = self._calculate_time_delta(last_queried_time, current_time) or 0
-            use_cached_values = time_since_last_query < (10 * 60)
+            use_cached_values = time_since_last_query < CACHE_SECONDS
 
             if not use_cached_values:
                 user.last_queried = current_time
                 database.session.commit()
 
             self._cache[user.id] = use_cached_values  # Use cached data for 10 minutes to prevent unnecessary load.
+            self.cache_stats = {'hit': use_cached_values, 'data_age_seconds': time_since_last_query}
 
             return user
 
@@ -172,12 +519,13 @@ class Analyzer:
         database.session.commit()
 
         self._cache[user.id] = False
+        self.cache_stats = {'hit': False, 'data_age_seconds': None}
 
         return user
 
-    def _process_level_progressions(self, user: Account, progressions: dict):
+    def _process_level_progressions(self, user: Account, progressions: dict) -> list:
         """
-        Processes the user's WaniKani level progression info and stores it in the database to be easily accessible.
+        Processes the user's WaniKani level progression info into rows to store in the database.
 
         Parameters
         ----------
@@ -188,9 +536,12 @@ class Analyzer:
 
         Returns
         -------
-        None
+        list
+            The level_progression rows.
 
         """
+        rows = []
+
         for level_prog in progressions['data']:
             id = level_prog['id']
             level = level_prog['data']['level']
@@ -198,24 +549,22 @@ class Analyzer:
             pass_date = level_prog['data']['passed_at']
             end_date = level_prog['data']['completed_at']
 
-            lvl = LevelProgression.query.filter_by(id=id).first()
-
-            if lvl:
-                lvl.started_at = start_date
-                lvl.passed_at = pass_date
-                lvl.completed_at = end_date
-            else:
-                lvl = LevelProgression()
-                lvl.id = id
-                lvl.level = level
-                lvl.user_id = user.id
-                lvl.started_at = start_date
-                lvl.passed_at = pass_date
-                lvl.completed_at = end_date
-                database.session.add(lvl)
+            rows.append({
+                'id': id,
+                'level': level,
+                'user_id': user.id,
+                'started_at': start_date,
+                'passed_at': pass_date,
+                'completed_at': end_date,
+                'pass_duration': self._calculate_time_delta(start_date, pass_date),
+                'complete_duration': self._calculate_time_delta(start_date, end_date),
+                'data_updated_at': level_prog['data_updated_at']
+            })
 
             print(f'ID: {id:>10} | Level: {level:>2} | Start date: {start_date or "N/A":>27} | Pass date: {pass_date or "N/A":>27} | Completion date: {end_date or "N/A":>27}')
 
+        return rows
+
     def _process_subjects(self, subjects: dict):
         """
         Processes all WaniKani subjects and stores it in the database to be easily accessible.
@@ -249,9 +598,9 @@ class Analyzer:
             sbjt.characters = subject['data']['characters'] or '[Radical]'
             database.session.add(sbjt)
 
-    def _process_assignments(self, user: Account, assignments: dict):
+    def _process_assignments(self, user: Account, assignments: dict) -> list:
         """
-        Processes the user's WaniKani assignments and stores it in the database to be easily accessible.
+        Processes the user's WaniKani assignments into rows to store in the database.
 
         Parameters
         ----------
@@ -262,36 +611,41 @@ class Analyzer:
 
         Returns
         -------
-        None
+        list
+            The assignment rows.
 
         """
+        rows = []
+        # Look up the characters of the page's subjects at once rather than loading a Subject for every assignment.
+        subject_ids = {assignment['data']['subject_id'] for assignment in assignments['data']}
+        characters = dict(database.session.execute(
+            select(Subject.id, Subject.characters).where(Subject.id.in_(subject_ids))
+        ).all())
+
         for assignment in assignments['data']:
             id = assignment['id']
             subject_id = assignment['data']['subject_id']
-            subject = Subject.query.filter_by(id=subject_id).first().characters
+            subject = characters[subject_id]
             srs_stage_name = assignment['data']['srs_stage_name']
             srs_stage_id = assignment['data']['srs_stage']
             start_date = assignment['data']['started_at']
             pass_date = assignment['data']['passed_at']
             end_date = assignment['data']['burned_at']
-
-            asmt = Assignment.query.filter_by(id=id).first()
-
-            if asmt:
-                asmt.srs_stage = srs_stage_id
-                asmt.started_at = start_date
-                asmt.passed_at = pass_date
-                asmt.burned_at = end_date
-            else:
-                asmt = Assignment()
-                asmt.id = id
-                asmt.user_id = user.id
-                asmt.srs_stage = srs_stage_id
-                asmt.started_at = start_date
-                asmt.passed_at = pass_date
-                asmt.burned_at = end_date
-                asmt.subject_id = subject_id
-                database.session.add(asmt)
+            available_date = assignment['data']['available_at']
+
+            rows.append({
+                'id': id,
+                'user_id': user.id,
+                'srs_stage': srs_stage_id,
+                'started_at': start_date,
+                'passed_at': pass_date,
+                'burned_at': end_date,
+                'available_at': available_date,
+                'pass_duration': self._calculate_time_delta(start_date, pass_date),
+                'complete_duration': self._calculate_time_delta(start_date, end_date),
+                'subject_id': subject_id,
+                'data_updated_at': assignment['data_updated_at']
+            })
 
             # Hack to properly pad UTF-8 Japanese characters.
             # Python does not handle multi-byte characters that well, especially considering full vs half width.
@@ -303,6 +657,8 @@ class Analyzer:
 
             print(f'ID: {id:>10} | Subject ID: {subject_id:>8} | Subject: {subject} | SRS stage: {srs_stage_name:>14} ({srs_stage_id}) | Start date: {start_date or "N/A":>27} | Pass date: {pass_date or "N/A":>27} | Completion date: {end_date or "N/A":>27}')
 
+        return rows
+
     def _process_srs_stages(self, stages: dict):
         """
         Processes all WaniKani SRS stages and stores it in the database to be easily accessible.
@@ -324,9 +680,9 @@ class Analyzer:
             srs_stage.name = stage['srs_stage_name']
             database.session.add(srs_stage)
 
-    def _process_reviews(self, user: Account, reviews: dict):
+    def _process_reviews(self, user: Account, reviews: dict) -> list:
         """
-        Processes the user's WaniKani reviews and stores it in the database to be easily accessible.
+        Processes the user's WaniKani reviews into rows to store in the database.
 
         Parameters
         ----------
@@ -337,9 +693,12 @@ class Analyzer:
 
         Returns
         -------
-        None
+        list
+            The review rows.
 
         """
+        rows = []
+
         for review in reviews['data']:
             id = review['id']
             assignment_id = review['data']['assignment_id']
@@ -348,27 +707,22 @@ class Analyzer:
             incorrect_meaning_answers = review['data']['incorrect_meaning_answers']
             incorrect_reading_answers = review['data']['incorrect_reading_answers']
 
-            rvw = Review.query.filter_by(id=id).first()
-
-            if rvw:
-                rvw.starting_srs_stage = starting_srs_stage
-                rvw.ending_srs_stage = ending_srs_stage
-                rvw.incorrect_meaning_answers = incorrect_meaning_answers
-                rvw.incorrect_reading_answers = incorrect_reading_answers
-            else:
-                rvw = Review()
-                rvw.id = id
-                rvw.user_id = user.id
-                rvw.assignment_id = assignment_id
-                rvw.starting_srs_stage = starting_srs_stage
-                rvw.ending_srs_stage = ending_srs_stage
-                rvw.incorrect_meaning_answers = incorrect_meaning_answers
-                rvw.incorrect_reading_answers = incorrect_reading_answers
-                database.session.add(rvw)
+            rows.append({
+                'id': id,
+                'user_id': user.id,
+                'assignment_id': assignment_id,
+                'starting_srs_stage': starting_srs_stage,
+                'ending_srs_stage': ending_srs_stage,
+                'incorrect_meaning_answers': incorrect_meaning_answers,
+                'incorrect_reading_answers': incorrect_reading_answers,
+                'data_updated_at': review['data_updated_at']
+            })
 
             print(f'ID: {id:>10} | Assignment ID: {assignment_id:>10} | Starting stage: {starting_srs_stage:>2} | Ending stage: {ending_srs_stage:>2} | Incorrect meaning answers: {incorrect_meaning_answers:>4} | Incorrect reading answers: {incorrect_reading_answers:>4}')
 
-    def _analyze_level_progressions(self, user: Account):
+        return rows
+
+    def _analyze_level_progressions(self, user: Account, top: int = 3) -> dict:
         """
         Performs some simple analytics on the user's level progression data, such as aggregates and totals.
 
@@ -376,6 +730,8 @@ class Analyzer:
         ----------
         user : Account
             The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
 
         Returns
         -------
@@ -383,79 +739,130 @@ class Analyzer:
             The result of the analysis in JSON format.
 
         """
-        stats = {}
+        return {
+            'totals': self._level_progression_totals(user=user),
+            'levels': self._level_progression_levels(user=user),
+            'aggregates': self._level_progression_aggregates(user=user, top=top)
+        }
 
-        stats['totals'] = {
-            'total': user.levels.count(),
+    def _level_progression_totals(self, user: Account) -> dict:
+        """
+        Counts the user's levels by completion status.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
+
+        """
+        counts = self._db.query_one(
+            "SELECT COUNT(*) AS total, "
+            "COUNT(*) FILTER (WHERE passed_at IS NULL) AS started, "
+            "COUNT(*) FILTER (WHERE passed_at IS NOT NULL) AS passed, "
+            "COUNT(*) FILTER (WHERE completed_at IS NOT NULL) AS completed "
+            "FROM level_progression "
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
+        )
+
+        return {
+            'total': counts['total'],
             'completion': {
-                'started': user.levels.filter(LevelProgression.passed_at.is_(None)).count(),
-                'passed': user.levels.filter(LevelProgression.passed_at.isnot(None)).count(),
-                'completed': user.levels.filter(LevelProgression.completed_at.isnot(None)).count()
+                'started': counts['started'],
+                'passed': counts['passed'],
+                'completed': counts['completed']
             }
         }
 
-        stats['levels'] = self._db.query_all(
-            "SELECT level, "
-            "DATEDIFF('seconds', started_at, passed_at) AS pass_duration, "
-            "DATEDIFF('seconds', started_at, completed_at) AS complete_duration "
+    def _level_progression_levels(self, user: Account) -> list:
+        """
+        Gets the pass and completion durations of each of the user's levels.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        list
+            The result of the analysis in JSON format.
+
+        """
+        return self._db.query_all(
+            "SELECT level, pass_duration, complete_duration "
             "FROM level_progression "
-            f"WHERE user_id = {user.id} "
-            "ORDER BY level ASC"
+            "WHERE user_id = %(user_id)s "
+            "ORDER BY level ASC",
+            {'user_id': user.id}
         )
 
-        stats['aggregates'] = {}
+    def _level_progression_aggregates(self, user: Account, top: int = 3) -> dict:
+        """
+        Calculates the median, average, highest and lowest level durations.
 
-        stats['aggregates']['medians'] = self._db.query_one(
-            "SELECT MEDIAN(DATEDIFF('seconds', started_at, passed_at)) AS pass_duration, "
-            "MEDIAN(DATEDIFF('seconds', started_at, completed_at)) AS complete_duration "
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
+
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
+
+        """
+        dialect = self._db.dialect
+        stats = {}
+
+        stats['medians'] = self._db.query_one(
+            f"SELECT {dialect.median('pass_duration')} AS pass_duration, "
+            f"{dialect.median('complete_duration')} AS complete_duration "
             "FROM level_progression "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['averages'] = self._db.query_one(
-            "SELECT AVG(DATEDIFF('seconds', started_at, passed_at)) AS pass_duration, "
-            "AVG(DATEDIFF('seconds', started_at, completed_at)) AS complete_duration "
+        stats['averages'] = self._db.query_one(
+            "SELECT AVG(pass_duration) AS pass_duration, "
+            "AVG(complete_duration) AS complete_duration "
             "FROM level_progression "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['highest'] = {}
-        stats['aggregates']['lowest'] = {}
+        stats['highest'] = {}
+        stats['lowest'] = {}
 
-        # Grab the data in sorted order so we can get both top and bottom N values, where N is arbitrary.
-        pass_durations = self._db.query_all(
-            "WITH pass_aggregate AS ("
-            "SELECT level, DATEDIFF('seconds', started_at, passed_at) AS pass_duration "
+        # Read both ends of the (user_id, duration) indexes with a limit, so only the top and bottom N rows are fetched.
+        stats['highest']['pass_duration'], stats['lowest']['pass_duration'] = self._extremes(
+            "SELECT level, pass_duration "
             "FROM level_progression "
-            f"WHERE user_id = {user.id}) "
-            "SELECT * "
-            "FROM pass_aggregate "
-            "WHERE pass_duration IS NOT NULL "
-            "ORDER BY pass_duration DESC"
+            "WHERE user_id = %(user_id)s AND pass_duration IS NOT NULL "
+            "ORDER BY pass_duration {direction}, level {direction}",
+            user=user,
+            top=top
         )
 
-        stats['aggregates']['highest']['pass_duration'] = pass_durations[:3]
-        stats['aggregates']['lowest']['pass_duration'] = pass_durations[-3:]
-        stats['aggregates']['lowest']['pass_duration'].reverse()  # Reverse to get the lowest N in correct order.
-
-        complete_durations = self._db.query_all(
-            "WITH complete_aggregate AS ("
-            "SELECT level, DATEDIFF('seconds', started_at, completed_at) AS complete_duration "
+        stats['highest']['complete_duration'], stats['lowest']['complete_duration'] = self._extremes(
+            "SELECT level, complete_duration "
             "FROM level_progression "
-            f"WHERE user_id = {user.id}) "
-            "SELECT * "
-            "FROM complete_aggregate "
-            "WHERE complete_duration IS NOT NULL "
-            "ORDER BY complete_duration DESC"
+            "WHERE user_id = %(user_id)s AND complete_duration IS NOT NULL "
+            "ORDER BY complete_duration {direction}, level {direction}",
+            user=user,
+            top=top
         )
 
-        stats['aggregates']['highest']['complete_duration'] = complete_durations[:3]
-        stats['aggregates']['lowest']['complete_duration'] = complete_durations[-3:]
-        stats['aggregates']['lowest']['complete_duration'].reverse()
-
-        return stats  # Might need to convert this? lambda obj: str(obj) if isinstance(obj, datetime) else obj
+        return stats
 
-    def _analyze_assignments(self, user: Account) -> dict:
+    def _analyze_assignments(self, user: Account, top: int = 3) -> dict:
         """
         Performs some simple analytics on the user's assignment data, such as aggregates and totals.
 
@@ -463,6 +870,8 @@ class Analyzer:
         ----------
         user : Account
             The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
 
         Returns
         -------
@@ -470,100 +879,255 @@ class Analyzer:
             The result of the analysis in JSON format.
 
         """
-        stats = {}
+        return {
+            'totals': self._assignment_totals(user=user),
+            'aggregates': self._assignment_aggregates(user=user, top=top),
+            'assignments': self._assignment_durations(user=user)
+        }
+
+    def _assignment_totals(self, user: Account) -> dict:
+        """
+        Counts the user's assignments by completion status, SRS stage, level and type.
 
-        stats['totals'] = {
-            'total': user.assignments.count(),
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
+
+        """
+        counts = self._db.query_one(
+            "SELECT COUNT(*) AS total, "
+            "COUNT(*) FILTER (WHERE passed_at IS NULL) AS started, "
+            "COUNT(*) FILTER (WHERE passed_at IS NOT NULL) AS passed, "
+            "COUNT(*) FILTER (WHERE burned_at IS NOT NULL) AS completed "
+            "FROM assignment "
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
+        )
+
+        return {
+            'total': counts['total'],
             'completion': {
-                'started': user.assignments.filter(Assignment.passed_at.is_(None)).count(),
-                'passed': user.assignments.filter(Assignment.passed_at.isnot(None)).count(),
-                'completed': user.assignments.filter(Assignment.burned_at.isnot(None)).count()
+                'started': counts['started'],
+                'passed': counts['passed'],
+                'completed': counts['completed']
             },
             'stage': self._db.query_all(
-                "SELECT a.srs_stage, s.name, COUNT(*) "
+                "SELECT a.srs_stage, s.name, COUNT(*) AS count "
                 "FROM assignment a, stage s "
-                f"WHERE a.user_id = {user.id} AND a.srs_stage = s.id "
+                "WHERE a.user_id = %(user_id)s AND a.srs_stage = s.id "
                 "GROUP BY a.srs_stage, s.name "
-                "ORDER BY a.srs_stage ASC"
+                "ORDER BY a.srs_stage ASC",
+                {'user_id': user.id}
             ),
             'level': self._db.query_all(
-                "SELECT s.level, COUNT(*) "
+                "SELECT s.level, COUNT(*) AS count "
                 "FROM assignment a, subject s "
-                f"WHERE a.user_id = {user.id} AND a.subject_id = s.id "
+                "WHERE a.user_id = %(user_id)s AND a.subject_id = s.id "
                 "GROUP BY s.level "
-                "ORDER BY s.level ASC"
+                "ORDER BY s.level ASC",
+                {'user_id': user.id}
             ),
             'type': self._db.query_all(
-                "SELECT s.type, COUNT(*) "
+                "SELECT s.type, COUNT(*) AS count "
                 "FROM assignment a, subject s "
-                f"WHERE a.user_id = {user.id} AND a.subject_id = s.id "
-                "GROUP BY s.type"
+                "WHERE a.user_id = %(user_id)s AND a.subject_id = s.id "
+                "GROUP BY s.type",
+                {'user_id': user.id}
             )
         }
 
-        stats['aggregates'] = {}
+    def _assignment_aggregates(self, user: Account, top: int = 3) -> dict:
+        """
+        Calculates the median, average, highest and lowest assignment durations.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
+
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
+
+        """
+        dialect = self._db.dialect
+        stats = {}
 
-        stats['aggregates']['medians'] = self._db.query_one(
-            "SELECT MEDIAN(DATEDIFF('seconds', started_at, passed_at)) AS pass_duration, "
-            "MEDIAN(DATEDIFF('seconds', started_at, burned_at)) AS complete_duration "
+        stats['medians'] = self._db.query_one(
+            f"SELECT {dialect.median('pass_duration')} AS pass_duration, "
+            f"{dialect.median('complete_duration')} AS complete_duration "
             "FROM assignment "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['averages'] = self._db.query_one(
-            "SELECT AVG(DATEDIFF('seconds', started_at, passed_at)) AS pass_duration, "
-            "AVG(DATEDIFF('seconds', started_at, burned_at)) AS complete_duration "
+        stats['averages'] = self._db.query_one(
+            "SELECT AVG(pass_duration) AS pass_duration, "
+            "AVG(complete_duration) AS complete_duration "
             "FROM assignment "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['highest'] = {}
-        stats['aggregates']['lowest'] = {}
+        stats['highest'] = {}
+        stats['lowest'] = {}
 
-        # Grab the data in sorted order so we can get both top and bottom N values, where N is arbitrary.
-        pass_durations = self._db.query_all(
-            "WITH pass_aggregate AS ("
-            "SELECT s.type, s.characters, s.image_url, "
-            "DATEDIFF('seconds', a.started_at, a.passed_at) AS pass_duration "
+        # Read both ends of the (user_id, duration) indexes with a limit, so only the top and bottom N rows are fetched.
+        stats['highest']['pass_duration'], stats['lowest']['pass_duration'] = self._extremes(
+            "SELECT s.type, s.characters, s.image_url, a.pass_duration "
             "FROM assignment a, subject s "
-            f"WHERE a.user_id = {user.id} AND a.subject_id = s.id) "
-            "SELECT * "
-            "FROM pass_aggregate "
-            "WHERE pass_duration IS NOT NULL "
-            "ORDER BY pass_duration DESC"
+            "WHERE a.user_id = %(user_id)s AND a.pass_duration IS NOT NULL AND a.subject_id = s.id "
+            "ORDER BY a.pass_duration {direction}, s.type {direction}, s.characters {direction}",
+            user=user,
+            top=top
         )
 
-        stats['aggregates']['highest']['pass_duration'] = pass_durations[:3]
-        stats['aggregates']['lowest']['pass_duration'] = pass_durations[-3:]
-        stats['aggregates']['lowest']['pass_duration'].reverse()  # Reverse to get the lowest N in correct order.
-
-        complete_durations = self._db.query_all(
-            "WITH complete_aggregate AS ("
-            "SELECT s.type, s.characters, s.image_url, "
-            "DATEDIFF('seconds', started_at, burned_at) AS complete_duration "
+        stats['highest']['complete_duration'], stats['lowest']['complete_duration'] = self._extremes(
+            "SELECT s.type, s.characters, s.image_url, a.complete_duration "
             "FROM assignment a, subject s "
-            f"WHERE user_id = {user.id} AND a.subject_id = s.id) "
-            "SELECT * "
-            "FROM complete_aggregate "
-            "WHERE complete_duration IS NOT NULL "
-            "ORDER BY complete_duration DESC"
+            "WHERE a.user_id = %(user_id)s AND a.complete_duration IS NOT NULL AND a.subject_id = s.id "
+            "ORDER BY a.complete_duration {direction}, s.type {direction}, s.characters {direction}",
+            user=user,
+            top=top
         )
 
-        stats['aggregates']['highest']['complete_duration'] = complete_durations[:3]
-        stats['aggregates']['lowest']['complete_duration'] = complete_durations[-3:]
-        stats['aggregates']['lowest']['complete_duration'].reverse()
+        return stats
+
+    def _assignment_durations(self, user: Account) -> list:
+        """
+        Gets the pass and completion durations of each of the user's assignments.
 
-        stats['assignments'] = self._db.query_all(
-            "SELECT s.type, s.characters, s.image_url, "
-            "DATEDIFF('seconds', a.started_at, a.passed_at) AS pass_duration,"
-            "DATEDIFF('seconds', started_at, burned_at) AS complete_duration "
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        list
+            The result of the analysis in JSON format.
+
+        """
+        return list(self.iter_assignment_durations(user=user))
+
+    def iter_assignment_durations(self, user: Account):
+        """
+        Streams the pass and completion durations of each of the user's assignments from a server-side cursor.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        Iterator[dict]
+            The durations of each assignment in JSON format.
+
+        """
+        rows = self._db.query_iter(
+            "SELECT s.type, s.characters, s.image_url, a.pass_duration, a.complete_duration "
             "FROM assignment a, subject s "
-            f"WHERE a.user_id = {user.id} AND a.subject_id = s.id"
+            "WHERE a.user_id = %(user_id)s AND a.subject_id = s.id",
+            {'user_id': user.id},
+            named=True
         )
 
-        return stats
+        for row in rows:
+            yield row._asdict()
+
+    def forecast(self, user: Account, unit: str = 'hour', bins: int = 24, now: datetime = None) -> list:
+        """
+        Counts the user's upcoming reviews per hour or day, starting with the current one.
+        Reviews that are already available are counted in the first bin. The whole forecast is one grouped query over
+        the (user_id, available_at) index, with empty bins filled in and the running total computed by Postgres.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        unit : str
+            One of the keys of FORECAST_BINS.
+        bins : int
+            The number of bins to forecast.
+        now : datetime
+            The current UTC time - defaults to now.
+
+        Returns
+        -------
+        list
+            The start of each bin with its number of reviews and the cumulative number of reviews, in JSON format.
+
+        """
+        with timed(PHASE_SECONDS, 'analyze', phase='analyze.forecast'):
+            return self._db.query_all(
+                "WITH upcoming AS ("
+                "SELECT date_trunc(%(unit)s, GREATEST(available_at, %(now)s)) AS bin, COUNT(*) AS reviews "
+                "FROM assignment "
+                "WHERE user_id = %(user_id)s "
+                "AND available_at < date_trunc(%(unit)s, %(now)s) + %(bins)s * %(step)s::INTERVAL "
+                "GROUP BY 1) "
+                "SELECT bins.bin AS starts_at, COALESCE(u.reviews, 0)::INT AS reviews, "
+                "SUM(COALESCE(u.reviews, 0)) OVER (ORDER BY bins.bin)::INT AS cumulative "
+                "FROM generate_series(date_trunc(%(unit)s, %(now)s), "
+                "date_trunc(%(unit)s, %(now)s) + (%(bins)s - 1) * %(step)s::INTERVAL, %(step)s::INTERVAL) bins(bin) "
+                "LEFT JOIN upcoming u ON u.bin = bins.bin "
+                "ORDER BY bins.bin",
+                {
+                    'user_id': user.id,
+                    'unit': unit,
+                    'step': Analyzer.FORECAST_BINS[unit],
+                    'bins': bins,
+                    'now': now or datetime.utcnow()
+                }
+            )
+
+    def leeches(self, user: Account, answer: str = 'meaning', subject_type: str = None, top: int = 10) -> list:
+        """
+        Gets the subjects the user has answered incorrectly the most, from the subject_accuracy rollup.
+        Each lookup walks the rollup's (user_id, incorrect answers) index from the top, so any N comes back quickly.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        answer : str
+            One of the keys of LEECH_ANSWERS.
+        subject_type : str
+            Only include subjects of this type, e.g. kanji - defaults to every type.
+        top : int
+            The number of subjects to include.
+
+        Returns
+        -------
+        list
+            The subjects with their review count, incorrect answers and last stage change, in JSON format.
+
+        """
+        column = Analyzer.LEECH_ANSWERS[answer]
+
+        with timed(PHASE_SECONDS, 'analyze', phase='analyze.leeches'):
+            return self._db.query_all(
+                "SELECT s.id AS subject_id, s.type, s.characters, s.image_url, sa.reviews, "
+                "sa.incorrect_meaning_answers, sa.incorrect_reading_answers, sa.last_stage_change "
+                "FROM subject_accuracy sa, subject s "
+                "WHERE sa.user_id = %(user_id)s AND sa.subject_id = s.id "
+                "AND (%(type)s::TEXT IS NULL OR s.type = %(type)s) "
+                f"ORDER BY sa.{column} DESC, sa.subject_id "
+                "LIMIT %(top)s",
+                {'user_id': user.id, 'type': subject_type, 'top': top}
+            )
 
-    def _analyze_reviews(self, user: Account) -> dict:
+    def _analyze_reviews(self, user: Account, top: int = 3) -> dict:
         """
         Performs some simple analytics on the user's review data, such as aggregates and totals.
 
@@ -571,6 +1135,8 @@ class Analyzer:
         ----------
         user : Account
             The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
 
         Returns
         -------
@@ -578,87 +1144,122 @@ class Analyzer:
             The result of the analysis in JSON format.
 
         """
-        stats = {}
+        return {
+            'totals': self._review_totals(user=user),
+            'aggregates': self._review_aggregates(user=user, top=top)
+        }
+
+    def _review_totals(self, user: Account) -> dict:
+        """
+        Counts the user's reviews by SRS stage, level and type, and calculates their accuracy.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
 
-        stats['totals'] = {
-            'total': user.reviews.count(),
+        """
+        return {
+            'total': self._db.query_one(
+                "SELECT COUNT(*) AS total FROM review WHERE user_id = %(user_id)s",
+                {'user_id': user.id}
+            )['total'],
             'stage': self._db.query_all(  # The number of reviews required per stage - should be graphed.
-                "SELECT r.starting_srs_stage, s.name, COUNT(*) "
+                "SELECT r.starting_srs_stage, s.name, COUNT(*) AS count "
                 "FROM review r, assignment a, stage s "
-                f"WHERE a.user_id = {user.id} AND r.user_id = {user.id} AND r.assignment_id = a.id AND r.starting_srs_stage = s.id "
+                "WHERE a.user_id = %(user_id)s AND r.user_id = %(user_id)s AND r.assignment_id = a.id AND r.starting_srs_stage = s.id "
                 "GROUP BY r.starting_srs_stage, s.name "
-                "ORDER BY r.starting_srs_stage ASC"
+                "ORDER BY r.starting_srs_stage ASC",
+                {'user_id': user.id}
             ),
             'level': self._db.query_all(
-                "SELECT s.level, COUNT(*) "
+                "SELECT s.level, COUNT(*) AS count "
                 "FROM review r, assignment a, subject s "
-                f"WHERE a.user_id = {user.id} AND r.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id "
+                "WHERE a.user_id = %(user_id)s AND r.user_id = %(user_id)s AND r.assignment_id = a.id AND a.subject_id = s.id "
                 "GROUP BY s.level "
-                "ORDER BY s.level ASC"
+                "ORDER BY s.level ASC",
+                {'user_id': user.id}
             ),
             'type': self._db.query_all(
-                "SELECT s.type, COUNT(*) "
+                "SELECT s.type, COUNT(*) AS count "
                 "FROM review r, assignment a, subject s "
-                f"WHERE a.user_id = {user.id} AND r.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id "
-                "GROUP BY s.type"
+                "WHERE a.user_id = %(user_id)s AND r.user_id = %(user_id)s AND r.assignment_id = a.id AND a.subject_id = s.id "
+                "GROUP BY s.type",
+                {'user_id': user.id}
             ),
             'accuracy': {
                 'reading': self._db.query_all(
                     "SELECT s.type, "
                     "ROUND((1 - (SUM(r.incorrect_reading_answers) * 1.0 / (COUNT(*) + SUM(r.incorrect_reading_answers)))) * 100) AS accuracy "
                     "FROM review r, assignment a, subject s "
-                    f"WHERE a.user_id = {user.id} AND r.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id AND s.type not like 'radical' "
-                    "GROUP BY s.type"
+                    "WHERE a.user_id = %(user_id)s AND r.user_id = %(user_id)s AND r.assignment_id = a.id AND a.subject_id = s.id AND s.type not like 'radical' "
+                    "GROUP BY s.type",
+                    {'user_id': user.id}
                 ),
                 'meaning': self._db.query_all(
                     "SELECT s.type, "
                     "ROUND((1 - (SUM(r.incorrect_meaning_answers) * 1.0 / (COUNT(*) + SUM(r.incorrect_meaning_answers)))) * 100) AS accuracy "
                     "FROM review r, assignment a, subject s "
-                    f"WHERE a.user_id = {user.id} AND r.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id "
-                    "GROUP BY s.type"
+                    "WHERE a.user_id = %(user_id)s AND r.user_id = %(user_id)s AND r.assignment_id = a.id AND a.subject_id = s.id "
+                    "GROUP BY s.type",
+                    {'user_id': user.id}
                 )
             }
         }
 
-        stats['aggregates'] = {}
+    def _review_aggregates(self, user: Account, top: int = 3) -> dict:
+        """
+        Calculates the median and average review mistakes and the subjects with the most mistakes.
+
+        Parameters
+        ----------
+        user : Account
+            The user's Account ORM object.
+        top : int
+            The number of highest and lowest values to include.
 
-        stats['aggregates']['medians'] = self._db.query_one(
-            "SELECT MEDIAN(incorrect_meaning_answers) AS incorrect_meanings, "
-            "MEDIAN(incorrect_reading_answers) AS incorrect_readings,"
-            "MEDIAN(ending_srs_stage - starting_srs_stage) AS srs_stage_change "
+        Returns
+        -------
+        dict
+            The result of the analysis in JSON format.
+
+        """
+        dialect = self._db.dialect
+        stats = {}
+
+        stats['medians'] = self._db.query_one(
+            f"SELECT {dialect.median('incorrect_meaning_answers')} AS incorrect_meanings, "
+            f"{dialect.median('incorrect_reading_answers')} AS incorrect_readings, "
+            f"{dialect.median('ending_srs_stage - starting_srs_stage')} AS srs_stage_change "
             "FROM review "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['averages'] = self._db.query_one(
+        stats['averages'] = self._db.query_one(
             "SELECT AVG(incorrect_meaning_answers) AS incorrect_meanings, "
             "AVG(incorrect_reading_answers) AS incorrect_readings,"
             "AVG(ending_srs_stage - starting_srs_stage) AS srs_stage_change "
             "FROM review "
-            f"WHERE user_id = {user.id}"
+            "WHERE user_id = %(user_id)s",
+            {'user_id': user.id}
         )
 
-        stats['aggregates']['highest'] = {}
+        stats['highest'] = {}
 
         # We only care about highest number of incorrect answers since the lowest is obviously 0.
-        # This shows the subjects with the most incorrect answers overall.
-        stats['aggregates']['highest']['incorrect_meaning_answers'] = self._db.query_all(
-            "SELECT s.type, s.characters, s.image_url, SUM(r.incorrect_meaning_answers) AS incorrect_meaning_answers "
-            "FROM review r, assignment a, subject s "
-            f"WHERE r.user_id = {user.id} AND a.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id "
-            "GROUP BY s.id "
-            "ORDER BY incorrect_meaning_answers DESC "
-            "LIMIT 3"
-        )
-
-        stats['aggregates']['highest']['incorrect_reading_answers'] = self._db.query_all(
-            "SELECT s.type, s.characters, s.image_url, SUM(r.incorrect_reading_answers) AS incorrect_reading_answers "
-            "FROM review r, assignment a, subject s "
-            f"WHERE r.user_id = {user.id} AND a.user_id = {user.id} AND r.assignment_id = a.id AND a.subject_id = s.id "
-            "GROUP BY s.id "
-            "ORDER BY incorrect_reading_answers DESC "
-            "LIMIT 3"
-        )
+        # This shows the subjects with the most incorrect answers overall, read off the subject_accuracy rollup.
+        for answer, column in Analyzer.LEECH_ANSWERS.items():
+            stats['highest'][column] = [
+                {'type': row['type'], 'characters': row['characters'], 'image_url': row['image_url'],
+                 column: row[column]}
+                for row in self.leeches(user=user, answer=answer, top=top)
+            ]
 
         return stats
 
@@ -681,32 +1282,6 @@ def pretty_print(data):
 
 
 if __name__ == '__main__':
-    import os
-
-    api_key = None
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    secret_file = os.path.join(basedir, 'secret.json')
-
-    try:
-        with open(secret_file, 'r') as file:
-            try:
-                api_key = json.load(file)['api_key']
-                logging.debug('API key loaded.\n')
-            except Exception as e:
-                logging.critical(f'ERROR: {str(e)}')
-                raise SystemExit(f'An error occurred while loading the JSON: {e}')
-    except IOError as e:
-        logging.critical(f'ERROR: {str(e)}')
-        raise SystemExit('Unable to load the API key.')
-
-    from wanikani import WaniKaniClient, DATE_FORMAT
-    from psql import PostgresClient
-
-    client = WaniKaniClient(api_key)
-    db = PostgresClient(dbname='postgres', user='postgres', password='postgres')
-    analyzer = Analyzer(wanikani=client, db=db)
-
-    try:
-        analyzer.analyze_user_info()
-    finally:
-        db.close()
+    from app.batch import main
+
+    raise SystemExit(main())
@@ -0,0 +1,452 @@
+"""
+Archives the raw WaniKani API pages of every sync and replays them into the database without the network.
+
+Each sync writes one append-only segment per user and endpoint: a zstd-compressed NDJSON file with a page per line,
+or gzip-compressed when zstandard isn't installed. Segments are written under a temporary name and only renamed into
+place once the endpoint was read to the end, so a failed sync never leaves a partial snapshot behind.
+
+WaniKani returns every resource on each sync, so a user's latest segment of an endpoint is a full snapshot of it.
+Replaying rebuilds the tables from the latest segments with the current processing, e.g. after a schema change or a
+fix in one of the _process_* methods, with one process per account.
+
+Usage: flask replay [--archive DIR] [--username NAME ...] [--processes N]
+"""
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+from flask import current_app
+
+# zstandard is an optional dependency; segments fall back to gzip without it.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_SUFFIX = '.ndjson.zst'
+GZIP_SUFFIX = '.ndjson.gz'
+
+# Faster than the default level, at almost the same ratio for JSON.
+ZSTD_LEVEL = 3
+
+# The directory of the endpoints shared by every user, i.e. subjects and SRS stages.
+SHARED = '_shared'
+
+# Set in each pool process by _initialize_process.
+_app = None
+_archive = None
+
+
+class PayloadArchive:
+    """
+    A directory of compressed NDJSON segments of API pages, by user and endpoint.
+
+    Parameters
+    ----------
+    root : str
+        The archive's directory.
+    keep : int
+        The number of segments kept per user and endpoint - older ones are deleted when a new one is written.
+    """
+    def __init__(self, root: str, keep: int = None):
+        self.root = root
+        self._keep = keep
+
+    def usernames(self) -> list:
+        """
+        Gets the users with archived payloads.
+
+        Returns
+        -------
+        list
+            The usernames, sorted.
+
+        """
+        if not os.path.isdir(self.root):
+            return []
+
+        return sorted(name for name in os.listdir(self.root)
+                      if name != SHARED and os.path.isdir(os.path.join(self.root, name)))
+
+    def segments(self, username: str, endpoint: str) -> list:
+        """
+        Gets the complete segments of an endpoint, oldest first.
+
+        Parameters
+        ----------
+        username : str
+            The user, or None for the shared endpoints.
+        endpoint : str
+            The endpoint, e.g. reviews.
+
+        Returns
+        -------
+        list
+            The segments' paths.
+
+        """
+        directory = self._directory(username, endpoint)
+
+        if not os.path.isdir(directory):
+            return []
+
+        # Segment names start with their UTC timestamp, so they sort chronologically.
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.endswith((ZSTD_SUFFIX, GZIP_SUFFIX))]
+
+    def pages(self, username: str, endpoint: str):
+        """
+        Reads the pages of the latest segment of an endpoint.
+
+        Parameters
+        ----------
+        username : str
+            The user, or None for the shared endpoints.
+        endpoint : str
+            The endpoint, e.g. reviews.
+
+        Returns
+        -------
+        Iterator[dict]
+            The archived pages, in the order they were received.
+
+        """
+        segments = self.segments(username, endpoint)
+
+        if not segments:
+            raise FileNotFoundError(f'There are no archived {endpoint} pages for {username or "all users"} '
+                                    f'in {self.root}.')
+
+        with _open(segments[-1], 'r') as file:
+            for line in file:
+                yield json.loads(line)
+
+    def write(self, username: str, endpoint: str, pages):
+        """
+        Archives pages as a new segment while passing them through, e.g. to the ingest.
+        The segment is only kept if the pages are read to the end.
+
+        Parameters
+        ----------
+        username : str
+            The user, or None for the shared endpoints.
+        endpoint : str
+            The endpoint, e.g. reviews.
+        pages : Iterable[dict]
+            The pages received from the API.
+
+        Returns
+        -------
+        Iterator[dict]
+            The same pages.
+
+        """
+        directory = self._directory(username, endpoint)
+        os.makedirs(directory, exist_ok=True)
+
+        suffix = ZSTD_SUFFIX if zstandard is not None else GZIP_SUFFIX
+        path = os.path.join(directory, f'{datetime.utcnow():%Y%m%dT%H%M%S%fZ}-{os.getpid()}{suffix}')
+        partial = f'{path}.partial'
+        complete = False
+
+        try:
+            with _open(partial, 'w') as file:
+                for page in pages:
+                    file.write(json.dumps(page, separators=(',', ':')))
+                    file.write('\n')
+                    yield page
+
+            complete = True
+        finally:
+            if complete:
+                os.rename(partial, path)
+                self._prune(username, endpoint)
+            elif os.path.exists(partial):
+                os.remove(partial)
+
+    def save(self, username: str, endpoint: str, page: dict):
+        """
+        Archives a single page as a new segment, e.g. for the endpoints that aren't paginated.
+
+        Parameters
+        ----------
+        username : str
+            The user, or None for the shared endpoints.
+        endpoint : str
+            The endpoint, e.g. user.
+        page : dict
+            The JSON received from the API.
+
+        Returns
+        -------
+        None
+
+        """
+        for _ in self.write(username, endpoint, [page]):
+            pass
+
+    def _prune(self, username: str, endpoint: str):
+        if not self._keep:
+            return
+
+        for path in self.segments(username, endpoint)[:-self._keep]:
+            os.remove(path)
+
+    def _directory(self, username: str, endpoint: str) -> str:
+        # WaniKani usernames are word characters and hyphens, but never trust them as path components.
+        user = SHARED if username is None else re.sub(r'[^\w-]', '_', username)
+
+        return os.path.join(self.root, user, endpoint)
+
+
+class ArchivingClient:
+    """
+    Wraps a WaniKani client and archives every page it receives.
+
+    Parameters
+    ----------
+    wanikani : WaniKaniClient
+        The client to delegate to.
+    archive : PayloadArchive
+        The archive to write to.
+    username : str
+        The user the client's API key belongs to, if known before get_user is called.
+    """
+    def __init__(self, wanikani, archive: PayloadArchive, username: str = None):
+        self._client = wanikani
+        self._archive = archive
+        self._username = username
+
+    def __getattr__(self, name):
+        # E.g. the number of requests sent.
+        return getattr(self._client, name)
+
+    def get_user(self) -> dict:
+        user = self._client.get_user()
+        self._username = user['username']
+        self._archive.save(self._username, 'user', user)
+
+        return user
+
+    def get_level_progressions(self):
+        return self._archive.write(self._user(), 'level_progressions', self._client.get_level_progressions())
+
+    def get_assignments(self):
+        return self._archive.write(self._user(), 'assignments', self._client.get_assignments())
+
+    def get_reviews(self):
+        return self._archive.write(self._user(), 'reviews', self._client.get_reviews())
+
+    def get_subjects(self):
+        return self._archive.write(None, 'subjects', self._client.get_subjects())
+
+    def get_srs_stages(self) -> dict:
+        stages = self._client.get_srs_stages()
+        self._archive.save(None, 'srs_stages', stages)
+
+        return stages
+
+    def _user(self) -> str:
+        if self._username is None:
+            self.get_user()
+
+        return self._username
+
+
+class ArchivedClient:
+    """
+    A WaniKani client that serves a user's latest archived pages instead of calling the API.
+
+    Parameters
+    ----------
+    archive : PayloadArchive
+        The archive to read from.
+    username : str
+        The user to replay - only the shared endpoints are available without one.
+    """
+    def __init__(self, archive: PayloadArchive, username: str = None):
+        self._archive = archive
+        self._username = username
+
+    def get_user(self) -> dict:
+        return next(self._archive.pages(self._username, 'user'))
+
+    def get_level_progressions(self):
+        return self._archive.pages(self._username, 'level_progressions')
+
+    def get_assignments(self):
+        return self._archive.pages(self._username, 'assignments')
+
+    def get_reviews(self):
+        return self._archive.pages(self._username, 'reviews')
+
+    def get_subjects(self):
+        return self._archive.pages(None, 'subjects')
+
+    def get_srs_stages(self) -> dict:
+        return next(self._archive.pages(None, 'srs_stages'))
+
+
+def archived(wanikani, username: str = None):
+    """
+    Wraps the client so its pages are archived, if PAYLOAD_ARCHIVE is configured.
+
+    Parameters
+    ----------
+    wanikani : WaniKaniClient
+        The client to wrap.
+    username : str
+        The user the client's API key belongs to, if already known.
+
+    Returns
+    -------
+    Union[ArchivingClient, WaniKaniClient]
+        The client to sync with.
+
+    """
+    root = current_app.config['PAYLOAD_ARCHIVE']
+
+    if not root:
+        return wanikani
+
+    return ArchivingClient(wanikani, PayloadArchive(root, keep=current_app.config['PAYLOAD_ARCHIVE_KEEP']),
+                           username=username)
+
+
+def replay_account(username: str) -> dict:
+    """
+    Re-ingests one account from its latest archived pages in a pool process.
+
+    Parameters
+    ----------
+    username : str
+        The user to replay.
+
+    Returns
+    -------
+    dict
+        The username, the rows written per endpoint, the timing and the error, if it failed.
+
+    """
+    from app import database
+    from app.analyzer import Analyzer
+    from app.psql import PostgresClient
+
+    result = {'username': username, 'ingest': None, 'error': None}
+    start = time.perf_counter()
+
+    with _app.app_context():
+        try:
+            with PostgresClient.from_pool(database.engine) as db:
+                analyzer = Analyzer(wanikani=ArchivedClient(_archive, username), db=db, rewrite=True)
+                analyzer.sync_user_info()
+                result['ingest'] = analyzer.ingest_stats
+        except Exception as e:
+            _app.logger.exception(f'Replaying {username} failed.')
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            database.session.remove()
+
+    result['seconds'] = time.perf_counter() - start
+
+    return result
+
+
+def replay(archive: PayloadArchive, usernames: list = None, processes: int = None, write=None) -> list:
+    """
+    Re-ingests accounts from the archive with a pool of processes.
+    The shared subjects and SRS stages are loaded first, if the database doesn't have them yet.
+
+    Parameters
+    ----------
+    archive : PayloadArchive
+        The archive to replay.
+    usernames : list
+        The users to replay - defaults to every archived user.
+    processes : int
+        The number of pool processes - defaults to the CPU count.
+    write : Callable
+        Called in this process with each account's result as soon as it finishes.
+
+    Returns
+    -------
+    list
+        The results, in the order they finished.
+
+    """
+    from app import database
+    from app.analyzer import Analyzer
+    from app.psql import PostgresClient
+
+    usernames = usernames or archive.usernames()
+
+    with PostgresClient.from_pool(database.engine) as db:
+        Analyzer(wanikani=ArchivedClient(archive), db=db)._initialize_static_info()
+
+    # Let the forked processes open their own connections.
+    database.session.remove()
+    database.engine.dispose()
+
+    context = multiprocessing.get_context()
+    processes = min(processes or os.cpu_count(), len(usernames)) or 1
+    results = []
+
+    with context.Pool(processes=processes, initializer=_initialize_process, initargs=(archive,)) as pool:
+        for result in pool.imap_unordered(replay_account, usernames):
+            if write:
+                write(result)
+
+            results.append(result)
+
+    return results
+
+
+def _initialize_process(archive: PayloadArchive):
+    global _app, _archive
+
+    from app import create_app
+
+    # The ingest prints every row.
+    sys.stdout = open(os.devnull, 'w')
+
+    _app = create_app()
+    _archive = archive
+
+
+def _open(path: str, mode: str):
+    """
+    Opens a segment as text, compressing or decompressing it by its suffix.
+
+    Parameters
+    ----------
+    path : str
+        The segment's path, possibly with a .partial suffix.
+    mode : str
+        Either r or w.
+
+    Returns
+    -------
+    TextIO
+        The segment's lines.
+
+    """
+    if ZSTD_SUFFIX not in path:
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+
+    if zstandard is None:
+        raise RuntimeError(f'Reading {path} requires zstandard - install it with `pip install zstandard`.')
+
+    raw = open(path, f'{mode}b')
+
+    if mode == 'w':
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+    else:
+        stream = zstandard.ZstdDecompressor().stream_reader(raw)
+
+    return io.TextIOWrapper(stream, encoding='utf-8')
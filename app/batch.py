@@ -0,0 +1,294 @@
+"""
+Syncs and analyzes many accounts in parallel, e.g. for a nightly refresh of a whole class.
+
+Each API key is handled by a process from a pool, with its own app and connection pool. WaniKani rate limits each
+API key separately, and each key's requests all come from the one process handling it, so every account is paced by
+its own RateLimiter and the batch's throughput grows with the width of the pool.
+
+Usage: python -m app.analyzer [--keys keys.txt] [--processes N] [--requests-per-minute 60]
+       [--format ndjson|json] [--output stats.ndjson|stats/]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from app.serialization import dumps
+
+# WaniKani allows 60 requests per minute for each API key.
+REQUESTS_PER_MINUTE = 60
+
+# The key file read when no --keys file is given, as the single-account entry point always has.
+SECRET_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'secret.json')
+
+# Set in each pool process by _initialize_process.
+_app = None
+_requests_per_minute = None
+
+
+class RateLimiter:
+    """
+    Spaces out calls evenly under a rate limit, which is shared by every process it's passed to.
+
+    Parameters
+    ----------
+    per_minute : int
+        The maximum number of calls per minute across all processes using the limiter.
+    context : multiprocessing.context.BaseContext
+        The multiprocessing context the pool is created from.
+    """
+    def __init__(self, per_minute: int, context=multiprocessing):
+        self._interval = 60 / per_minute
+        self._next = context.Value('d', 0.0, lock=False)
+        self._lock = context.Lock()
+
+    def acquire(self):
+        """
+        Blocks until the next call is allowed.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next.value)
+            self._next.value = slot + self._interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_api_keys(path: str = None) -> list:
+    """
+    Reads the API keys to process.
+
+    Parameters
+    ----------
+    path : str
+        A file with one API key per line, where blank lines and lines starting with # are skipped.
+        Defaults to the api_key in secret.json.
+
+    Returns
+    -------
+    list
+        The API keys.
+
+    """
+    if path is None:
+        try:
+            with open(SECRET_FILE, 'r') as file:
+                return [json.load(file)['api_key']]
+        except (IOError, ValueError, KeyError) as e:
+            raise SystemExit(f'Unable to load the API key from {SECRET_FILE}: {e}')
+
+    with open(path, 'r') as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+
+
+def process_account(api_key: str) -> dict:
+    """
+    Syncs and analyzes one account in a pool process.
+
+    Parameters
+    ----------
+    api_key : str
+        The user's WaniKani API key.
+
+    Returns
+    -------
+    dict
+        The account's masked key, username, stats, timing and error, if it failed.
+
+    """
+    from app import database
+    from app.analyzer import Analyzer
+    from app.archive import archived
+    from app.models import Account
+    from app.psql import PostgresClient
+    from app.wanikani import WaniKaniClient
+
+    result = {'key': _mask(api_key), 'username': None, 'stats': None, 'error': None}
+    start = time.perf_counter()
+
+    with _app.app_context():
+        try:
+            with PostgresClient.from_pool(database.engine) as db:
+                limiter = RateLimiter(per_minute=_requests_per_minute)
+                analyzer = Analyzer(wanikani=archived(WaniKaniClient(api_key, limiter=limiter)), db=db)
+                summary = analyzer.sync_user_info()
+                result['username'] = summary['username']
+                synced = time.perf_counter()
+
+                user = Account.query.get(summary['id'])
+                stats = {'user': summary}
+
+                for section in Analyzer.SECTIONS:
+                    stats[section] = analyzer.analyze(user=user, section=section)
+
+            # Serialize in the pool process, so the Decimals and datetimes never need pickling.
+            result['stats'] = dumps(stats)
+            result['sync_seconds'] = synced - start
+            result['analyze_seconds'] = time.perf_counter() - synced
+        except Exception as e:
+            _app.logger.exception(f'Batch analysis of {result["key"]} failed.')
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            database.session.remove()
+
+    result['seconds'] = time.perf_counter() - start
+
+    return result
+
+
+def run_batch(api_keys: list, processes: int, requests_per_minute: int = REQUESTS_PER_MINUTE, write=None) -> list:
+    """
+    Syncs and analyzes the accounts with a pool of processes.
+
+    Parameters
+    ----------
+    api_keys : list
+        The users' WaniKani API keys, without repeats.
+    processes : int
+        The number of pool processes.
+    requests_per_minute : int
+        The WaniKani rate limit of each API key.
+    write : Callable
+        Called in this process with each account's result as soon as it finishes.
+
+    Returns
+    -------
+    list
+        The results, in the order they finished.
+
+    """
+    context = multiprocessing.get_context()
+    results = []
+
+    with context.Pool(processes=processes, initializer=_initialize_process, initargs=(requests_per_minute,)) as pool:
+        for result in pool.imap_unordered(process_account, api_keys):
+            if write:
+                write(result)
+
+            results.append(result)
+
+    return results
+
+
+def summarize(results: list, seconds: float, file=sys.stderr):
+    """
+    Prints the per-account timings and failures.
+
+    Parameters
+    ----------
+    results : list
+        The results of run_batch.
+    seconds : float
+        The wall time of the whole batch.
+    file : TextIO
+        Where to print the summary.
+
+    Returns
+    -------
+    None
+
+    """
+    failures = [result for result in results if result['error']]
+
+    for result in sorted(results, key=lambda result: result['seconds'], reverse=True):
+        status = f"FAILED: {result['error']}" if result['error'] else \
+            f"sync {result['sync_seconds']:.1f}s, analyze {result['analyze_seconds']:.1f}s"
+        print(f"{result['key']:>12} | {result['username'] or '-':<24} | {result['seconds']:>8.1f}s | {status}", file=file)
+
+    busy = sum(result['seconds'] for result in results)
+    print(f'\n{len(results) - len(failures)} of {len(results)} accounts succeeded in {seconds:.1f}s '
+          f'({busy / seconds if seconds else 0:.1f} accounts in flight on average)', file=file)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', help='file with one API key per line - defaults to the key in secret.json')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='pool width - defaults to the CPU count')
+    parser.add_argument('--requests-per-minute', type=int, default=REQUESTS_PER_MINUTE,
+                        help='WaniKani requests per minute for each API key')
+    parser.add_argument('--format', choices=('ndjson', 'json'), default='ndjson',
+                        help='one line per account, or one JSON file per account in the --output directory')
+    parser.add_argument('--output', help='the NDJSON file (defaults to stdout) or the JSON directory')
+    args = parser.parse_args(argv)
+
+    # Each key is paced by the process handling it, so a repeated key would be synced over its rate limit.
+    api_keys = list(dict.fromkeys(read_api_keys(args.keys)))
+
+    if args.format == 'json' and not args.output:
+        parser.error('--format json needs an --output directory')
+
+    with _writer(args.format, args.output) as write:
+        start = time.perf_counter()
+        results = run_batch(api_keys, processes=min(args.processes, len(api_keys)) or 1,
+                            requests_per_minute=args.requests_per_minute, write=write)
+        summarize(results, seconds=time.perf_counter() - start)
+
+    return 1 if any(result['error'] for result in results) else 0
+
+
+@contextlib.contextmanager
+def _writer(output_format: str, output: str):
+    """
+    Creates the function that writes each successful account's stats.
+
+    Parameters
+    ----------
+    output_format : str
+        Either ndjson or json.
+    output : str
+        The NDJSON file or the JSON directory.
+
+    Returns
+    -------
+    Callable
+        Writes a result from run_batch.
+
+    """
+    if output_format == 'json':
+        os.makedirs(output, exist_ok=True)
+
+        def write(result):
+            if result['stats'] is not None:
+                with open(os.path.join(output, f"{result['username']}.json"), 'w') as file:
+                    file.write(result['stats'])
+
+        yield write
+        return
+
+    file = open(output, 'w') if output else sys.stdout
+
+    def write(result):
+        if result['stats'] is not None:
+            file.write(f'{result["stats"]}\n')
+            file.flush()
+
+    try:
+        yield write
+    finally:
+        if output:
+            file.close()
+
+
+def _initialize_process(requests_per_minute: int):
+    global _app, _requests_per_minute
+
+    from app import create_app
+
+    # The ingest prints every row, which would interleave with NDJSON written to stdout.
+    sys.stdout = open(os.devnull, 'w')
+
+    _app = create_app()
+    _requests_per_minute = requests_per_minute
+
+
+def _mask(api_key: str) -> str:
+    return f'...{api_key[-6:]}'
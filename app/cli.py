@@ -0,0 +1,168 @@
+import click
+from flask import Flask
+
+from app.partitioning import partition_tables
+
+
+def register_commands(app: Flask):
+    """
+    Adds the app's commands to the flask command.
+
+    Parameters
+    ----------
+    app : Flask
+        The application.
+
+    Returns
+    -------
+    None
+
+    """
+    app.cli.add_command(partition_tables_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(prewarm_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(analyze_command)
+    app.cli.add_command(replay_command)
+
+
+@click.command('partition-tables')
+@click.option('--partitions', default=16, show_default=True, help='The number of hash partitions per table.')
+def partition_tables_command(partitions: int):
+    """Hash partitions the assignment and review tables by user."""
+    partition_tables(partitions=partitions)
+
+
+@click.command('worker')
+@click.option('--threads', default=2, show_default=True, help='The number of worker threads.')
+def worker_command(threads: int):
+    """Runs sync workers that process the job queue."""
+    from app.jobs import workers
+
+    workers.start(threads=threads)
+    workers.join()
+
+
+@click.command('prewarm')
+@click.option('--once', is_flag=True, help='Refresh the stale accounts once and exit instead of running continuously.')
+def prewarm_command(once: bool):
+    """Refreshes recently active accounts in the background while the queue is quiet."""
+    from flask import current_app
+
+    from app.prewarm import prewarmer
+
+    if not current_app.config['PREWARM']:
+        raise click.ClickException('Set PREWARM=1 so the web and worker processes keep the API keys to refresh with.')
+
+    if once:
+        click.echo(f'Refreshed {prewarmer.run_once()} accounts.')
+        return
+
+    prewarmer.start()
+    prewarmer.join()
+
+
+@click.command('export')
+@click.option('--output', default='export', show_default=True, help='The directory to write the files to.')
+@click.option('--username', help='Only export this user\'s data - defaults to every user.')
+@click.option('--format', 'file_format', type=click.Choice(['parquet', 'arrow']), default='parquet', show_default=True,
+              help='Parquet, or the Arrow IPC file format.')
+@click.option('--batch-size', default=50000, show_default=True, help='The number of rows per record batch.')
+def export_command(output: str, username: str, file_format: str, batch_size: int):
+    """Exports the level progression, assignment, review, accuracy, subject and stage tables as Parquet or Arrow files."""
+    from app import database
+    from app.export import export_tables
+    from app.models import Account
+    from app.psql import PostgresClient
+
+    user_id = None
+
+    if username:
+        user = Account.query.filter_by(username=username).first()
+
+        if not user:
+            raise click.ClickException(f'There is no account named {username}.')
+
+        user_id = user.id
+
+    try:
+        with PostgresClient.from_pool(database.engine) as db:
+            counts = export_tables(db, output, user_id=user_id, file_format=file_format, batch_size=batch_size)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    for table, rows in counts.items():
+        click.echo(f'{table}: {rows} rows')
+
+
+@click.command('analyze')
+@click.option('--user-id', type=int, required=True, help='The account to analyze.')
+@click.option('--export', 'directory',
+              help='Analyze the Parquet files written by `flask export` with the embedded DuckDB backend.')
+@click.option('--section', 'sections', multiple=True, help='Only analyze these sections - defaults to all of them.')
+def analyze_command(user_id: int, directory: str, sections: tuple):
+    """Prints an account's stats as JSON, from the database or from an export."""
+    from app import database
+    from app.analyzer import Analyzer
+    from app.embedded import DuckDBClient
+    from app.models import Account
+    from app.psql import PostgresClient
+    from app.serialization import dumps
+
+    for section in sections:
+        if section not in Analyzer.SECTIONS:
+            raise click.BadParameter(f'{section} is not one of {", ".join(Analyzer.SECTIONS)}.', param_hint='--section')
+
+    try:
+        db = DuckDBClient.from_export(directory) if directory else PostgresClient.from_pool(database.engine)
+    except (RuntimeError, FileNotFoundError) as e:
+        raise click.ClickException(str(e))
+
+    # The analyses only need the account's ID, so an export can be analyzed without the account table.
+    user = Account(id=user_id)
+
+    with db:
+        analyzer = Analyzer(wanikani=None, db=db)
+        stats = {section: analyzer.analyze(user=user, section=section) for section in sections or Analyzer.SECTIONS}
+
+    click.echo(dumps(stats))
+
+
+@click.command('replay')
+@click.option('--archive', 'root', help='The payload archive - defaults to PAYLOAD_ARCHIVE.')
+@click.option('--username', 'usernames', multiple=True, help='Only replay these users - defaults to all of them.')
+@click.option('--processes', type=int, help='The number of accounts replayed in parallel - defaults to the CPU count.')
+def replay_command(root: str, usernames: tuple, processes: int):
+    """Rebuilds the accounts' tables from the archived API pages, without calling WaniKani."""
+    import time
+
+    from flask import current_app
+
+    from app.archive import PayloadArchive, replay
+
+    root = root or current_app.config['PAYLOAD_ARCHIVE']
+
+    if not root:
+        raise click.UsageError('Pass --archive or set PAYLOAD_ARCHIVE.')
+
+    archive = PayloadArchive(root)
+    usernames = list(usernames) or archive.usernames()
+
+    if not usernames:
+        raise click.ClickException(f'There are no archived accounts in {root}.')
+
+    def write(result):
+        if result['error']:
+            click.echo(f'{result["username"]}: failed after {result["seconds"]:.1f}s - {result["error"]}')
+        else:
+            rows = sum(stats['inserted'] + stats['updated'] for stats in result['ingest'].values())
+            click.echo(f'{result["username"]}: {rows} rows in {result["seconds"]:.1f}s')
+
+    start = time.perf_counter()
+    results = replay(archive, usernames=usernames, processes=processes, write=write)
+    failed = sum(1 for result in results if result['error'])
+
+    click.echo(f'Replayed {len(results) - failed} of {len(results)} accounts in {time.perf_counter() - start:.1f}s.')
+
+    if failed:
+        raise SystemExit(1)
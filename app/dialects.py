@@ -0,0 +1,65 @@
+import re
+
+# Matches the psycopg2 placeholders the analytics SQL is written with.
+_PLACEHOLDER = re.compile(r'%%|%\((\w+)\)s|%s')
+
+
+class PostgresDialect:
+    """
+    Renders the parts of the analytics SQL that differ between database engines, for stock Postgres.
+    Queries are written with psycopg2 placeholders, which the clients translate where the engine needs to.
+    """
+    name = 'postgresql'
+
+    def median(self, expression: str) -> str:
+        """
+        Renders the median of an expression, ignoring nulls.
+
+        Parameters
+        ----------
+        expression : str
+            The SQL expression to aggregate.
+
+        Returns
+        -------
+        str
+            The SQL aggregate.
+
+        """
+        return f'PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {expression})'
+
+    def parameters(self, sql: str) -> str:
+        """
+        Translates the psycopg2 placeholders into the engine's parameter syntax.
+
+        Parameters
+        ----------
+        sql : str
+            The query, with %s or %(name)s placeholders.
+
+        Returns
+        -------
+        str
+            The query the engine's driver accepts.
+
+        """
+        return sql
+
+
+class DuckDBDialect(PostgresDialect):
+    """
+    Renders the analytics SQL for DuckDB, which has a native MEDIAN and takes $name and ? parameters.
+    """
+    name = 'duckdb'
+
+    def median(self, expression: str) -> str:
+        return f'MEDIAN({expression})'
+
+    def parameters(self, sql: str) -> str:
+        def replace(match):
+            if match.group(0) == '%%':
+                return '%'
+
+            return f'${match.group(1)}' if match.group(1) else '?'
+
+        return _PLACEHOLDER.sub(replace, sql)
@@ -0,0 +1,205 @@
+import collections
+import logging
+import os
+from typing import Union
+
+from app.dialects import DuckDBDialect
+from app.metrics import QUERY_ROWS, QUERY_SECONDS, timed
+
+# duckdb is an optional dependency, only needed for the embedded backend.
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+class DuckDBClient:
+    """
+    An embedded, in-process alternative to PostgresClient for the analytics queries, backed by DuckDB.
+    The data of one account easily fits in memory, so single-user and test setups can analyze it from an export
+    without a Postgres server, with DuckDB's columnar engine doing the aggregates.
+
+    Parameters
+    ----------
+    path : str
+        The DuckDB database file - defaults to an in-memory database.
+    read_only : bool
+        Whether to open the database file read-only.
+    """
+    # Renders the engine specific parts of the analytics SQL.
+    dialect = DuckDBDialect()
+
+    def __init__(self, path: str = ':memory:', read_only: bool = False):
+        if duckdb is None:
+            raise RuntimeError('The embedded backend requires duckdb - install it with `pip install duckdb`.')
+
+        self._connection = duckdb.connect(path, read_only=read_only)
+
+    @classmethod
+    def from_export(cls, directory: str) -> 'DuckDBClient':
+        """
+        Creates an in-memory database and loads the Parquet files written by `flask export` into it.
+
+        Parameters
+        ----------
+        directory : str
+            The directory with one <table>.parquet file per table.
+
+        Returns
+        -------
+        DuckDBClient
+            The DuckDB client.
+
+        """
+        from app.export import EXPORT_TABLES
+
+        client = cls()
+
+        for table in EXPORT_TABLES:
+            path = os.path.join(directory, f'{table}.parquet')
+
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'{path} is missing - export the tables with `flask export --format parquet`.')
+
+            client._connection.execute(f'CREATE TABLE {table} AS SELECT * FROM read_parquet(?)', [path])
+
+        return client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def query_all(self, sql: str, params: Union[tuple, dict] = None) -> list:
+        """
+        Performs the SQL query and returns all rows in an associative format.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+
+        Returns
+        -------
+        list
+            A list of dictionaries with the info per row.
+
+        """
+        with timed(QUERY_SECONDS, 'db', statement='duckdb'):
+            cursor = self._execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        QUERY_ROWS.observe(len(rows), statement='duckdb')
+
+        return rows
+
+    def query_one(self, sql: str, params: Union[tuple, dict] = None) -> dict:
+        """
+        Performs the SQL query and returns one row in an associative format.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+
+        Returns
+        -------
+        dict
+            A dictionary with the info of the first row.
+
+        """
+        rows = self.query_all(sql, params)
+
+        return rows[0] if rows else None
+
+    def query_iter(self, sql: str, params: Union[tuple, dict] = None, itersize: int = 2000, named: bool = False):
+        """
+        Performs the SQL query and yields its rows a batch at a time.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+        itersize : int
+            The number of rows to fetch per batch.
+        named : bool
+            Whether to yield named tuples instead of plain tuples.
+
+        Returns
+        -------
+        Iterator[tuple]
+            The rows of the result.
+
+        """
+        for batch in self.query_batches(sql, params, size=itersize, named=named):
+            yield from batch
+
+    def query_batches(self, sql: str, params: Union[tuple, dict] = None, size: int = 2000, named: bool = False):
+        """
+        Performs the SQL query and yields its rows a batch at a time.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+        size : int
+            The number of rows per batch.
+        named : bool
+            Whether to yield named tuples instead of plain tuples.
+
+        Returns
+        -------
+        Iterator[list]
+            Lists of up to size rows of the result.
+
+        """
+        # Each generator gets its own cursor, so interleaved queries don't consume each other's results.
+        cursor = self._connection.cursor()
+
+        try:
+            self._execute(sql, params, cursor=cursor)
+            row_type = collections.namedtuple('Row', [column[0] for column in cursor.description]) if named else None
+
+            while True:
+                batch = cursor.fetchmany(size)
+
+                if not batch:
+                    break
+
+                yield [row_type(*row) for row in batch] if named else batch
+        finally:
+            cursor.close()
+
+    def _execute(self, sql: str, params: Union[tuple, dict], cursor=None):
+        cursor = cursor or self._connection
+
+        try:
+            return cursor.execute(self.dialect.parameters(sql), params)
+        except Exception as e:
+            logging.critical(f'ERROR: {str(e)}')
+            raise e
+
+    def close(self):
+        """
+        Closes the database.
+
+        Returns
+        -------
+        None
+
+        """
+        if self._connection is None:
+            return
+
+        self._connection.close()
+        self._connection = None
@@ -0,0 +1,129 @@
+import logging
+import os
+
+# pyarrow is an optional dependency, only needed for exporting.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# The columns of each exported table and their Arrow types.
+# Subjects and stages are shared by every user, so they're exported whole.
+EXPORT_TABLES = {
+    'level_progression': (
+        ('id', 'int32'), ('user_id', 'int32'), ('level', 'int32'),
+        ('started_at', 'timestamp'), ('passed_at', 'timestamp'), ('completed_at', 'timestamp'),
+        ('pass_duration', 'float64'), ('complete_duration', 'float64')
+    ),
+    'assignment': (
+        ('id', 'int32'), ('user_id', 'int32'), ('subject_id', 'int32'), ('srs_stage', 'int32'),
+        ('started_at', 'timestamp'), ('passed_at', 'timestamp'), ('burned_at', 'timestamp'),
+        ('available_at', 'timestamp'), ('pass_duration', 'float64'), ('complete_duration', 'float64')
+    ),
+    'review': (
+        ('id', 'int32'), ('user_id', 'int32'), ('assignment_id', 'int32'),
+        ('starting_srs_stage', 'int32'), ('ending_srs_stage', 'int32'),
+        ('incorrect_meaning_answers', 'int32'), ('incorrect_reading_answers', 'int32')
+    ),
+    'subject_accuracy': (
+        ('user_id', 'int32'), ('subject_id', 'int32'), ('reviews', 'int32'),
+        ('incorrect_meaning_answers', 'int32'), ('incorrect_reading_answers', 'int32'), ('last_stage_change', 'int32')
+    ),
+    'subject': (
+        ('id', 'int32'), ('level', 'int32'), ('type', 'string'), ('characters', 'string'), ('image_url', 'string')
+    ),
+    'stage': (
+        ('id', 'int32'), ('name', 'string')
+    )
+}
+
+SHARED_TABLES = {'subject', 'stage'}
+
+FORMATS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow'
+}
+
+# Rows fetched from the server and written per record batch.
+BATCH_SIZE = 50000
+
+
+def export_tables(db, directory: str, user_id: int = None, file_format: str = 'parquet', batch_size: int = BATCH_SIZE,
+                  tables: tuple = tuple(EXPORT_TABLES)) -> dict:
+    """
+    Exports the tables as one Parquet or Arrow IPC file each, e.g. for offline analysis.
+    Rows are streamed from a server-side cursor and written one record batch at a time, so memory stays bounded
+    by the batch size however much history is exported.
+
+    Parameters
+    ----------
+    db : PostgresClient
+        The Postgres DB client.
+    directory : str
+        The directory to write <table>.parquet or <table>.arrow into.
+    user_id : int
+        Only export this user's rows - defaults to every user.
+    file_format : str
+        One of the keys of FORMATS.
+    batch_size : int
+        The number of rows per record batch.
+    tables : tuple
+        The keys of EXPORT_TABLES to export.
+
+    Returns
+    -------
+    dict
+        The number of rows written, by table.
+
+    """
+    if pyarrow is None:
+        raise RuntimeError('Exporting requires pyarrow - install it with `pip install pyarrow`.')
+
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+
+    for table in tables:
+        columns = EXPORT_TABLES[table]
+        schema = _schema(columns)
+        sql = f"SELECT {', '.join(name for name, _ in columns)} FROM {table}"
+        params = None
+
+        if user_id is not None and table not in SHARED_TABLES:
+            sql += ' WHERE user_id = %(user_id)s'
+            params = {'user_id': user_id}
+
+        path = os.path.join(directory, table + FORMATS[file_format])
+        writer = _writer(path, schema, file_format)
+        counts[table] = 0
+
+        try:
+            for rows in db.query_batches(sql, params, size=batch_size):
+                # Transpose the batch into columns, so each becomes one Arrow array instead of a value per row.
+                arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+                counts[table] += len(rows)
+        finally:
+            writer.close()
+
+        logging.info(f'Exported {counts[table]} {table} rows to {path}.')
+
+    return counts
+
+
+def _schema(columns: tuple):
+    types = {
+        'int32': pyarrow.int32(),
+        'float64': pyarrow.float64(),
+        'string': pyarrow.string(),
+        'timestamp': pyarrow.timestamp('us')
+    }
+
+    return pyarrow.schema([(name, types[column_type]) for name, column_type in columns])
+
+
+def _writer(path: str, schema, file_format: str):
+    if file_format == 'parquet':
+        return pyarrow.parquet.ParquetWriter(path, schema, compression='zstd')
+
+    return pyarrow.ipc.new_file(path, schema)
@@ -0,0 +1,162 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+
+from app import database
+from app.metrics import API_KEY_LOOKUPS
+from app.models import ApiKeyFingerprint
+
+# Revalidates fingerprints off the request path, one at a time.
+_revalidations = ThreadPoolExecutor(max_workers=1, thread_name_prefix='key-revalidation')
+
+
+def lookup(fingerprint: str) -> ApiKeyFingerprint:
+    """
+    Finds the account an API key belongs to without asking WaniKani, if the key was validated recently.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The keyed hash of the API key.
+
+    Returns
+    -------
+    ApiKeyFingerprint
+        The key's account and last user payload, or None if it's unknown or past API_KEY_CACHE_SECONDS.
+
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['API_KEY_CACHE_SECONDS'])
+    mapping = ApiKeyFingerprint.query \
+        .filter(ApiKeyFingerprint.fingerprint == fingerprint, ApiKeyFingerprint.validated_at >= cutoff) \
+        .first()
+
+    API_KEY_LOOKUPS.inc(result='hit' if mapping else 'miss')
+
+    return mapping
+
+
+def remember(fingerprint: str, account_id: int, user_info: dict):
+    """
+    Maps the API key to its account and user payload after WaniKani accepted it.
+    Mappings that have expired are dropped at the same time.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The keyed hash of the API key.
+    account_id : int
+        The account's ID.
+    user_info : dict
+        The JSON WaniKani returned for the user.
+
+    Returns
+    -------
+    None
+
+    """
+    now = datetime.utcnow()
+    table = ApiKeyFingerprint.__table__
+    statement = insert(table).values(fingerprint=fingerprint, account_id=account_id, user_info=user_info,
+                                     validated_at=now)
+
+    database.session.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.fingerprint],
+        set_={'account_id': statement.excluded.account_id, 'user_info': statement.excluded.user_info,
+              'validated_at': statement.excluded.validated_at}
+    ))
+
+    ApiKeyFingerprint.query \
+        .filter(ApiKeyFingerprint.validated_at < now - timedelta(seconds=current_app.config['API_KEY_CACHE_SECONDS'])) \
+        .delete(synchronize_session=False)
+
+
+def forget(fingerprint: str):
+    """
+    Drops the API key's mapping, e.g. after WaniKani rejected the key.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The keyed hash of the API key.
+
+    Returns
+    -------
+    None
+
+    """
+    ApiKeyFingerprint.query.filter_by(fingerprint=fingerprint).delete(synchronize_session=False)
+
+
+def revalidate_later(fingerprint: str, api_key: str):
+    """
+    Checks the API key with WaniKani in the background and refreshes or drops its mapping.
+    Used when a mapping is past half its lifetime, so keys that are used regularly never expire on the request path.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The keyed hash of the API key.
+    api_key : str
+        The user's WaniKani API key.
+
+    Returns
+    -------
+    None
+
+    """
+    _revalidations.submit(_revalidate, current_app._get_current_object(), fingerprint, api_key)
+
+
+def needs_revalidation(mapping: ApiKeyFingerprint) -> bool:
+    """
+    Checks whether the mapping is past half its lifetime.
+
+    Parameters
+    ----------
+    mapping : ApiKeyFingerprint
+        A mapping returned by lookup.
+
+    Returns
+    -------
+    bool
+        True if the key should be revalidated in the background.
+
+    """
+    age = (datetime.utcnow() - mapping.validated_at).total_seconds()
+
+    return age > current_app.config['API_KEY_CACHE_SECONDS'] / 2
+
+
+def _revalidate(app, fingerprint: str, api_key: str):
+    from app.models import Account
+    from app.wanikani import WaniKaniClient
+
+    with app.app_context():
+        try:
+            user_info = WaniKaniClient(api_key).get_user()
+            account = Account.query.filter_by(username=user_info['username']).first()
+
+            # The key now belongs to an account that hasn't been synced, so let the next sync create it.
+            if account:
+                remember(fingerprint, account_id=account.id, user_info=user_info)
+            else:
+                forget(fingerprint)
+
+            database.session.commit()
+        except requests.HTTPError as e:
+            database.session.rollback()
+
+            if e.response is not None and e.response.status_code == 401:
+                forget(fingerprint)
+                database.session.commit()
+            else:
+                logging.exception('Revalidating an API key failed.')
+        except Exception:
+            database.session.rollback()
+            logging.exception('Revalidating an API key failed.')
+        finally:
+            database.session.remove()
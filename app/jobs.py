@@ -0,0 +1,374 @@
+import hashlib
+import hmac
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import database
+from app.metrics import SYNC_CACHE_LOOKUPS, SYNC_DATA_AGE_SECONDS
+from app.models import SyncJob
+from app.progress import SyncProgress
+from app.serialization import to_json
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# The number of recently finished jobs the latency stats are computed over.
+STATS_WINDOW = 100
+
+
+def enqueue(api_key: str) -> int:
+    """
+    Adds a sync job for the API key's account to the queue.
+    If a job for the same key is already queued or running, that job is returned instead of adding a duplicate.
+
+    Parameters
+    ----------
+    api_key : str
+        The user's WaniKani API key.
+
+    Returns
+    -------
+    int
+        The job ID.
+
+    """
+    from app.prewarm import encrypt_api_key
+
+    fingerprint = _fingerprint(api_key)
+
+    # Serialize submissions of the same key so two of them can't both decide to add a job.
+    database.session.execute(
+        database.text('SELECT pg_advisory_xact_lock(hashtext(:key))'),
+        {'key': f'enqueue:{fingerprint}'}
+    )
+
+    job = SyncJob.query \
+        .filter(SyncJob.api_key_fingerprint == fingerprint, SyncJob.status.in_([QUEUED, RUNNING])) \
+        .order_by(SyncJob.id) \
+        .first()
+
+    if not job:
+        job = SyncJob()
+        job.status = QUEUED
+        job.api_key = encrypt_api_key(api_key)  # The key sits in the table until a worker finishes the job.
+        job.api_key_fingerprint = fingerprint
+        job.enqueued_at = datetime.utcnow()  # The server default would be in the database's time zone.
+        database.session.add(job)
+
+    database.session.commit()
+
+    if current_app.config['SYNC_WORKERS'] > 0:
+        workers.start(threads=current_app.config['SYNC_WORKERS'])
+
+    return job.id
+
+
+def claim() -> SyncJob:
+    """
+    Claims the oldest queued job for this worker.
+    Rows locked by other workers are skipped, so concurrent workers never block on or claim the same job.
+
+    Returns
+    -------
+    SyncJob
+        The claimed job, or None if the queue is empty.
+
+    """
+    job = SyncJob.query \
+        .filter_by(status=QUEUED) \
+        .order_by(SyncJob.id) \
+        .with_for_update(skip_locked=True) \
+        .first()
+
+    if job:
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+
+    database.session.commit()
+
+    return job
+
+
+def run(job: SyncJob):
+    """
+    Syncs the job's account and stores the account info on the job.
+
+    Parameters
+    ----------
+    job : SyncJob
+        The claimed job.
+
+    Returns
+    -------
+    None
+
+    """
+    from app import fingerprints
+    from app.analyzer import Analyzer
+    from app.archive import archived
+    from app.prewarm import decrypt_api_key, record_activity
+    from app.psql import PostgresClient
+    from app.wanikani import WaniKaniClient
+
+    progress = SyncProgress(job_id=job.id)
+    api_key = decrypt_api_key(job.api_key) if job.api_key else None
+    fingerprint = job.api_key_fingerprint
+
+    try:
+        if api_key is None:
+            raise ValueError('The API key could not be read, please submit it again.')
+
+        # Resolve recently validated keys locally, so fresh cached data is served without asking WaniKani who it is.
+        mapping = fingerprints.lookup(fingerprint)
+        user_info = mapping.user_info if mapping else None
+
+        # Give the session's connection back, and only borrow the client's once a query needs it, so a sync that's
+        # coalesced into another one in this process doesn't hold any connection while it waits.
+        database.session.commit()
+
+        with PostgresClient.from_pool(database.engine, lazy=True) as db:
+            client = archived(WaniKaniClient(api_key, on_rate_limit=progress.rate_limited),
+                              username=user_info['username'] if user_info else None)
+            analyzer = Analyzer(wanikani=client, db=db, progress=progress)
+            user = analyzer.sync_user_info(user_info=user_info)
+
+        # A full sync also proves WaniKani still accepts the key.
+        if not mapping or analyzer.cache_stats.get('hit') is False:
+            fingerprints.remember(fingerprint, account_id=user['id'], user_info=analyzer.user_info)
+        elif fingerprints.needs_revalidation(mapping):
+            fingerprints.revalidate_later(fingerprint, api_key=api_key)
+
+        # Syncs coalesced into another one in this process didn't look at the cache themselves.
+        if analyzer.cache_stats:
+            SYNC_CACHE_LOOKUPS.inc(result='hit' if analyzer.cache_stats['hit'] else 'miss')
+
+            if analyzer.cache_stats['data_age_seconds'] is not None:
+                SYNC_DATA_AGE_SECONDS.observe(analyzer.cache_stats['data_age_seconds'])
+
+        record_activity(user['id'], api_key=api_key)
+
+        # The analysis itself is fetched section by section when the stats page loads.
+        job.account_id = user['id']
+        job.result = to_json({'user': user, 'ingest': analyzer.ingest_stats, 'cache': analyzer.cache_stats})
+        job.status = DONE
+    except Exception as e:
+        logging.exception(f'Sync job {job.id} failed.')
+        database.session.rollback()
+        job.status = FAILED
+        job.error = str(e)
+
+        # The key may have been rejected, so ask WaniKani about it again next time.
+        fingerprints.forget(fingerprint)
+
+    job.api_key = None
+    job.finished_at = datetime.utcnow()
+    database.session.commit()
+
+    progress.finish(status=job.status)
+
+    current_app.logger.info(
+        f'Sync job {job.id} {job.status}: waited {(job.started_at - job.enqueued_at).total_seconds():.1f}s, '
+        f'ran {(job.finished_at - job.started_at).total_seconds():.1f}s'
+    )
+
+
+def requeue_stale(timeout: int):
+    """
+    Puts jobs that have been running for too long back on the queue, e.g. after a worker process died.
+    Jobs whose API key can't be decrypted anymore are failed instead, and their key cleared.
+
+    Parameters
+    ----------
+    timeout : int
+        The number of seconds after which a running job is considered stale.
+
+    Returns
+    -------
+    None
+
+    """
+    from app.prewarm import decrypt_api_key
+
+    now = datetime.utcnow()
+    stale = SyncJob.query \
+        .filter(SyncJob.status == RUNNING, SyncJob.started_at < now - timedelta(seconds=timeout)) \
+        .with_for_update(skip_locked=True)
+
+    for job in stale:
+        if job.api_key and decrypt_api_key(job.api_key):
+            job.status = QUEUED
+            job.started_at = None
+        else:
+            # The key is gone or was encrypted with another SECRET_KEY, so the job can't be run again.
+            job.status = FAILED
+            job.error = 'The sync was interrupted, please submit your API key again.'
+            job.api_key = None
+            job.finished_at = now
+
+    database.session.commit()
+
+
+def queue_stats() -> dict:
+    """
+    Gets the queue depth and the latencies of recently finished jobs.
+
+    Returns
+    -------
+    dict
+        The queue stats in JSON format.
+
+    """
+    counts = dict(
+        database.session.query(SyncJob.status, database.func.count())
+        .filter(SyncJob.status.in_([QUEUED, RUNNING]))
+        .group_by(SyncJob.status)
+        .all()
+    )
+
+    oldest = database.session.query(database.func.min(SyncJob.enqueued_at)).filter_by(status=QUEUED).scalar()
+
+    recent = database.session.query(
+        database.func.extract('epoch', SyncJob.started_at - SyncJob.enqueued_at).label('wait'),
+        database.func.extract('epoch', SyncJob.finished_at - SyncJob.started_at).label('run'),
+        SyncJob.result['cache']['hit'].as_boolean().label('cache_hit'),
+        SyncJob.result['cache']['data_age_seconds'].as_float().label('data_age')
+    ).filter(SyncJob.finished_at.isnot(None)).order_by(SyncJob.id.desc()).limit(STATS_WINDOW).subquery()
+
+    latency = database.session.query(
+        database.func.avg(recent.c.wait),
+        database.func.max(recent.c.wait),
+        database.func.avg(recent.c.run),
+        database.func.max(recent.c.run),
+        database.func.avg(database.cast(recent.c.cache_hit, database.Integer)),
+        database.func.avg(recent.c.data_age)
+    ).one()
+
+    return {
+        'queued': counts.get(QUEUED, 0),
+        'running': counts.get(RUNNING, 0),
+        'oldest_queued_seconds': (datetime.utcnow() - oldest).total_seconds() if oldest else None,
+        'workers': workers.size,
+        'recent': {
+            'average_wait_seconds': _to_float(latency[0]),
+            'max_wait_seconds': _to_float(latency[1]),
+            'average_run_seconds': _to_float(latency[2]),
+            'max_run_seconds': _to_float(latency[3]),
+            # The share of syncs that found fresh enough data to reuse, and how old the data was when users came back.
+            'cache_hit_rate': _to_float(latency[4]),
+            'average_data_age_seconds': _to_float(latency[5])
+        }
+    }
+
+
+class WorkerPool:
+    """
+    A pool of threads that pull jobs off the Postgres-backed queue.
+    Any number of pools, in any number of processes, can share the same queue.
+    Workers run in the app that started them and check the queue every SYNC_POLL_INTERVAL seconds while idle.
+    """
+    def __init__(self):
+        self._app = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @property
+    def size(self) -> int:
+        return len(self._threads)
+
+    def start(self, threads: int):
+        """
+        Starts the worker threads if they aren't running yet.
+
+        Parameters
+        ----------
+        threads : int
+            The number of worker threads.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            if self._threads:
+                return
+
+            self._app = current_app._get_current_object()
+
+            for number in range(threads):
+                thread = threading.Thread(target=self._work, name=f'sync-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stops the workers once they finish their current job.
+
+        Returns
+        -------
+        None
+
+        """
+        self._stopping.set()
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+        self._stopping.clear()
+
+    def join(self):
+        """
+        Blocks until the workers stop.
+
+        Returns
+        -------
+        None
+
+        """
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        app = self._app
+
+        with app.app_context():
+            try:
+                requeue_stale(timeout=app.config['SYNC_JOB_TIMEOUT'])
+            finally:
+                database.session.remove()
+
+        while not self._stopping.is_set():
+            job = None
+
+            with app.app_context():
+                try:
+                    job = claim()
+
+                    if job:
+                        run(job)
+                except Exception:
+                    logging.exception('Sync worker error.')
+                finally:
+                    database.session.remove()
+
+            if not job:
+                self._stopping.wait(app.config['SYNC_POLL_INTERVAL'])
+
+
+def _fingerprint(api_key: str) -> str:
+    # Keyed so that the stored value can't be used to confirm guesses of an API key.
+    return hmac.new(current_app.config['SECRET_KEY'].encode(), api_key.encode(), hashlib.sha256).hexdigest()
+
+
+def _to_float(value):
+    return float(value) if value is not None else None
+
+
+workers = WorkerPool()
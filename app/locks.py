@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key within a process.
+    The first caller runs the function while everyone else waits for and shares its result, including exceptions.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, function):
+        """
+        Runs the function unless a call with the same key is already in flight, in which case its result is reused.
+
+        Parameters
+        ----------
+        key : str
+            The key identifying duplicate calls.
+        function : Callable
+            The function to run - takes no arguments.
+
+        Returns
+        -------
+        Any
+            The result of the in-flight call.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = function()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+@contextmanager
+def advisory_lock(db, key: str):
+    """
+    Holds a Postgres session-level advisory lock for the duration of the block, waiting for it if necessary.
+    This serializes work on the same key across threads, processes and hosts sharing the database.
+
+    Parameters
+    ----------
+    db : PostgresClient
+        The Postgres DB client whose connection holds the lock.
+    key : str
+        The lock name - hashed into Postgres' advisory lock key space.
+
+    """
+    # The lock outlives the transaction, so end it rather than leave the connection idle in transaction meanwhile.
+    db.query_one('SELECT pg_advisory_lock(hashtext(%s))', (key,))
+    db.commit()
+
+    try:
+        yield
+    finally:
+        db.query_one('SELECT pg_advisory_unlock(hashtext(%s))', (key,))
+        db.commit()
+
+
+@contextmanager
+def try_advisory_lock(db, key: str):
+    """
+    Holds a Postgres session-level advisory lock for the duration of the block if it's free, without waiting.
+
+    Parameters
+    ----------
+    db : PostgresClient
+        The Postgres DB client whose connection holds the lock.
+    key : str
+        The lock name - hashed into Postgres' advisory lock key space.
+
+    Returns
+    -------
+    Iterator[bool]
+        True if the lock was acquired, False if someone else holds it.
+
+    """
+    acquired = db.query_one('SELECT pg_try_advisory_lock(hashtext(%s)) AS acquired', (key,))['acquired']
+    db.commit()
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            db.query_one('SELECT pg_advisory_unlock(hashtext(%s))', (key,))
+            db.commit()
@@ -0,0 +1,306 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Flask, g, has_request_context, request
+
+# Latency buckets in seconds, from a cached query up to a full sync of a large account.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Buckets for ages of synced data, from a minute to a week.
+AGE_BUCKETS = (60, 300, 600, 1800, 3600, 4 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400)
+
+
+class Metric:
+    """
+    A metric with a value per combination of label values, rendered in the Prometheus text format.
+
+    Parameters
+    ----------
+    name : str
+        The metric name.
+    description : str
+        The help text.
+    labels : tuple
+        The label names.
+    """
+    TYPE = None
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def render(self) -> list:
+        """
+        Renders the metric's samples.
+
+        Returns
+        -------
+        list
+            The lines of the metric in the Prometheus text format.
+
+        """
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.TYPE}']
+
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines += self._samples(dict(zip(self.labels, key)), value)
+
+        return lines
+
+    def _samples(self, labels: dict, value) -> list:
+        return [f'{self.name}{_format_labels(labels)} {value}']
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, such as a total number of seconds waited.
+    """
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down.
+    """
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into cumulative buckets, along with their sum and count.
+
+    Parameters
+    ----------
+    buckets : tuple
+        The upper bounds of the buckets, in increasing order.
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, labels: dict, value) -> list:
+        counts, total = value
+        samples = []
+        cumulative = 0
+
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            samples.append(f"{self.name}_bucket{_format_labels(dict(labels, le=bound))} {cumulative}")
+
+        samples.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+        samples.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+
+        return samples
+
+
+class Registry:
+    """
+    The metrics exposed on /metrics. Each process keeps its own.
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders every metric.
+
+        Returns
+        -------
+        str
+            The metrics in the Prometheus text format.
+
+        """
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_seconds', 'Time spent handling requests, up to the response headers.', ('endpoint', 'status')
+))
+RENDER_SECONDS = registry.register(Histogram(
+    'template_render_seconds', 'Time spent rendering and compressing streamed pages.', ('template',)
+))
+WANIKANI_REQUEST_SECONDS = registry.register(Histogram(
+    'wanikani_request_seconds', 'Latency of WaniKani API requests, including rate limit retries.', ('endpoint',)
+))
+WANIKANI_RATE_LIMIT_SECONDS = registry.register(Counter(
+    'wanikani_rate_limit_wait_seconds_total', 'Time spent waiting for the WaniKani rate limit to reset.'
+))
+PHASE_SECONDS = registry.register(Histogram(
+    'analyzer_phase_seconds', 'Time spent in each phase of syncing and analyzing an account.', ('phase',)
+))
+INGESTED_ROWS = registry.register(Counter(
+    'analyzer_ingested_rows_total', 'Rows received from the WaniKani API and written.', ('endpoint',)
+))
+INGEST_WRITES = registry.register(Counter(
+    'analyzer_ingest_writes_total', 'Ingested rows by whether they were inserted, updated or skipped as unchanged.',
+    ('endpoint', 'result')
+))
+SYNC_CACHE_LOOKUPS = registry.register(Counter(
+    'sync_cache_lookups_total', 'User submitted syncs by whether the account\'s synced data was fresh enough to reuse.',
+    ('result',)
+))
+SYNC_DATA_AGE_SECONDS = registry.register(Histogram(
+    'sync_data_age_seconds', 'Age of the account\'s synced data when the user submitted their API key.',
+    buckets=AGE_BUCKETS
+))
+API_KEY_LOOKUPS = registry.register(Counter(
+    'api_key_lookups_total', 'Sync jobs by whether the API key resolved to an account without asking WaniKani.',
+    ('result',)
+))
+PREWARM_REFRESHES = registry.register(Counter(
+    'prewarm_refreshes_total', 'Background refreshes of recently active accounts by outcome.', ('result',)
+))
+PREWARM_LAG_SECONDS = registry.register(Histogram(
+    'prewarm_lag_seconds', 'Time an account\'s synced data had been stale for when it was refreshed in the background.',
+    buckets=AGE_BUCKETS
+))
+ANALYTICS_READS = registry.register(Counter(
+    'analytics_reads_total',
+    'Analytics requests by the server they read from, including replica lag and outage fallbacks.',
+    ('target',)
+))
+QUERY_SECONDS = registry.register(Histogram(
+    'db_query_seconds', 'Latency of PostgresClient queries, including fetching the rows.', ('statement',)
+))
+QUERY_ROWS = registry.register(Histogram(
+    'db_query_rows', 'Rows returned by PostgresClient queries.', ('statement',), buckets=ROW_BUCKETS
+))
+STATEMENTS = registry.register(Gauge(
+    'db_statement_info', 'The SQL of each statement label.', ('statement', 'sql')
+))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting to borrow a connection from the pool.'
+))
+
+
+@contextmanager
+def timed(histogram: Histogram, timing: str, **labels):
+    """
+    Times the block into the histogram and the current request's Server-Timing header.
+
+    Parameters
+    ----------
+    histogram : Histogram
+        The histogram to observe the duration in.
+    timing : str
+        The Server-Timing metric name to add the duration to.
+    labels : dict
+        The histogram's label values.
+
+    """
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        record_timing(timing, elapsed)
+
+
+def record_timing(name: str, seconds: float):
+    """
+    Adds a duration to the current request's Server-Timing header, if there's a request.
+
+    Parameters
+    ----------
+    name : str
+        The Server-Timing metric name. Durations with the same name are summed.
+    seconds : float
+        The duration.
+
+    Returns
+    -------
+    None
+
+    """
+    if not has_request_context():
+        return
+
+    timings = g.setdefault('server_timing', {})
+    total, count = timings.get(name, (0, 0))
+    timings[name] = (total + seconds, count + 1)
+
+
+def init_app(app: Flask):
+    """
+    Times every request and adds the Server-Timing header.
+
+    Parameters
+    ----------
+    app : Flask
+        The application.
+
+    Returns
+    -------
+    None
+
+    """
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        elapsed = time.perf_counter() - g.pop('request_start', time.perf_counter())
+        entries = [
+            f'{name};desc="{count}x";dur={total * 1000:.2f}'
+            for name, (total, count) in g.pop('server_timing', {}).items()
+        ]
+        entries.append(f'app;dur={elapsed * 1000:.2f}')
+
+        response.headers['Server-Timing'] = ', '.join(entries)
+        REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'none', status=response.status_code)
+
+        return response
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+
+    values = ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+    return f'{{{values}}}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
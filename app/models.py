@@ -9,6 +9,9 @@ class Account(database.Model):
     last_queried = database.Column(database.DateTime, server_default=database.func.now(), server_onupdate=database.func.now())
     create_date = database.Column(database.DateTime, server_default=database.func.now())
     modify_date = database.Column(database.DateTime, server_onupdate=database.func.now())
+    synced_lsn = database.Column(database.String(20))  # The primary's WAL position after the last sync was committed.
+    last_active_at = database.Column(database.DateTime)  # When the user last submitted their API key.
+    api_key = database.Column(database.Text)  # Encrypted, and only kept for background refreshes with PREWARM.
 
     assignments = database.relationship('Assignment', backref='user', lazy='dynamic')
     levels = database.relationship('LevelProgression', backref='user', lazy='dynamic')
@@ -26,10 +29,28 @@ class Assignment(database.Model):
     burned_at = database.Column(database.DateTime)
     srs_stage = database.Column(database.Integer, database.ForeignKey('stage.id'), nullable=False)
     subject_id = database.Column(database.Integer, database.ForeignKey('subject.id'), nullable=False)
+    available_at = database.Column(database.DateTime)  # When the next review is due. Not set for burned items.
+    data_updated_at = database.Column(database.DateTime)  # When WaniKani last changed the resource.
     create_date = database.Column(database.DateTime, server_default=database.func.now())
     modify_date = database.Column(database.DateTime, server_onupdate=database.func.now())
+    # Seconds from starting to passing and burning the item, set by the ingest along with the timestamps.
+    pass_duration = database.Column(database.Float)
+    complete_duration = database.Column(database.Float)
     reviews = database.relationship('Review', backref='assignment', lazy='dynamic')
 
+    # Every analytics query filters on the user and joins to the subject, so cover the columns they aggregate over.
+    __table_args__ = (
+        database.Index('ix_assignment_user_id_subject_id', 'user_id', 'subject_id',
+                       postgresql_include=['srs_stage', 'passed_at', 'burned_at',
+                                           'pass_duration', 'complete_duration']),
+        database.Index('ix_assignment_subject_id', 'subject_id'),
+        # The review forecast counts a user's assignments by when they become available.
+        database.Index('ix_assignment_user_id_available_at', 'user_id', 'available_at'),
+        # The fastest and slowest items are read off the ends of these instead of sorting every assignment.
+        database.Index('ix_assignment_user_id_pass_duration', 'user_id', 'pass_duration'),
+        database.Index('ix_assignment_user_id_complete_duration', 'user_id', 'complete_duration'),
+    )
+
     def __repr__(self):
         return f'<User ID {self.user_id}, Assignment ID {self.id}, Subject ID {self.subject_id}>'
 
@@ -41,8 +62,19 @@ class LevelProgression(database.Model):
     started_at = database.Column(database.DateTime)
     passed_at = database.Column(database.DateTime)
     completed_at = database.Column(database.DateTime)
+    data_updated_at = database.Column(database.DateTime)  # When WaniKani last changed the resource.
     create_date = database.Column(database.DateTime, server_default=database.func.now())
     modify_date = database.Column(database.DateTime, server_onupdate=database.func.now())
+    # Seconds from starting to passing and completing the level, set by the ingest along with the timestamps.
+    pass_duration = database.Column(database.Float)
+    complete_duration = database.Column(database.Float)
+
+    __table_args__ = (
+        database.Index('ix_level_progression_user_id_level', 'user_id', 'level',
+                       postgresql_include=['passed_at', 'completed_at', 'pass_duration', 'complete_duration']),
+        database.Index('ix_level_progression_user_id_pass_duration', 'user_id', 'pass_duration'),
+        database.Index('ix_level_progression_user_id_complete_duration', 'user_id', 'complete_duration'),
+    )
 
     def __repr__(self):
         return f'<User ID {self.user_id}, Level ID {self.id}, Level {self.level}>'
@@ -56,13 +88,42 @@ class Review(database.Model):
     ending_srs_stage = database.Column(database.Integer, database.ForeignKey('stage.id'), nullable=False)
     incorrect_meaning_answers = database.Column(database.Integer)
     incorrect_reading_answers = database.Column(database.Integer)
+    data_updated_at = database.Column(database.DateTime)  # When WaniKani last changed the resource.
     create_date = database.Column(database.DateTime, server_default=database.func.now())
     modify_date = database.Column(database.DateTime, server_onupdate=database.func.now())
 
+    __table_args__ = (
+        database.Index('ix_review_user_id_assignment_id', 'user_id', 'assignment_id',
+                       postgresql_include=['starting_srs_stage', 'ending_srs_stage',
+                                           'incorrect_meaning_answers', 'incorrect_reading_answers']),
+        database.Index('ix_review_assignment_id', 'assignment_id'),
+    )
+
     def __repr__(self):
         return f'<User ID: {self.user_id}, Review ID {self.id}, Assignment ID {self.assignment_id}>'
 
 
+# A rollup of each user's reviews per subject, kept up to date as reviews are ingested.
+class SubjectAccuracy(database.Model):
+    user_id = database.Column(database.Integer, database.ForeignKey('account.id'), primary_key=True)
+    subject_id = database.Column(database.Integer, database.ForeignKey('subject.id'), primary_key=True)
+    reviews = database.Column(database.Integer, nullable=False)
+    incorrect_meaning_answers = database.Column(database.Integer, nullable=False)
+    incorrect_reading_answers = database.Column(database.Integer, nullable=False)
+    last_stage_change = database.Column(database.Integer)  # Of the most recent review.
+
+    # The leech lists read a user's worst subjects straight off these.
+    __table_args__ = (
+        database.Index('ix_subject_accuracy_user_id_incorrect_meaning_answers',
+                       'user_id', 'incorrect_meaning_answers'),
+        database.Index('ix_subject_accuracy_user_id_incorrect_reading_answers',
+                       'user_id', 'incorrect_reading_answers'),
+    )
+
+    def __repr__(self):
+        return f'<User ID {self.user_id}, Subject ID {self.subject_id}, Reviews {self.reviews}>'
+
+
 class Stage(database.Model):
     id = database.Column(database.Integer, primary_key=True, autoincrement=False)
     name = database.Column(database.String(30), unique=True)
@@ -84,3 +145,53 @@ class Subject(database.Model):
 
     def __repr__(self):
         return f'<ID: {self.id}, Level {self.level}, Type {self.type}, Characters {self.characters}>'
+
+
+class ApiKeyFingerprint(database.Model):
+    fingerprint = database.Column(database.String(64), primary_key=True)  # Keyed hash of the API key.
+    account_id = database.Column(database.Integer, database.ForeignKey('account.id'), nullable=False)
+    user_info = database.Column(database.JSON, nullable=False)  # The key's last WaniKani user payload.
+    validated_at = database.Column(database.DateTime, nullable=False)  # When WaniKani last accepted the key.
+
+    def __repr__(self):
+        return f'<API Key Fingerprint of Account ID {self.account_id}>'
+
+
+class SyncJob(database.Model):
+    id = database.Column(database.Integer, primary_key=True)
+    status = database.Column(database.String(10), nullable=False, server_default='queued')
+    api_key = database.Column(database.Text)  # Encrypted, and cleared as soon as the job finishes.
+    api_key_fingerprint = database.Column(database.String(64))  # Keyed hash used to coalesce duplicate submissions.
+    account_id = database.Column(database.Integer, database.ForeignKey('account.id'))
+    result = database.Column(database.JSON)
+    error = database.Column(database.Text)
+    enqueued_at = database.Column(database.DateTime, nullable=False, server_default=database.func.now())  # UTC.
+    started_at = database.Column(database.DateTime)
+    finished_at = database.Column(database.DateTime)
+
+    # Workers poll for the oldest queued job.
+    __table_args__ = (
+        database.Index('ix_sync_job_status_id', 'status', 'id'),
+        database.Index('ix_sync_job_api_key_fingerprint', 'api_key_fingerprint'),
+    )
+
+    def __repr__(self):
+        return f'<Sync Job ID {self.id}, Status {self.status}>'
+
+
+class PrewarmRefresh(database.Model):
+    id = database.Column(database.Integer, primary_key=True)
+    account_id = database.Column(database.Integer, database.ForeignKey('account.id'), nullable=False)
+    result = database.Column(database.String(10), nullable=False)  # Either refreshed or failed.
+    requests = database.Column(database.Integer, nullable=False)  # The WaniKani requests the refresh took.
+    lag_seconds = database.Column(database.Float)  # How long the data had been stale for when it was refreshed.
+    finished_at = database.Column(database.DateTime, nullable=False, server_default=database.func.now())  # UTC.
+
+    # The budget and /status sum up the recent refreshes, and each account's last one estimates its next cost.
+    __table_args__ = (
+        database.Index('ix_prewarm_refresh_finished_at', 'finished_at'),
+        database.Index('ix_prewarm_refresh_account_id_id', 'account_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Prewarm Refresh ID {self.id}, Account ID {self.account_id}, {self.result}>'
@@ -0,0 +1,122 @@
+import logging
+
+from app import database
+
+# The tables that grow with every user, in the order they have to be converted (referenced tables first).
+PARTITIONED_TABLES = ('assignment', 'review')
+
+# Reviews reference assignments by ID alone, which a partitioned table can't enforce uniqueness on.
+# The converted foreign key includes the partition key instead.
+COMPOSITE_FOREIGN_KEYS = {
+    'review': {
+        'references': 'assignment',
+        'definition': 'FOREIGN KEY (user_id, assignment_id) REFERENCES assignment(user_id, id)'
+    }
+}
+
+
+def is_partitioned(table: str) -> bool:
+    """
+    Checks whether the table has already been converted to a partitioned table.
+
+    Parameters
+    ----------
+    table : str
+        The table name.
+
+    Returns
+    -------
+    bool
+        True if the table is partitioned.
+
+    """
+    return database.session.execute(
+        database.text("SELECT COUNT(*) FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {'table': table}
+    ).scalar() > 0
+
+
+def partition_tables(partitions: int = 16):
+    """
+    Converts the per-user tables into tables hash partitioned by user ID.
+    Each user's rows then live in one small partition, so per-user queries and upserts only touch that partition.
+
+    This is an optional, one-way migration meant to run after `flask db upgrade`.
+    Columns, indexes and foreign keys are copied from the current tables, so it also works after later migrations.
+    The primary keys become (user_id, id) since a partitioned table's unique keys must include the partition key.
+
+    Parameters
+    ----------
+    partitions : int
+        The number of hash partitions per table.
+
+    Returns
+    -------
+    None
+
+    """
+    tables = [table for table in PARTITIONED_TABLES if not is_partitioned(table)]
+
+    if not tables:
+        logging.info('Tables are already partitioned.')
+        return
+
+    indexes = {}
+    foreign_keys = {}
+
+    for table in tables:
+        indexes[table] = database.session.execute(database.text(
+            "SELECT pg_get_indexdef(i.indexrelid) "
+            "FROM pg_index i "
+            "WHERE i.indrelid = to_regclass(:table) AND NOT i.indisprimary"
+        ), {'table': table}).scalars().all()
+
+        foreign_keys[table] = database.session.execute(database.text(
+            "SELECT conname, pg_get_constraintdef(oid), confrelid::regclass::text "
+            "FROM pg_constraint "
+            "WHERE conrelid = to_regclass(:table) AND contype = 'f'"
+        ), {'table': table}).all()
+
+        logging.info(f'Partitioning {table} into {partitions} partitions...')
+
+        database.session.execute(database.text(
+            f"CREATE TABLE {table}_partitioned (LIKE {table} INCLUDING DEFAULTS, PRIMARY KEY (user_id, id)) "
+            "PARTITION BY HASH (user_id)"
+        ))
+
+        for remainder in range(partitions):
+            database.session.execute(database.text(
+                f"CREATE TABLE {table}_p{remainder} PARTITION OF {table}_partitioned "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+            ))
+
+        database.session.execute(database.text(f"INSERT INTO {table}_partitioned SELECT * FROM {table}"))
+
+    # Drop in reverse so that referencing tables go before the tables they reference.
+    for table in reversed(tables):
+        database.session.execute(database.text(f"DROP TABLE {table}"))
+
+    for table in tables:
+        database.session.execute(database.text(f"ALTER TABLE {table}_partitioned RENAME TO {table}"))
+        database.session.execute(database.text(
+            f"ALTER TABLE {table} RENAME CONSTRAINT {table}_partitioned_pkey TO {table}_pkey"
+        ))
+
+        for index in indexes[table]:
+            database.session.execute(database.text(index))
+
+    for table in tables:
+        composite = COMPOSITE_FOREIGN_KEYS.get(table)
+
+        for name, definition, referenced_table in foreign_keys[table]:
+            if composite and referenced_table == composite['references']:
+                definition = composite['definition']
+
+            database.session.execute(database.text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
+
+    database.session.commit()
+
+    for table in tables:
+        database.session.execute(database.text(f"ANALYZE {table}"))
+
+    database.session.commit()
@@ -0,0 +1,376 @@
+import base64
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from flask import current_app
+
+from app import database
+from app.jobs import QUEUED
+from app.locks import try_advisory_lock
+from app.metrics import PREWARM_LAG_SECONDS, PREWARM_REFRESHES
+from app.models import Account, PrewarmRefresh, SyncJob
+
+# cryptography is an optional dependency, only needed to keep the API keys of accounts for PREWARM.
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:
+    Fernet = None
+
+# The page sizes of the paginated WaniKani endpoints, used to estimate the cost of a refresh.
+PAGE_SIZES = {
+    'level_progressions': 500,
+    'assignments': 500,
+    'reviews': 1000
+}
+
+# The outcomes of a refresh.
+REFRESHED = 'refreshed'
+FAILED = 'failed'
+
+# The window the request budget and the refresh stats in /status cover.
+BUDGET_WINDOW = timedelta(hours=1)
+
+
+def record_activity(account_id: int, api_key: str):
+    """
+    Marks the account as recently active after the user submitted their API key.
+    The key is kept encrypted for background refreshes when PREWARM is enabled, and dropped when it isn't.
+
+    Parameters
+    ----------
+    account_id : int
+        The account's ID.
+    api_key : str
+        The user's WaniKani API key.
+
+    Returns
+    -------
+    None
+
+    """
+    values = {
+        'last_active_at': datetime.utcnow(),
+        'api_key': encrypt_api_key(api_key) if current_app.config['PREWARM'] else None
+    }
+
+    Account.query.filter_by(id=account_id).update(values, synchronize_session=False)
+
+
+def encrypt_api_key(api_key: str) -> str:
+    """
+    Encrypts an API key for storing it on the account or a sync job, with a key derived from SECRET_KEY.
+
+    Parameters
+    ----------
+    api_key : str
+        The user's WaniKani API key.
+
+    Returns
+    -------
+    str
+        The encrypted key.
+
+    """
+    return _cipher().encrypt(api_key.encode()).decode()
+
+
+def decrypt_api_key(token: str) -> str:
+    """
+    Decrypts an API key stored on an account or a sync job.
+
+    Parameters
+    ----------
+    token : str
+        The encrypted key.
+
+    Returns
+    -------
+    str
+        The user's WaniKani API key, or None if it was encrypted with a different SECRET_KEY.
+
+    """
+    try:
+        return _cipher().decrypt(token.encode()).decode()
+    except InvalidToken:
+        return None
+
+
+def _cipher():
+    if Fernet is None:
+        raise RuntimeError('Storing API keys requires cryptography to encrypt them - '
+                           'install it with `pip install cryptography`.')
+
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'account.api_key') \
+        .derive(current_app.config['SECRET_KEY'].encode())
+
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+class Prewarmer:
+    """
+    Refreshes the data of recently active accounts in the background, so users coming back find it fresh instead of
+    waiting for a sync.
+    Accounts are refreshed most recently active first, once their data is older than the analyzer's cache time,
+    and only while no user submitted syncs are queued. The WaniKani requests are paced by a budget of
+    PREWARM_REQUESTS_PER_HOUR over the last hour of refreshes.
+
+    Every refresh is recorded in the prewarm_refresh table, so the budget is shared by all schedulers and /status can
+    report on them from any process. An advisory lock lets only one scheduler make a pass at a time.
+    """
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        """
+        Starts the scheduler thread if it isn't running yet.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            if self._thread:
+                return
+
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._work, name='prewarm', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops the scheduler once it finishes the current refresh.
+
+        Returns
+        -------
+        None
+
+        """
+        self._stopping.set()
+
+        if self._thread:
+            self._thread.join()
+
+        self._thread = None
+        self._stopping.clear()
+
+    def join(self):
+        """
+        Blocks until the scheduler stops.
+
+        Returns
+        -------
+        None
+
+        """
+        if self._thread:
+            self._thread.join()
+
+    def run_once(self) -> int:
+        """
+        Refreshes the stale recently active accounts until the budget runs out or users queue syncs.
+        Does nothing if another scheduler is already making a pass.
+
+        Returns
+        -------
+        int
+            The number of accounts refreshed.
+
+        """
+        from app.analyzer import CACHE_SECONDS
+        from app.psql import PostgresClient
+
+        per_hour = current_app.config['PREWARM_REQUESTS_PER_HOUR']
+        refreshed = 0
+        skipped = 0
+
+        # The lock is held by a connection of its own, since the session's connection goes back to the pool on commit.
+        with PostgresClient.from_pool(database.engine) as db, try_advisory_lock(db, 'prewarm') as acquired:
+            if not acquired:
+                return 0
+
+            budget = per_hour - _requests_since(datetime.utcnow() - BUDGET_WINDOW)
+
+            for account_id, encrypted_key, last_queried in _candidates().all():
+                if self._stopping.is_set() or not self._is_quiet():
+                    break
+
+                api_key = decrypt_api_key(encrypted_key)
+
+                # SECRET_KEY has changed since, so wait for the user to submit the key again.
+                if api_key is None:
+                    Account.query.filter_by(id=account_id).update({'api_key': None}, synchronize_session=False)
+                    database.session.commit()
+                    continue
+
+                cost = self._cost(account_id)
+
+                # An account that costs more than the whole budget would otherwise hold up everyone behind it forever.
+                if cost > per_hour:
+                    skipped += 1
+                    continue
+
+                # Stop rather than skip ahead, so cheaper but less recently active accounts don't jump the queue.
+                if cost > budget:
+                    break
+
+                lag = (datetime.utcnow() - last_queried).total_seconds() - CACHE_SECONDS
+                refresh = self._refresh(account_id, api_key, lag=lag)
+                budget -= refresh.requests
+
+                if refresh.result == REFRESHED:
+                    refreshed += 1
+
+            # Accounts that haven't been active within the window aren't refreshed, so don't keep their keys or history.
+            cutoff = datetime.utcnow() - timedelta(days=current_app.config['PREWARM_ACTIVE_DAYS'])
+            Account.query \
+                .filter(Account.api_key.isnot(None), Account.last_active_at < cutoff) \
+                .update({'api_key': None}, synchronize_session=False)
+            PrewarmRefresh.query.filter(PrewarmRefresh.finished_at < cutoff).delete(synchronize_session=False)
+            database.session.commit()
+
+        if skipped:
+            logging.warning(f'Skipped prewarming {skipped} accounts that need more than {per_hour} requests.')
+
+        return refreshed
+
+    def _refresh(self, account_id: int, api_key: str, lag: float) -> PrewarmRefresh:
+        from app.analyzer import Analyzer
+        from app.archive import archived
+        from app.psql import PostgresClient
+        from app.wanikani import WaniKaniClient
+
+        client = archived(WaniKaniClient(api_key))
+        result = FAILED
+
+        try:
+            with PostgresClient.from_pool(database.engine) as db:
+                Analyzer(wanikani=client, db=db).sync_user_info()
+
+            result = REFRESHED
+            PREWARM_LAG_SECONDS.observe(lag)
+        except requests.HTTPError as e:
+            database.session.rollback()
+
+            # The user revoked the key, so stop trying it.
+            if e.response is not None and e.response.status_code == 401:
+                Account.query.filter_by(id=account_id).update({'api_key': None}, synchronize_session=False)
+
+            logging.exception(f'Prewarming account {account_id} failed.')
+        except Exception:
+            database.session.rollback()
+            logging.exception(f'Prewarming account {account_id} failed.')
+
+        PREWARM_REFRESHES.inc(result=result)
+
+        refresh = PrewarmRefresh(account_id=account_id, result=result, requests=client.requests,
+                                 lag_seconds=lag if result == REFRESHED else None, finished_at=datetime.utcnow())
+        database.session.add(refresh)
+        database.session.commit()
+
+        return refresh
+
+    def _cost(self, account_id: int) -> int:
+        last = PrewarmRefresh.query \
+            .filter_by(account_id=account_id) \
+            .order_by(PrewarmRefresh.id.desc()) \
+            .with_entities(PrewarmRefresh.requests) \
+            .first()
+
+        if last:
+            return last.requests
+
+        # One request for the user, then a page per PAGE_SIZES rows of each endpoint.
+        counts = database.session.execute(database.text(
+            'SELECT (SELECT COUNT(*) FROM level_progression WHERE user_id = :user_id) AS level_progressions, '
+            '(SELECT COUNT(*) FROM assignment WHERE user_id = :user_id) AS assignments, '
+            '(SELECT COALESCE(SUM(reviews), 0) FROM subject_accuracy WHERE user_id = :user_id) AS reviews'
+        ), {'user_id': account_id}).mappings().one()
+
+        return 1 + sum(max(math.ceil(counts[endpoint] / size), 1) for endpoint, size in PAGE_SIZES.items())
+
+    def _is_quiet(self) -> bool:
+        return not database.session.query(SyncJob.query.filter_by(status=QUEUED).exists()).scalar()
+
+    def _work(self):
+        app = self._app
+
+        while not self._stopping.is_set():
+            with app.app_context():
+                try:
+                    refreshed = self.run_once()
+
+                    if refreshed:
+                        app.logger.info(f'Prewarmed {refreshed} accounts.')
+                except Exception:
+                    logging.exception('Prewarm error.')
+                finally:
+                    database.session.remove()
+
+            self._stopping.wait(app.config['PREWARM_INTERVAL'])
+
+
+def prewarm_stats() -> dict:
+    """
+    Gets the background refreshes of the last hour, from whichever processes ran them.
+
+    Returns
+    -------
+    dict
+        The prewarm stats in JSON format.
+
+    """
+    since = datetime.utcnow() - BUDGET_WINDOW
+    stats = database.session.query(
+        database.func.count().filter(PrewarmRefresh.result == REFRESHED),
+        database.func.count().filter(PrewarmRefresh.result == FAILED),
+        database.func.avg(PrewarmRefresh.lag_seconds),
+        database.func.max(PrewarmRefresh.lag_seconds),
+        database.func.max(PrewarmRefresh.finished_at)
+    ).filter(PrewarmRefresh.finished_at >= since).one()
+    requests_spent = _requests_since(since)
+
+    return {
+        'enabled': current_app.config['PREWARM'],
+        'refreshed': stats[0],
+        'failed': stats[1],
+        'requests': requests_spent,
+        'budget_remaining': max(current_app.config['PREWARM_REQUESTS_PER_HOUR'] - requests_spent, 0),
+        # Accounts whose data has gone stale and that are still waiting for a refresh.
+        'stale_accounts': _candidates().count(),
+        'average_lag_seconds': stats[2],
+        'max_lag_seconds': stats[3],
+        'last_refresh_at': stats[4].isoformat() if stats[4] else None
+    }
+
+
+def _candidates():
+    from app.analyzer import CACHE_SECONDS
+
+    now = datetime.utcnow()
+
+    return Account.query \
+        .filter(
+            Account.api_key.isnot(None),
+            Account.last_active_at >= now - timedelta(days=current_app.config['PREWARM_ACTIVE_DAYS']),
+            Account.last_queried < now - timedelta(seconds=CACHE_SECONDS)
+        ) \
+        .order_by(Account.last_active_at.desc()) \
+        .with_entities(Account.id, Account.api_key, Account.last_queried)
+
+
+def _requests_since(since: datetime) -> int:
+    return database.session.query(database.func.coalesce(database.func.sum(PrewarmRefresh.requests), 0)) \
+        .filter(PrewarmRefresh.finished_at >= since) \
+        .scalar()
+
+
+prewarmer = Prewarmer()
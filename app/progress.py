@@ -0,0 +1,237 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from app import database
+
+# The Postgres NOTIFY channel sync progress is published on, so it reaches web processes from any worker process.
+CHANNEL = 'sync_progress'
+
+# The minimum number of seconds between progress updates for a job, apart from state changes.
+PUBLISH_INTERVAL = 0.5
+
+FINISHED = ('done', 'failed')
+
+
+class Progress:
+    """
+    Receives progress updates from the ingest loop.
+    This base class ignores them, for syncs that nobody is watching.
+    """
+    def start_endpoint(self, endpoint: str):
+        pass
+
+    def page_processed(self, page: dict):
+        pass
+
+    def batch_written(self, counts: dict):
+        pass
+
+    def rate_limited(self, seconds: float):
+        pass
+
+    def finish(self, status: str):
+        pass
+
+
+class SyncProgress(Progress):
+    """
+    Tracks the progress of a sync job and publishes it to any web process streaming it.
+
+    Parameters
+    ----------
+    job_id : int
+        The sync job ID.
+    """
+    def __init__(self, job_id: int):
+        self._state = {
+            'job_id': job_id,
+            'status': 'running',
+            'endpoint': None,
+            'pages_fetched': 0,
+            'rows_fetched': 0,
+            'endpoint_rows_fetched': 0,
+            'rows_written': 0,  # Inserted or updated, once each batch of rows is upserted.
+            'rows_skipped': 0,  # Left alone as unchanged.
+            'endpoint_total_rows': None,
+            'eta_seconds': None,
+            'rate_limit_wait_seconds': 0
+        }
+        self._endpoint_started = time.monotonic()
+        self._last_published = 0
+
+    def start_endpoint(self, endpoint: str):
+        self._state['endpoint'] = endpoint
+        self._state['endpoint_rows_fetched'] = 0
+        self._state['endpoint_total_rows'] = None
+        self._state['eta_seconds'] = None
+        self._endpoint_started = time.monotonic()
+        self._publish(force=True)
+
+    def page_processed(self, page: dict):
+        rows = len(page['data'])
+
+        self._state['pages_fetched'] += 1
+        self._state['rows_fetched'] += rows
+        self._state['endpoint_rows_fetched'] += rows
+        self._state['endpoint_total_rows'] = page.get('total_count')
+        self._state['rate_limit_wait_seconds'] = 0
+
+        # Estimate the time left for the current endpoint from its row rate so far.
+        elapsed = time.monotonic() - self._endpoint_started
+        remaining = (self._state['endpoint_total_rows'] or 0) - self._state['endpoint_rows_fetched']
+
+        if self._state['endpoint_rows_fetched'] and remaining > 0:
+            self._state['eta_seconds'] = round(remaining * elapsed / self._state['endpoint_rows_fetched'], 1)
+        else:
+            self._state['eta_seconds'] = 0
+
+        self._publish()
+
+    def batch_written(self, counts: dict):
+        self._state['rows_written'] += counts['inserted'] + counts['updated']
+        self._state['rows_skipped'] += counts['skipped']
+        self._publish()
+
+    def rate_limited(self, seconds: float):
+        self._state['rate_limit_wait_seconds'] = round(seconds, 1)
+        self._publish(force=True)
+
+    def finish(self, status: str):
+        self._state['status'] = status
+        self._publish(force=True)
+
+    def _publish(self, force: bool = False):
+        now = time.monotonic()
+
+        if not force and now - self._last_published < PUBLISH_INTERVAL:
+            return
+
+        self._last_published = now
+
+        # Publish outside of the ingest transaction, which would otherwise hold the notification until it commits.
+        try:
+            with database.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(
+                    database.text('SELECT pg_notify(:channel, :payload)'),
+                    {'channel': CHANNEL, 'payload': json.dumps(self._state)}
+                )
+        except Exception as e:
+            logging.warning(f'Unable to publish sync progress: {str(e)}')
+
+
+class ProgressBroadcaster:
+    """
+    Fans sync progress out to every listener in this process over a single LISTEN connection.
+    Listeners only hold an in-memory queue, so streaming progress doesn't use a database connection per client.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._latest = {}
+        self._thread = None
+
+    def subscribe(self, job_id: int) -> queue.Queue:
+        """
+        Starts receiving the job's progress updates, beginning with the latest known one.
+
+        Parameters
+        ----------
+        job_id : int
+            The sync job ID.
+
+        Returns
+        -------
+        queue.Queue
+            The queue the job's progress updates are put on.
+
+        """
+        updates = queue.Queue()
+
+        with self._lock:
+            if self._thread is None:
+                # psycopg2 doesn't understand SQLAlchemy's driver suffixes, e.g. postgresql+psycopg2://.
+                dsn = database.engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+                self._thread = threading.Thread(
+                    target=self._listen,
+                    args=(dsn,),
+                    name='progress-listener',
+                    daemon=True
+                )
+                self._thread.start()
+
+            self._subscribers.setdefault(job_id, set()).add(updates)
+
+            if job_id in self._latest:
+                updates.put(self._latest[job_id])
+
+        return updates
+
+    def unsubscribe(self, job_id: int, updates: queue.Queue):
+        """
+        Stops receiving the job's progress updates.
+
+        Parameters
+        ----------
+        job_id : int
+            The sync job ID.
+        updates : queue.Queue
+            The queue returned by subscribe.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, set())
+            subscribers.discard(updates)
+
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+                self._latest.pop(job_id, None)
+
+    def _dispatch(self, state: dict):
+        job_id = state['job_id']
+
+        with self._lock:
+            if job_id not in self._subscribers:
+                return
+
+            self._latest[job_id] = state
+
+            for updates in self._subscribers[job_id]:
+                updates.put(state)
+
+    def _listen(self, dsn: str):
+        import psycopg2
+
+        while True:
+            connection = None
+
+            try:
+                connection = psycopg2.connect(dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {CHANNEL}')
+
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+
+                    connection.poll()
+
+                    while connection.notifies:
+                        self._dispatch(json.loads(connection.notifies.pop(0).payload))
+            except Exception as e:
+                logging.warning(f'Sync progress listener error, reconnecting: {str(e)}')
+
+                if connection:
+                    connection.close()
+
+                time.sleep(1)
+
+
+broadcaster = ProgressBroadcaster()
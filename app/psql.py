@@ -1,8 +1,85 @@
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
+import hashlib
+import itertools
 import logging
+import re
+import threading
+import time
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Union
+
+from app.dialects import PostgresDialect
+from app.metrics import POOL_WAIT_SECONDS, QUERY_ROWS, QUERY_SECONDS, STATEMENTS, timed
+
+# Matches the psycopg2 placeholders that get turned into numbered prepared statement parameters.
+_PLACEHOLDER = re.compile(r'%%|%\((\w+)\)s|%s')
+
+# The statement labels whose SQL has been published to the metrics.
+_described = set()
+
+
+class PoolStats:
+    """
+    Thread-safe counters for connections borrowed from a pool.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float):
+        """
+        Records a connection checkout.
+
+        Parameters
+        ----------
+        wait : float
+            The number of seconds spent waiting for the connection.
+
+        Returns
+        -------
+        None
+
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def report(self, engine=None) -> dict:
+        """
+        Gets the checkout stats, along with the pool's current usage if given its engine.
+
+        Parameters
+        ----------
+        engine : sqlalchemy.engine.Engine
+            The engine that owns the pool.
+
+        Returns
+        -------
+        dict
+            The pool stats in JSON format.
+
+        """
+        with self._lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'average_wait_seconds': self.total_wait / self.checkouts if self.checkouts else None,
+                'max_wait_seconds': self.max_wait
+            }
+
+        if engine is not None:
+            stats['size'] = engine.pool.size()
+            stats['checked_out'] = engine.pool.checkedout()
+            stats['overflow'] = engine.pool.overflow()
+
+        return stats
+
+
+pool_stats = PoolStats()
 
 
 class PostgresClient:
@@ -22,25 +99,81 @@ class PostgresClient:
         The database host - defaults to localhost.
     port : str
         The port to connect on - defaults to 5432.
+    connection : Any
+        An existing DB-API connection to use instead of connecting, e.g. one borrowed from a pool.
+    prepare : bool
+        Whether to run queries with parameters as prepared statements - defaults to True.
+    engine : sqlalchemy.engine.Engine
+        An engine to borrow the connection from on the first query instead, see from_pool.
     """
-    def __init__(self, dbname: str, user: str, password: str, host: str = 'localhost', port: str = '5432'):
-        self._connection = psycopg2.connect(host=host, port=port, dbname=dbname, user=user, password=password)
+    # Renders the engine specific parts of the analytics SQL.
+    dialect = PostgresDialect()
+
+    def __init__(self, dbname: str = None, user: str = None, password: str = None, host: str = 'localhost',
+                 port: str = '5432', connection=None, prepare: bool = True, engine=None):
+        self._engine = engine
+        self._pooled = connection is not None or engine is not None
+        self._prepare = prepare
+        self._cursor_ids = itertools.count()
+        self._connection = None
+        self._prepared = {}
+
+        if connection is not None:
+            self._use(connection)
+        elif engine is None:
+            self._connection = psycopg2.connect(host=host, port=port, dbname=dbname, user=user, password=password)
+
+    @classmethod
+    def from_pool(cls, engine, prepare: bool = True, lazy: bool = False) -> 'PostgresClient':
+        """
+        Creates a client that borrows a connection from a SQLAlchemy engine's pool instead of opening its own.
+        Closing the client returns the connection to the pool.
+
+        Parameters
+        ----------
+        engine : sqlalchemy.engine.Engine
+            The engine whose pool to borrow from.
+        prepare : bool
+            Whether to run queries with parameters as prepared statements - defaults to True.
+        lazy : bool
+            Whether to wait until the first query to borrow the connection, e.g. for callers that may end up reusing
+            another caller's result without querying at all.
+
+        Returns
+        -------
+        PostgresClient
+            The Postgres DB client.
+
+        """
+        if lazy:
+            return cls(engine=engine, prepare=prepare)
+
+        return cls(connection=_borrow(engine), prepare=prepare)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def __del__(self):
         # Close the connection for the user if they forgot to.
         try:
-            self._connection.close()
+            self.close()
         except Exception as e:
             logging.critical(f'ERROR: {str(e)}')
 
-    def query_all(self, sql: str) -> list:
+    def query_all(self, sql: str, params: Union[tuple, dict] = None) -> list:
         """
         Performs the SQL query and returns all rows in an associative format.
+        Queries with parameters are run as prepared statements that are reused for the lifetime of the connection.
 
         Parameters
         ----------
         sql : str
-            The query to perform.
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
 
         Returns
         -------
@@ -48,28 +181,96 @@ class PostgresClient:
             A list of dictionaries with the info per row.
 
         """
-        cursor = self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        values = None
+        return self._execute(sql, params, lambda cursor: cursor.fetchall())
+
+    def query_iter(self, sql: str, params: Union[tuple, dict] = None, itersize: int = 2000, named: bool = False):
+        """
+        Performs the SQL query with a server-side cursor and yields its rows as they arrive.
+        Only itersize rows are held in memory at a time, so large results can be processed in constant memory.
+        Postgres can't declare a cursor over a prepared statement, so these queries are planned on every call.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+        itersize : int
+            The number of rows to fetch from the server per round trip.
+        named : bool
+            Whether to yield named tuples instead of plain tuples.
+
+        Returns
+        -------
+        Iterator[tuple]
+            The rows of the result.
+
+        """
+        for batch in self.query_batches(sql, params, size=itersize, named=named):
+            yield from batch
+
+    def query_batches(self, sql: str, params: Union[tuple, dict] = None, size: int = 2000, named: bool = False):
+        """
+        Performs the SQL query with a server-side cursor and yields its rows a batch at a time, e.g. for building
+        columnar batches. Only one batch is held in memory at a time.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+        size : int
+            The number of rows per batch, each fetched in one round trip.
+        named : bool
+            Whether to yield named tuples instead of plain tuples.
+
+        Returns
+        -------
+        Iterator[list]
+            Lists of up to size rows of the result.
+
+        """
+        cursor_factory = psycopg2.extras.NamedTupleCursor if named else None
+        cursor = self._connect().cursor(name=f'stream_{next(self._cursor_ids)}', cursor_factory=cursor_factory)
+        statement = _describe(sql)
+        rows = 0
 
         try:
-            cursor.execute(sql)
-            values = cursor.fetchall()
+            with timed(QUERY_SECONDS, 'db', statement=statement):
+                cursor.execute(sql, params)
+
+                while True:
+                    batch = cursor.fetchmany(size)
+
+                    if not batch:
+                        break
+
+                    rows += len(batch)
+                    yield batch
+
+            QUERY_ROWS.observe(rows, statement=statement)
         except Exception as e:
             logging.critical(f'ERROR: {str(e)}')
+            # Leave the connection usable for the next query, unless the server dropped it.
+            if not self._connection.closed:
+                self._connection.rollback()
             raise e
         finally:
-            cursor.close()
+            if not cursor.closed and not self._connection.closed:
+                cursor.close()
 
-        return values
-
-    def query_one(self, sql: str) -> dict:
+    def query_one(self, sql: str, params: Union[tuple, dict] = None) -> dict:
         """
         Performs the SQL query and returns one row in an associative format.
+        Queries with parameters are run as prepared statements that are reused for the lifetime of the connection.
 
         Parameters
         ----------
         sql : str
-            The query to perform.
+            The query to perform, with %s or %(name)s placeholders for any parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
 
         Returns
         -------
@@ -77,27 +278,207 @@ class PostgresClient:
             A dictionary with the info of the first row.
 
         """
-        cursor = self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return self._execute(sql, params, lambda cursor: cursor.fetchone())
+
+    def _execute(self, sql: str, params: Union[tuple, dict], fetch: Callable) -> Any:
+        """
+        Performs the SQL query, preparing it first if it has parameters and hasn't been prepared on this connection.
+
+        Parameters
+        ----------
+        sql : str
+            The query to perform.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+        fetch : Callable
+            Gets the result from the cursor.
+
+        Returns
+        -------
+        Any
+            The result of fetch.
+
+        """
+        cursor = self._connect().cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         values = None
+        statement = _describe(sql)
 
         try:
-            cursor.execute(sql)
-            values = cursor.fetchone()
+            with timed(QUERY_SECONDS, 'db', statement=statement):
+                if params is None or not self._prepare:
+                    cursor.execute(sql, params)
+                else:
+                    name, arguments, parameters = self._prepared_statement(cursor, sql, params)
+                    cursor.execute(f'EXECUTE {name}{arguments}', parameters)
+
+                values = fetch(cursor)
+
+            QUERY_ROWS.observe(max(cursor.rowcount, 0), statement=statement)
         except Exception as e:
             logging.critical(f'ERROR: {str(e)}')
+            # Leave the connection usable for the next query, unless the server dropped it.
+            if not self._connection.closed:
+                self._connection.rollback()
+
+            if isinstance(e, psycopg2.errors.InvalidSqlStatementName):
+                self._prepared.clear()  # The session was reset, so prepare everything again next time.
+
             raise e
         finally:
             cursor.close()
 
         return values
 
+    def _prepared_statement(self, cursor, sql: str, params: Union[tuple, dict]) -> tuple:
+        """
+        Gets the name of the query's prepared statement, preparing it if this connection hasn't yet.
+
+        Parameters
+        ----------
+        cursor : cursor
+            The cursor to prepare the statement with.
+        sql : str
+            The query, with %s or %(name)s placeholders for its parameters.
+        params : Union[tuple, dict]
+            The values of the query's parameters.
+
+        Returns
+        -------
+        tuple
+            The statement name, the argument list to execute it with and the values for that argument list.
+
+        """
+        prepared = self._prepared.get(sql)
+
+        if prepared is None:
+            keys = []
+            positions = itertools.count()
+
+            def number(match):
+                if match.group(0) == '%%':
+                    return '%'
+
+                # Named parameters used more than once share a single statement parameter.
+                key = match.group(1) or next(positions)
+
+                if key not in keys:
+                    keys.append(key)
+
+                return f'${keys.index(key) + 1}'
+
+            name = f'statement_{_statement_id(sql)}'
+            cursor.execute(f'PREPARE {name} AS {_PLACEHOLDER.sub(number, sql)}')
+            prepared = self._prepared[sql] = (name, keys)
+
+        name, keys = prepared
+        values = [params[key] for key in keys]
+        arguments = f"({', '.join(['%s'] * len(values))})" if values else ''
+
+        return name, arguments, values
+
+    def commit(self):
+        """
+        Commits the connection's open transaction, if any, so it isn't left idle in transaction.
+        Session-level state such as advisory locks and prepared statements is kept.
+
+        Returns
+        -------
+        None
+
+        """
+        if self._connection is not None:
+            self._connection.commit()
+
+    def _connect(self):
+        # Lazily created clients borrow their connection on the first query.
+        if self._connection is None and self._engine is not None:
+            self._use(_borrow(self._engine))
+
+        return self._connection
+
+    def _use(self, connection):
+        self._connection = connection
+
+        # Prepared statements belong to the server session, so pooled connections keep theirs between borrowers.
+        self._prepared = connection.info.setdefault('prepared_statements', {})
+
     def close(self):
         """
-        Closes the database connection.
+        Closes the database connection, or returns it to the pool it was borrowed from.
 
         Returns
         -------
         None
 
         """
+        if self._connection is None:
+            return
+
+        # A connection the server dropped has no state left to clean up, so discard it rather than return it.
+        if self._pooled and self._connection.closed:
+            self._connection.invalidate()
+            self._connection = None
+            return
+
+        if self._pooled:
+            # Don't let session-level state such as advisory locks leak to the connection's next borrower.
+            self._connection.rollback()
+            cursor = self._connection.cursor()
+            cursor.execute('SELECT pg_advisory_unlock_all()')
+            cursor.close()
+            self._connection.commit()
+
         self._connection.close()
+        self._connection = None
+
+
+def _borrow(engine):
+    """
+    Borrows a DB-API connection from the engine's pool, recording how long it took.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        The engine whose pool to borrow from.
+
+    Returns
+    -------
+    Any
+        The pooled connection.
+
+    """
+    start = time.perf_counter()
+    connection = engine.raw_connection()
+    wait = time.perf_counter() - start
+    pool_stats.record_checkout(wait=wait)
+    POOL_WAIT_SECONDS.observe(wait)
+
+    return connection
+
+
+def _statement_id(sql: str) -> str:
+    return hashlib.md5(sql.encode()).hexdigest()[:16]
+
+
+def _describe(sql: str) -> str:
+    """
+    Gets the metrics label of the query, publishing the SQL it stands for the first time it's seen.
+
+    Parameters
+    ----------
+    sql : str
+        The query.
+
+    Returns
+    -------
+    str
+        The statement label.
+
+    """
+    statement = _statement_id(sql)
+
+    if statement not in _described:
+        STATEMENTS.set(1, statement=statement, sql=' '.join(sql.split()))
+        _described.add(statement)
+
+    return statement
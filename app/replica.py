@@ -0,0 +1,99 @@
+import logging
+
+import psycopg2
+import sqlalchemy.exc
+from flask import current_app
+
+from app import database
+from app.metrics import ANALYTICS_READS
+from app.models import Account
+from app.psql import PostgresClient
+
+# The name of the optional read replica in SQLALCHEMY_BINDS.
+REPLICA = 'replica'
+
+
+def replica_engine():
+    """
+    Gets the engine of the read replica, if one is configured.
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine
+        The replica's engine, or None.
+
+    """
+    if REPLICA not in (current_app.config['SQLALCHEMY_BINDS'] or {}):
+        return None
+
+    return database.get_engine(current_app, bind=REPLICA)
+
+
+def analytics_client(user: Account) -> PostgresClient:
+    """
+    Borrows a client for analyzing the user's data.
+    Reads go to the replica when one is configured and it has replayed the user's last sync, so users always see
+    their own writes. Otherwise they fall back to the primary, including while the replica is unreachable.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object, loaded from the primary.
+
+    Returns
+    -------
+    PostgresClient
+        The Postgres DB client.
+
+    """
+    engine = replica_engine()
+
+    if engine is not None:
+        client = None
+
+        try:
+            client = PostgresClient.from_pool(engine)
+
+            if is_caught_up(client, user.synced_lsn):
+                ANALYTICS_READS.inc(target='replica')
+                return client
+
+            client.close()
+            ANALYTICS_READS.inc(target='primary_lagging')
+        except (psycopg2.OperationalError, sqlalchemy.exc.OperationalError):
+            # The replica is optional, so an outage or failover only costs the primary some extra reads.
+            logging.warning('The read replica is unavailable, reading from the primary.', exc_info=True)
+            ANALYTICS_READS.inc(target='replica_error')
+
+            if client is not None:
+                client.close()
+    else:
+        ANALYTICS_READS.inc(target='primary')
+
+    return PostgresClient.from_pool(database.engine)
+
+
+def is_caught_up(client: PostgresClient, lsn: str) -> bool:
+    """
+    Checks whether the server has replayed the primary's WAL up to the position.
+
+    Parameters
+    ----------
+    client : PostgresClient
+        A client connected to the server.
+    lsn : str
+        The primary's WAL position, e.g. 0/16B3748 - None if there's nothing to wait for.
+
+    Returns
+    -------
+    bool
+        True if the server has the data written up to the position, or isn't a replica.
+
+    """
+    if lsn is None:
+        return True
+
+    return client.query_one(
+        "SELECT NOT pg_is_in_recovery() OR pg_last_wal_replay_lsn() >= %(lsn)s::PG_LSN AS caught_up",
+        {'lsn': lsn}
+    )['caught_up']
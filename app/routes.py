@@ -1,26 +1,261 @@
-from flask import render_template, redirect, url_for, flash
+import queue
 
-from app import app
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, session, abort, jsonify, request, \
+    Response, stream_with_context
+
+from app import database
 from app.forms import AuthenticationForm
-from .analyzer import Analyzer
-from .psql import PostgresClient
-from .wanikani import WaniKaniClient
+from app.metrics import registry
+from app.models import Account, SyncJob
+from app.progress import broadcaster, FINISHED
+from app.serialization import dumps
+from app.streaming import render_streamed
+from . import jobs
+
+main = Blueprint('main', __name__)
+
+# Bounds for the number of highest and lowest values a client can ask for.
+MAX_TOP = 100
+
+# The most bins a review forecast can have, e.g. two weeks of hours.
+MAX_FORECAST_BINS = 24 * 14
+
+# The default number of bins of each forecast unit.
+FORECAST_BINS = {
+    'hour': 24,
+    'day': 14
+}
 
+# The number of seconds between keep-alive comments on an idle progress stream.
+KEEP_ALIVE_INTERVAL = 15
 
-@app.route('/', methods=['GET', 'POST'])
+
+@main.route('/', methods=['GET', 'POST'])
 def index():
     form = AuthenticationForm()
 
     if form.validate_on_submit():
-        client = WaniKaniClient(form.api_key.data)
-        db = PostgresClient(dbname='postgres', user='postgres', password='postgres')
-        analyzer = Analyzer(wanikani=client, db=db)
-        info = analyzer.analyze_user_info()
+        job_id = jobs.enqueue(form.api_key.data)
+
+        # Only the session that submitted a job gets to see its result.
+        session['jobs'] = session.get('jobs', [])[-9:] + [job_id]
+
+        return redirect(url_for('.job', job_id=job_id))
+
+    return render_template('index.html', title='Home', form=form, logo=current_app.config['LOGO'])
+
+
+@main.route('/jobs/<int:job_id>')
+def job(job_id):
+    if job_id not in session.get('jobs', []):
+        abort(404)
+
+    sync_job = SyncJob.query.get_or_404(job_id)
+
+    if sync_job.status == jobs.FAILED:
+        flash(f'The analysis failed: {sync_job.error}')
+        return redirect(url_for('.index'))
+
+    if sync_job.status != jobs.DONE:
+        return render_template('job.html', title='Analyzing', job=sync_job, logo=current_app.config['LOGO'])
+
+    if sync_job.account_id not in session.get('accounts', []):
+        session['accounts'] = session.get('accounts', [])[-9:] + [sync_job.account_id]
+
+    # Just re-render everything at the job URL to circumvent people visiting a separate stats page
+    # before they even start an analysis. The page fills in each section from the section endpoints.
+    return render_streamed('overall_stats.html', cache_key=dumps(sync_job.result), title='Overall Stats',
+                           profile_pic=current_app.config['LOGO'], data=sync_job.result)
+
+
+@main.route('/jobs/<int:job_id>/progress')
+def job_progress(job_id):
+    if job_id not in session.get('jobs', []):
+        abort(404)
+
+    # Subscribe before checking the job so that a job finishing in between can't be missed.
+    updates = broadcaster.subscribe(job_id)
+    sync_job = SyncJob.query.get(job_id)
+    status = sync_job.status if sync_job else jobs.FAILED
+
+    # Give the connection back to the pool since the stream could stay open for minutes.
+    database.session.remove()
+
+    def stream():
+        try:
+            if status in FINISHED:
+                yield f"data: {dumps({'job_id': job_id, 'status': status})}\n\n"
+                return
+
+            while True:
+                try:
+                    state = updates.get(timeout=KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                yield f'data: {dumps(state)}\n\n'
+
+                if state['status'] in FINISHED:
+                    return
+        finally:
+            broadcaster.unsubscribe(job_id, updates)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@main.route('/stats/<int:account_id>/<section>')
+def section(account_id, section):
+    data = {section: _analyze(account_id, section)}
+
+    return render_streamed(f'_{section}.html', cache_key=dumps(data), data=data)
+
+
+@main.route('/api/users/<int:account_id>/<section>')
+@main.route('/api/users/<int:account_id>/<section>/<block>')
+def analysis(account_id, section, block=None):
+    if (section, block) == ('assignments', 'assignments'):
+        # One row per assignment, so stream the array from a server-side cursor rather than building it in memory.
+        user = _synced_account(account_id)
+
+        return Response(stream_with_context(_stream_assignment_durations(user)), mimetype='application/json')
+
+    return Response(dumps(_analyze(account_id, section, block)), mimetype='application/json')
+
+
+@main.route('/api/users/<int:account_id>/forecast')
+def forecast(account_id):
+    from app.analyzer import Analyzer
+    from app.replica import analytics_client
+
+    user = _synced_account(account_id)
+    unit = request.args.get('unit', 'hour')
+
+    if unit not in FORECAST_BINS:
+        abort(400)
+
+    bins = request.args.get('bins', FORECAST_BINS[unit], type=int)
+
+    if not 1 <= bins <= MAX_FORECAST_BINS:
+        abort(400)
+
+    with analytics_client(user) as db:
+        return Response(dumps(Analyzer(wanikani=None, db=db).forecast(user=user, unit=unit, bins=bins)),
+                        mimetype='application/json')
+
+
+@main.route('/api/users/<int:account_id>/leeches')
+def leeches(account_id):
+    from app.analyzer import Analyzer
+    from app.replica import analytics_client
+
+    user = _synced_account(account_id)
+    answer = request.args.get('answer', 'meaning')
+    subject_type = request.args.get('type')
+    top = request.args.get('top', 10, type=int)
+
+    if answer not in Analyzer.LEECH_ANSWERS or not 1 <= top <= MAX_TOP:
+        abort(400)
+
+    with analytics_client(user) as db:
+        return Response(dumps(Analyzer(wanikani=None, db=db).leeches(user=user, answer=answer, subject_type=subject_type,
+                                                                      top=top)),
+                        mimetype='application/json')
+
+
+@main.route('/status')
+def status():
+    from app.prewarm import prewarm_stats
+    from app.psql import pool_stats
+
+    return jsonify(queue=jobs.queue_stats(), pool=pool_stats.report(database.engine), prewarm=prewarm_stats())
+
+
+@main.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _analyze(account_id: int, section: str, block: str = None):
+    """
+    Analyzes a section of an account the current session has synced.
+
+    Parameters
+    ----------
+    account_id : int
+        The account ID.
+    section : str
+        One of the keys of Analyzer.SECTIONS.
+    block : str
+        One of the section's blocks - defaults to the whole section.
+
+    Returns
+    -------
+    Union[dict, list]
+        The result of the analysis in JSON format.
+
+    """
+    from app.analyzer import Analyzer
+    from app.replica import analytics_client
+
+    user = _synced_account(account_id)
+
+    if section not in Analyzer.SECTIONS or (block is not None and block not in Analyzer.SECTIONS[section]):
+        abort(404)
+
+    top = request.args.get('top', 3, type=int)
+
+    if not 1 <= top <= MAX_TOP:
+        abort(400)
+
+    with analytics_client(user) as db:
+        return Analyzer(wanikani=None, db=db).analyze(user=user, section=section, block=block, top=top)
+
+
+def _synced_account(account_id: int) -> Account:
+    """
+    Gets an account the current session has synced.
+
+    Parameters
+    ----------
+    account_id : int
+        The account ID.
+
+    Returns
+    -------
+    Account
+        The account's ORM object.
+
+    """
+    if account_id not in session.get('accounts', []):
+        abort(404)
+
+    return Account.query.get_or_404(account_id)
+
+
+def _stream_assignment_durations(user: Account):
+    """
+    Streams the durations of each of the user's assignments as a JSON array.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object.
+
+    Returns
+    -------
+    Iterator[str]
+        Chunks of the JSON array.
+
+    """
+    from app.analyzer import Analyzer
+    from app.replica import analytics_client
+
+    with analytics_client(user) as db:
+        yield '['
 
-        form.api_key.data = ''
+        for i, row in enumerate(Analyzer(wanikani=None, db=db).iter_assignment_durations(user=user)):
+            yield f"{',' if i else ''}{dumps(row)}"
 
-        # Just re-render everything at the base URL to circumvent people visiting a separate stats page
-        # before they even start an analysis.
-        return render_template('overall_stats.html', title='Overall Stats', profile_pic=app.config['LOGO'], data=info)
+        yield ']'
 
-    return render_template('index.html', title='Home', form=form, logo=app.config['LOGO'])
@@ -0,0 +1,59 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+# orjson is an optional dependency that serializes several times faster than the standard library.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data) -> str:
+    """
+    Serializes analysis results to JSON.
+    Handles the Decimal and datetime values that come back from RealDictCursor.
+
+    Parameters
+    ----------
+    data : Any
+        The data to serialize.
+
+    Returns
+    -------
+    str
+        The JSON string.
+
+    """
+    if orjson:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    return json.dumps(data, default=_default, separators=(',', ':'))
+
+
+def to_json(data):
+    """
+    Converts analysis results into plain JSON types, e.g. for storing in a JSON column.
+
+    Parameters
+    ----------
+    data : Any
+        The data to convert.
+
+    Returns
+    -------
+    Any
+        The data with only JSON types.
+
+    """
+    return json.loads(dumps(data))
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import Response, current_app, request, session, stream_with_context
+
+from app.metrics import RENDER_SECONDS
+
+# brotli is an optional dependency - responses fall back to gzip without it.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The number of template events Jinja buffers before a chunk is sent, trading flush frequency for overhead.
+STREAM_BUFFER = 5
+
+
+class RenderCache:
+    """
+    A small LRU cache of compressed renders, keyed by the template, its data and the content encoding.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the cached renders.
+    """
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            body = self._entries.get(key)
+
+            if body is not None:
+                self._entries.move_to_end(key)
+
+            return body
+
+    def put(self, key: str, body: bytes):
+        if len(body) > self._max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self._entries[key] = body
+            self._size += len(body)
+
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+def render_streamed(template_name: str, cache_key: str = None, **context) -> Response:
+    """
+    Renders a template as a stream, so the start of the page is sent while the rest is still rendering,
+    and compresses it with the best encoding the client accepts.
+
+    Parameters
+    ----------
+    template_name : str
+        The template to render.
+    cache_key : str
+        Optionally identifies the data the template is rendered with.
+        Renders with the same template and cache key are served from the compressed render cache.
+    context : Any
+        The template context.
+
+    Returns
+    -------
+    Response
+        The streamed response.
+
+    """
+    encoding = _negotiate_encoding()
+    key = None
+
+    # Pages with flashed messages are specific to the session, so they're never cached.
+    if cache_key is not None and not session.get('_flashes'):
+        key = hashlib.sha256(f'{template_name}\0{cache_key}\0{encoding}'.encode()).hexdigest()
+        body = current_app.extensions['render_cache'].get(key)
+
+        if body is not None:
+            return _response(body, encoding)
+
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+
+    return _response(stream_with_context(_compress(stream, encoding, key, template_name)), encoding)
+
+
+def _negotiate_encoding() -> str:
+    if brotli and 'br' in request.accept_encodings:
+        return 'br'
+
+    if 'gzip' in request.accept_encodings:
+        return 'gzip'
+
+    return 'identity'
+
+
+def _compress(chunks, encoding: str, key: str, template_name: str):
+    """
+    Compresses the chunks as they're generated, flushing after each one so the client can start rendering,
+    then caches the compressed output.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        compress = lambda chunk: compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 selects the gzip container.
+        compress = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    else:
+        compress = lambda chunk: chunk
+        finish = lambda: b''
+
+    output = []
+    start = time.perf_counter()
+
+    for chunk in chunks:
+        data = compress(chunk.encode())
+        output.append(data)
+        yield data
+
+    data = finish()
+    output.append(data)
+    yield data
+
+    RENDER_SECONDS.observe(time.perf_counter() - start, template=template_name)
+
+    if key is not None:
+        current_app.extensions['render_cache'].put(key, b''.join(output))
+
+
+def _response(body, encoding: str) -> Response:
+    response = Response(body, mimetype='text/html')
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+
+    return response
+
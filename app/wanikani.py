@@ -1,5 +1,10 @@
+import time
+from urllib.parse import urlparse
+
 import requests
 
+from app.metrics import WANIKANI_RATE_LIMIT_SECONDS, WANIKANI_REQUEST_SECONDS, timed
+
 # The ISO-8601 datetime format used by WaniKani.
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
@@ -13,13 +18,59 @@ class WaniKaniClient:
     ----------
     api_key : str
         The API key to be used to query for info - preferably read-only.
+    on_rate_limit : Callable
+        Optionally called with the number of seconds the client is about to wait for the rate limit to reset.
+    limiter : RateLimiter
+        Optionally paces the requests under a rate limit shared with other clients, e.g. in a batch.
     """
     API_URI = 'https://api.wanikani.com/v2/'
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, on_rate_limit=None, limiter=None):
         self.__auth_header = {
             'Authorization': f'Bearer {api_key}'
         }
+        self._on_rate_limit = on_rate_limit
+        self._limiter = limiter
+        self.requests = 0  # The number of requests sent, including rate limited ones.
+
+    def _get(self, session, url: str) -> requests.Response:
+        """
+        Sends a GET request, waiting out the rate limit and retrying whenever it's hit.
+
+        Parameters
+        ----------
+        session : requests.Session
+            The session to send the request with.
+        url : str
+            The full URI to send the GET request to.
+
+        Returns
+        -------
+        requests.Response
+            The successful response.
+
+        """
+        with timed(WANIKANI_REQUEST_SECONDS, 'wanikani', endpoint=urlparse(url).path.rsplit('/', 1)[-1]):
+            while True:
+                if self._limiter:
+                    self._limiter.acquire()
+
+                response = session.get(url=url, headers=self.__auth_header)
+                self.requests += 1
+
+                if response.status_code != 429:
+                    response.raise_for_status()
+                    return response
+
+                # WaniKani sends the epoch time the rate limit window resets at.
+                reset = response.headers.get('RateLimit-Reset')
+                wait = max(float(reset) - time.time(), 1) if reset else 60
+
+                if self._on_rate_limit:
+                    self._on_rate_limit(wait)
+
+                WANIKANI_RATE_LIMIT_SECONDS.inc(wait)
+                time.sleep(wait)
 
     def _perform_paginated_get_request(self, endpoint: str) -> dict:
         """
@@ -37,16 +88,11 @@ class WaniKaniClient:
 
         """
         session = requests.Session()
-        response = session.get(url=endpoint, headers=self.__auth_header)
-        response.raise_for_status()
-
-        page = response.json()
+        page = self._get(session, endpoint).json()
         yield page
 
         while page['pages']['next_url'] is not None:
-            response = session.get(url=page['pages']['next_url'], headers=self.__auth_header)
-            response.raise_for_status()
-            page = response.json()
+            page = self._get(session, page['pages']['next_url']).json()
             yield page
 
     def get_user(self) -> dict:
@@ -59,10 +105,7 @@ class WaniKaniClient:
             A JSON response containing the user info.
 
         """
-        response = requests.get(url=WaniKaniClient.API_URI + 'user', headers=self.__auth_header)
-        response.raise_for_status()
-
-        user = response.json()
+        user = self._get(requests, WaniKaniClient.API_URI + 'user').json()
 
         return user['data']
 
@@ -112,11 +155,7 @@ class WaniKaniClient:
             The JSON response for the current page of SRS stage info.
 
         """
-        session = requests.Session()
-        response = session.get(url=WaniKaniClient.API_URI + 'srs_stages', headers=self.__auth_header)
-        response.raise_for_status()
-
-        return response.json()
+        return self._get(requests.Session(), WaniKaniClient.API_URI + 'srs_stages').json()
 
     def get_reviews(self) -> dict:
         """
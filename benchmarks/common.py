@@ -0,0 +1,141 @@
+"""
+Shared helpers for the benchmark and regression scripts.
+
+Every script in this package is destructive: point DATABASE_URL at a scratch database before running them.
+"""
+from app import database
+from app.models import Account
+from app.psql import PostgresClient
+
+TRUNCATE_SQL = "TRUNCATE review, assignment, level_progression, account, subject, stage RESTART IDENTITY CASCADE"
+
+# Tables are seeded with set-based SQL rather than through the ORM so that millions of rows take seconds.
+SEED_SQL = (
+    TRUNCATE_SQL,
+    "INSERT INTO stage (id, name) "
+    "SELECT g, 'Stage ' || g FROM generate_series(0, 9) g",
+    "INSERT INTO subject (id, level, type, characters) "
+    "SELECT g, 1 + MOD(g, 60), (ARRAY['radical', 'kanji', 'vocabulary'])[1 + MOD(g, 3)], 'S' || g "
+    "FROM generate_series(1, %(subjects)s) g",
+    "INSERT INTO account (id, level, username, start_date) "
+    "SELECT u, 60, 'bench_' || u, NOW() - INTERVAL '3 years' FROM generate_series(1, %(users)s) u",
+    "SELECT setval(pg_get_serial_sequence('account', 'id'), %(users)s)",
+    "INSERT INTO level_progression (id, level, user_id, started_at, passed_at, completed_at, "
+    "pass_duration, complete_duration) "
+    "SELECT *, ABS(EXTRACT(EPOCH FROM (passed_at - started_at))), ABS(EXTRACT(EPOCH FROM (completed_at - started_at))) "
+    "FROM (SELECT (u - 1) * 100 + l, l, u, "
+    "NOW() - (60 - l) * INTERVAL '10 days' AS started_at, "
+    "NOW() - (60 - l) * INTERVAL '10 days' + random() * INTERVAL '9 days' AS passed_at, "
+    "CASE WHEN l < 60 THEN NOW() - (59 - l) * INTERVAL '10 days' END AS completed_at "
+    "FROM generate_series(1, %(users)s) u, generate_series(1, %(levels)s) l) p",
+    "INSERT INTO assignment (id, user_id, started_at, passed_at, burned_at, srs_stage, subject_id, "
+    "pass_duration, complete_duration) "
+    "SELECT *, ABS(EXTRACT(EPOCH FROM (passed_at - started_at))), ABS(EXTRACT(EPOCH FROM (burned_at - started_at))) "
+    "FROM (SELECT (u - 1) * %(assignments)s + a, u, started AS started_at, "
+    "started + random() * INTERVAL '30 days' AS passed_at, "
+    "CASE WHEN MOD(a, 3) = 0 THEN started + random() * INTERVAL '300 days' END AS burned_at, "
+    "MOD(a, 10), 1 + MOD(a - 1, %(subjects)s) "
+    "FROM generate_series(1, %(users)s) u, generate_series(1, %(assignments)s) a, "
+    "LATERAL (SELECT NOW() - INTERVAL '3 years' + random() * INTERVAL '2 years' AS started) s) p",
+    "INSERT INTO review (id, user_id, assignment_id, starting_srs_stage, ending_srs_stage, "
+    "incorrect_meaning_answers, incorrect_reading_answers) "
+    "SELECT (u - 1) * %(reviews)s + r, u, (u - 1) * %(assignments)s + 1 + MOD(r, %(assignments)s), "
+    "1 + MOD(r, 8), 1 + MOD(r + 1, 9), (random() * random() * 3)::INT, (random() * random() * 4)::INT "
+    "FROM generate_series(1, %(users)s) u, generate_series(1, %(reviews)s) r",
+    "INSERT INTO subject_accuracy (user_id, subject_id, reviews, incorrect_meaning_answers, "
+    "incorrect_reading_answers, last_stage_change) "
+    "SELECT a.user_id, a.subject_id, COUNT(*), SUM(r.incorrect_meaning_answers), SUM(r.incorrect_reading_answers), "
+    "(ARRAY_AGG(r.ending_srs_stage - r.starting_srs_stage ORDER BY r.id DESC))[1] "
+    "FROM assignment a JOIN review r ON r.user_id = a.user_id AND r.assignment_id = a.id "
+    "GROUP BY a.user_id, a.subject_id",
+    "ANALYZE",
+)
+
+
+def seed(users: int, levels: int = 60, assignments: int = 2000, reviews: int = 20000, subjects: int = 9000):
+    """
+    Replaces the contents of every table with a synthetic dataset of the requested size.
+
+    Parameters
+    ----------
+    users : int
+        The number of accounts to create.
+    levels : int
+        The number of level progressions per account.
+    assignments : int
+        The number of assignments per account - capped by the number of subjects.
+    reviews : int
+        The number of reviews per account.
+    subjects : int
+        The number of shared subjects.
+
+    Returns
+    -------
+    None
+
+    """
+    params = {
+        'users': users,
+        'levels': levels,
+        'assignments': min(assignments, subjects),
+        'reviews': reviews,
+        'subjects': subjects
+    }
+
+    # End the session's transaction first, otherwise its table locks would block the TRUNCATE.
+    database.session.remove()
+
+    # ANALYZE can't run inside a transaction block, so go through a raw autocommit connection.
+    connection = database.engine.raw_connection()
+
+    try:
+        connection.connection.autocommit = True
+        cursor = connection.cursor()
+
+        for statement in SEED_SQL:
+            cursor.execute(statement, params)
+
+        cursor.close()
+    finally:
+        connection.connection.autocommit = False
+        connection.close()
+
+
+def reset():
+    """
+    Empties every table, for scripts that fill them through the ingest instead of seed().
+
+    Returns
+    -------
+    None
+
+    """
+    database.session.remove()
+    database.session.execute(database.text(TRUNCATE_SQL))
+    database.session.commit()
+
+
+def first_account() -> Account:
+    """
+    Gets the first seeded account, which is the one the scripts analyze.
+
+    Returns
+    -------
+    Account
+        The account's ORM object.
+
+    """
+    return Account.query.order_by(Account.id).first()
+
+
+def postgres_client() -> PostgresClient:
+    """
+    Creates a PostgresClient that borrows a connection from the ORM's pool.
+
+    Returns
+    -------
+    PostgresClient
+        The Postgres DB client.
+
+    """
+    return PostgresClient.from_pool(database.engine)
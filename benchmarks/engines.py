@@ -0,0 +1,179 @@
+"""
+Analytics latency on Postgres versus the embedded DuckDB backend.
+
+Seeds a synthetic multi-user dataset, exports the first account's rows to Parquet and loads them into an in-memory
+DuckDB database, the way a single-user setup would. Every analysis section, the review forecast and the leech list
+are then timed on both engines, and their results are compared so a dialect difference can't go unnoticed.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.engines [--users 50] [--reviews 20000] [--repeat 20]
+       [--output engines.json]
+"""
+import argparse
+import json
+import math
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from app import create_app
+from app.analyzer import Analyzer
+from app.embedded import DuckDBClient
+from app.export import export_tables
+from app.serialization import to_json
+from benchmarks.common import seed, first_account, postgres_client
+from benchmarks.suite import percentiles
+
+
+def workloads(analyzer: Analyzer, user) -> dict:
+    """
+    Gets the analyses to time.
+
+    Parameters
+    ----------
+    analyzer : Analyzer
+        The analyzer to run them with.
+    user : Account
+        The user's Account ORM object.
+
+    Returns
+    -------
+    dict
+        Functions that run each analysis, by name.
+
+    """
+    # Fixed, so both engines forecast the same window.
+    now = datetime(2026, 1, 1)
+    analyses = {section: (lambda section=section: analyzer.analyze(user=user, section=section))
+                for section in Analyzer.SECTIONS}
+    analyses['forecast'] = lambda: analyzer.forecast(user=user, unit='day', bins=14, now=now)
+    analyses['leeches'] = lambda: analyzer.leeches(user=user, answer='meaning', top=10)
+
+    return analyses
+
+
+def run(db, user, repeat: int) -> tuple:
+    """
+    Times every analysis on one engine.
+
+    Parameters
+    ----------
+    db : Union[PostgresClient, DuckDBClient]
+        The engine's client.
+    user : Account
+        The user's Account ORM object.
+    repeat : int
+        The number of timed runs per analysis.
+
+    Returns
+    -------
+    tuple
+        The latency percentiles and the last result of each analysis.
+
+    """
+    analyzer = Analyzer(wanikani=None, db=db)
+    latencies = {}
+    results = {}
+
+    for name, analysis in workloads(analyzer, user).items():
+        results[name] = analysis()  # Warm the caches and prepared statements.
+        samples = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analysis()
+            samples.append(time.perf_counter() - start)
+
+        latencies[name] = percentiles(samples)
+
+    return latencies, results
+
+
+def differences(postgres, duckdb, path: str = '') -> list:
+    """
+    Compares the results of the two engines, ignoring row order and floating point noise.
+
+    Parameters
+    ----------
+    postgres : Any
+        A result from Postgres, in JSON format.
+    duckdb : Any
+        The same result from DuckDB.
+    path : str
+        Where in the result the values are.
+
+    Returns
+    -------
+    list
+        The paths where the results differ.
+
+    """
+    if isinstance(postgres, dict) and isinstance(duckdb, dict):
+        if postgres.keys() != duckdb.keys():
+            return [f'{path}: keys {sorted(postgres)} != {sorted(duckdb)}']
+
+        return [difference for key in postgres for difference in differences(postgres[key], duckdb[key], f'{path}/{key}')]
+
+    if isinstance(postgres, list) and isinstance(duckdb, list):
+        if len(postgres) != len(duckdb):
+            return [f'{path}: {len(postgres)} != {len(duckdb)} rows']
+
+        # Rows with equal sort keys can come back in either order.
+        def order(rows):
+            return sorted(rows, key=lambda row: json.dumps(row, sort_keys=True, default=str))
+
+        return [difference for index, (left, right) in enumerate(zip(order(postgres), order(duckdb)))
+                for difference in differences(left, right, f'{path}[{index}]')]
+
+    if isinstance(postgres, (int, float)) and isinstance(duckdb, (int, float)):
+        return [] if math.isclose(postgres, duckdb, rel_tol=1e-6, abs_tol=1e-6) else [f'{path}: {postgres} != {duckdb}']
+
+    return [] if postgres == duckdb else [f'{path}: {postgres!r} != {duckdb!r}']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50, help='number of synthetic accounts to seed')
+    parser.add_argument('--assignments', type=int, default=2000, help='assignments per account')
+    parser.add_argument('--reviews', type=int, default=20000, help='reviews per account')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per analysis and engine')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        if not args.skip_seed:
+            seed(users=args.users, assignments=args.assignments, reviews=args.reviews)
+
+        user = first_account()
+
+        with postgres_client() as db:
+            postgres, postgres_results = run(db, user, repeat=args.repeat)
+
+            with tempfile.TemporaryDirectory() as directory:
+                export_tables(db, directory, user_id=user.id)
+
+                with DuckDBClient.from_export(directory) as embedded:
+                    duckdb, duckdb_results = run(embedded, user, repeat=args.repeat)
+
+    print(f"{'analysis':<20} | {'postgres p50':>12} | {'duckdb p50':>10} | {'speedup':>7}")
+
+    for name in postgres:
+        speedup = postgres[name]['p50_ms'] / duckdb[name]['p50_ms']
+        print(f"{name:<20} | {postgres[name]['p50_ms']:>9.2f} ms | {duckdb[name]['p50_ms']:>7.2f} ms | {speedup:>6.1f}x")
+
+    # Convert to JSON types so Decimals, floats and datetimes compare the way the API serves them.
+    mismatches = differences(to_json(postgres_results), to_json(duckdb_results))
+
+    for mismatch in mismatches:
+        print(f'MISMATCH {mismatch}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'postgres': postgres, 'duckdb': duckdb, 'mismatches': mismatches}, file, indent=2)
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Import-time benchmark for creating the app.
+
+Runs `python -X importtime` on a fresh interpreter that creates the app, repeatedly, and reports the median total
+import time along with the slowest modules. The analysis and ingest stack (and Alembic) should only be imported
+with PRELOAD set, so the script exits with a non-zero status if any of them are imported without it,
+or if the median total goes over the budget.
+
+Usage: python -m benchmarks.import_time [--repeat 5] [--budget-ms 1500] [--preload]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules a plain web or worker process shouldn't pay for until a request needs them.
+LAZY_MODULES = ('alembic', 'psycopg2', 'requests', 'app.analyzer', 'app.psql', 'app.wanikani')
+
+CREATE_APP = 'from app import create_app; create_app()'
+
+
+def import_times(preload: bool) -> dict:
+    """
+    Creates the app in a fresh interpreter and parses its import times.
+
+    Parameters
+    ----------
+    preload : bool
+        Whether to create the app with PRELOAD set.
+
+    Returns
+    -------
+    dict
+        The self and cumulative import time in microseconds of each module, by module name.
+
+    """
+    environment = dict(os.environ, PRELOAD='1' if preload else '')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CREATE_APP],
+        env=environment, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, check=True
+    )
+    modules = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = {'self_us': int(own), 'cumulative_us': int(cumulative), 'top_level': name[1:3] != '  '}
+
+    return modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters to measure')
+    parser.add_argument('--budget-ms', type=float, help='maximum median total import time')
+    parser.add_argument('--preload', action='store_true', help='create the app with PRELOAD set')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    runs = [import_times(preload=args.preload) for _ in range(args.repeat)]
+    totals = [sum(module['cumulative_us'] for module in run.values() if module['top_level']) / 1000 for run in runs]
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1]['self_us'], reverse=True)[:args.top]
+    failures = []
+
+    for name, module in slowest:
+        print(f"{module['self_us'] / 1000:>8.2f} ms self | {module['cumulative_us'] / 1000:>8.2f} ms cumulative | {name}")
+
+    print(f'\nMedian total import time: {statistics.median(totals):.1f} ms over {args.repeat} runs')
+
+    if not args.preload:
+        failures += [f'{name} is imported when the app is created' for name in LAZY_MODULES if name in runs[-1]]
+
+    if args.budget_ms is not None and statistics.median(totals) > args.budget_ms:
+        failures.append(f'Median total of {statistics.median(totals):.1f} ms is over the budget of {args.budget_ms} ms')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'preload': args.preload, 'totals_ms': totals, 'modules': runs[-1]}, file, indent=2)
+
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Memory regression check for the ingest.
+
+Syncs one synthetic account per review count, each in a fresh interpreter, and records the peak RSS of the process.
+Ingest writes rows in bounded batches, so the peak shouldn't grow with the size of the account's history: the script
+exits with a non-zero status if the largest account's peak is more than --tolerance-mib above the smallest's.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.ingest_memory [--reviews 20000 80000 320000]
+       [--tolerance-mib 16] [--batch-size 2000]
+"""
+import argparse
+import contextlib
+import os
+import resource
+import subprocess
+import sys
+
+
+def peak_rss(reviews: int, batch_size: int) -> float:
+    """
+    Syncs a synthetic account in a fresh interpreter.
+
+    Parameters
+    ----------
+    reviews : int
+        The number of reviews the account has.
+    batch_size : int
+        The ingest batch size.
+
+    Returns
+    -------
+    float
+        The peak RSS of the interpreter in MiB.
+
+    """
+    environment = dict(os.environ, INGEST_BATCH_SIZE=str(batch_size))
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.ingest_memory', '--child', str(reviews)],
+        env=environment, stdout=subprocess.PIPE, text=True, check=True
+    )
+
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def ingest(reviews: int):
+    from app import create_app
+    from app.analyzer import Analyzer
+    from benchmarks.common import postgres_client, reset
+    from benchmarks.payloads import SyntheticWaniKaniClient
+
+    client = SyntheticWaniKaniClient(reviews=reviews)
+
+    with create_app().app_context():
+        reset()
+
+        # The ingest prints every row it writes.
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), postgres_client() as db:
+            Analyzer(wanikani=client, db=db).sync_user_info()
+
+    # Linux reports the peak in KiB.
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reviews', type=int, nargs='+', default=[20000, 80000, 320000], help='account sizes')
+    parser.add_argument('--tolerance-mib', type=float, default=16, help='allowed growth of the peak RSS')
+    parser.add_argument('--batch-size', type=int, default=2000, help='the ingest batch size')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        ingest(args.child)
+        return 0
+
+    peaks = {}
+
+    for reviews in sorted(args.reviews):
+        peaks[reviews] = peak_rss(reviews, batch_size=args.batch_size)
+        print(f'{reviews:>10} reviews | peak RSS {peaks[reviews]:>8.1f} MiB')
+
+    growth = peaks[max(peaks)] - peaks[min(peaks)]
+    print(f'\nPeak RSS grew by {growth:.1f} MiB from {min(peaks)} to {max(peaks)} reviews')
+
+    if growth > args.tolerance_mib:
+        print(f'FAIL: Peak RSS grew by more than {args.tolerance_mib} MiB', file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Per-user latency and partition pruning benchmark for the hash partitioned tables.
+
+Seeds increasingly large datasets with a fixed amount of data per user and times the analytics for one user.
+With partitioning (and the per-user indexes) the latency should stay flat as the total row count grows.
+When the tables are partitioned, every analytics query and ingest upsert is also checked to scan at most one
+partition per table, and synthetic accounts are synced through the real ingest, then re-synced to overwrite every
+row. The script exits with a non-zero status if either check fails.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.partitioning [--partition 16] [--users 10 20 40 80]
+"""
+import argparse
+import contextlib
+import io
+import json
+import re
+import statistics
+import sys
+import time
+
+from sqlalchemy import event, select
+
+from app import create_app, database
+from app.analyzer import Analyzer
+from app.partitioning import PARTITIONED_TABLES, is_partitioned, partition_tables
+from benchmarks.common import reset, seed, first_account, postgres_client
+from benchmarks.payloads import SyntheticWaniKaniClient
+from benchmarks.query_plans import capture_queries, explain, walk
+
+PARTITION_NAME = re.compile(r'^(?P<table>\w+)_p\d+$')
+
+
+def capture_ingest_upserts(user) -> list:
+    """
+    Captures the SQL of the batched upserts the ingest writes assignments and reviews with, by re-upserting one of
+    the user's existing rows of each. Nothing is changed since the rows are written back as they are.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object.
+
+    Returns
+    -------
+    list
+        The upsert SQL statements, including the lookup of the batch's existing keys.
+
+    """
+    analyzer = Analyzer(wanikani=None, db=None)
+    queries = []
+
+    def record_orm_query(conn, cursor, statement, parameters, context, executemany):
+        queries.append(cursor.mogrify(statement, parameters).decode())
+
+    rows = {}
+
+    for endpoint in ('assignments', 'reviews'):
+        table = Analyzer.INGESTED_TABLES[endpoint][0].__table__
+        row = database.session.execute(select(table).where(table.c.user_id == user.id).limit(1)).mappings().one()
+        rows[endpoint] = {column: value for column, value in row.items()
+                          if column not in ('create_date', 'modify_date')}
+
+    event.listen(database.engine, 'before_cursor_execute', record_orm_query)
+
+    try:
+        for endpoint, row in rows.items():
+            model, updated_columns = Analyzer.INGESTED_TABLES[endpoint]
+            analyzer._upsert(model, [row], ('user_id', 'id'), updated_columns)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', record_orm_query)
+        database.session.rollback()
+
+    return queries
+
+
+def scanned_partitions(plan: dict) -> dict:
+    """
+    Finds the partitions each partitioned table was scanned through.
+
+    Parameters
+    ----------
+    plan : dict
+        The root plan node in EXPLAIN's JSON format.
+
+    Returns
+    -------
+    dict
+        The scanned partition names keyed by their parent table.
+
+    """
+    partitions = {}
+
+    for node in walk(plan):
+        match = PARTITION_NAME.match(node.get('Relation Name', ''))
+
+        if match and match.group('table') in PARTITIONED_TABLES:
+            partitions.setdefault(match.group('table'), set()).add(node['Relation Name'])
+
+    return partitions
+
+
+def check_ingest(accounts: int, assignments: int, reviews: int) -> list:
+    """
+    Syncs synthetic accounts through the ingest, then rewrites them, to check that both the inserts and the
+    updates work against the partitioned tables. Empties every table first.
+
+    Parameters
+    ----------
+    accounts : int
+        The number of accounts to sync.
+    assignments : int
+        The assignments per account.
+    reviews : int
+        The reviews per account.
+
+    Returns
+    -------
+    list
+        The failures, if any.
+
+    """
+    failures = []
+    reset()
+
+    # The ingest prints every row it writes.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for account in range(1, accounts + 1):
+            client = SyntheticWaniKaniClient(account=account, assignments=assignments, reviews=reviews)
+
+            for rewrite, expected in ((False, 'inserted'), (True, 'updated')):
+                try:
+                    with postgres_client() as db:
+                        analyzer = Analyzer(wanikani=client, db=db, rewrite=rewrite)
+                        analyzer.sync_user_info()
+                except Exception as e:
+                    database.session.rollback()
+                    failures.append(f"ingest of {client.get_user()['username']} failed: {e!r}")
+                    break
+
+                for endpoint, stats in analyzer.ingest_stats.items():
+                    if stats[expected] == 0 or stats[expected] != sum(stats.values()):
+                        failures.append(f"{client.get_user()['username']} {endpoint} not all {expected}: {stats}")
+
+    return failures
+
+
+def time_analysis(user, repeat: int) -> float:
+    """
+    Times a full analysis of the user's data.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object.
+    repeat : int
+        The number of timed runs.
+
+    Returns
+    -------
+    float
+        The median latency in milliseconds.
+
+    """
+    db = postgres_client()
+    analyzer = Analyzer(wanikani=None, db=db)
+    timings = []
+
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analyzer._analyze_level_progressions(user=user)
+            analyzer._analyze_assignments(user=user)
+            analyzer._analyze_reviews(user=user)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        db.close()
+
+    return statistics.median(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 20, 40, 80], help='total accounts per run')
+    parser.add_argument('--assignments', type=int, default=2000, help='assignments per account')
+    parser.add_argument('--reviews', type=int, default=20000, help='reviews per account')
+    parser.add_argument('--partition', type=int, metavar='PARTITIONS', help='partition the tables before running')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per dataset size')
+    parser.add_argument('--ingest-accounts', type=int, default=2, help='accounts synced by the ingest check')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    failures = []
+
+    with create_app().app_context():
+        if args.partition:
+            partition_tables(partitions=args.partition)
+
+        partitioned = all(is_partitioned(table) for table in PARTITIONED_TABLES)
+        print(f"Tables are {'' if partitioned else 'not '}partitioned.\n")
+
+        for users in args.users:
+            seed(users=users, assignments=args.assignments, reviews=args.reviews)
+            user = first_account()
+            latency = time_analysis(user=user, repeat=args.repeat)
+            reviews = users * args.reviews
+
+            results.append({'users': users, 'total_reviews': reviews, 'median_ms': latency})
+            print(f'{users:>6} users | {reviews:>10} reviews | {latency:>9.2f} ms per user analysis')
+
+        if partitioned:
+            connection = database.engine.raw_connection()
+            cursor = connection.cursor()
+
+            try:
+                for sql in capture_queries(user=user) + capture_ingest_upserts(user=user):
+                    for table, partitions in scanned_partitions(explain(cursor, sql)['Plan']).items():
+                        if len(partitions) > 1:
+                            failures.append(f"{len(partitions)} {table} partitions scanned: {' '.join(sql.split())}")
+            finally:
+                cursor.close()
+                connection.close()
+
+            failures += check_ingest(accounts=args.ingest_accounts, assignments=args.assignments,
+                                     reviews=args.reviews)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'partitioned': partitioned, 'results': results}, file, indent=2)
+
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Synthetic WaniKani API payloads for driving the real ingest code without the API.
+
+SyntheticWaniKaniClient is a drop-in replacement for WaniKaniClient: it pages through generated level progressions,
+assignments, reviews, subjects and SRS stages with the same JSON shapes and page sizes as the v2 API.
+The data is deterministic for a given account number and seed, and different account numbers get disjoint IDs.
+"""
+import random
+from datetime import datetime, timedelta
+
+from app.wanikani import DATE_FORMAT
+
+# The API's page sizes per endpoint.
+PAGE_SIZES = {
+    'level_progressions': 500,
+    'assignments': 500,
+    'reviews': 1000,
+    'subjects': 1000
+}
+
+SRS_STAGE_NAMES = (
+    'Initiate', 'Apprentice I', 'Apprentice II', 'Apprentice III', 'Apprentice IV',
+    'Guru I', 'Guru II', 'Master', 'Enlightened', 'Burned'
+)
+
+SUBJECT_TYPES = ('radical', 'kanji', 'vocabulary')
+
+START = datetime(2018, 1, 1)
+
+
+class SyntheticWaniKaniClient:
+    """
+    Generates an account's WaniKani data on the fly.
+
+    Parameters
+    ----------
+    account : int
+        The account number, which determines its username and the range of its IDs.
+    levels : int
+        The number of level progressions.
+    assignments : int
+        The number of assignments - capped by the number of subjects.
+    reviews : int
+        The number of reviews.
+    subjects : int
+        The number of subjects, which are shared by every account.
+    seed : int
+        Seeds the random durations and answers.
+    """
+    def __init__(self, account: int = 1, levels: int = 60, assignments: int = 10000, reviews: int = 200000,
+                 subjects: int = 9000, seed: int = 0):
+        self.account = account
+        self.levels = levels
+        self.assignments = min(assignments, subjects)
+        self.reviews = reviews
+        self.subjects = subjects
+        self._seed = seed
+
+    @property
+    def rows(self) -> int:
+        """
+        The number of per-user rows the account's data has.
+        """
+        return self.levels + self.assignments + self.reviews
+
+    def get_user(self) -> dict:
+        return {
+            'id': f'00000000-0000-0000-0000-{self.account:012d}',
+            'username': f'synthetic_{self.account}',
+            'level': self.levels,
+            'started_at': _format(START),
+            'subscription': {'active': True, 'type': 'lifetime', 'max_level_granted': 60, 'period_ends_at': None},
+            'current_vacation_started_at': None
+        }
+
+    def get_level_progressions(self):
+        def item(number, random_):
+            started = START + timedelta(days=10 * number)
+            passed = started + timedelta(days=random_.uniform(6.8, 20))
+            completed = passed + timedelta(days=random_.uniform(10, 60)) if number < self.levels - 1 else None
+
+            return self._resource('level_progression', number, {
+                'created_at': _format(started),
+                'level': number + 1,
+                'unlocked_at': _format(started),
+                'started_at': _format(started),
+                'passed_at': _format(passed),
+                'completed_at': _format(completed),
+                'abandoned_at': None
+            })
+
+        return self._pages('level_progressions', self.levels, self._id_base(self.levels, 1000), item)
+
+    def get_assignments(self):
+        def item(number, random_):
+            subject_id = number + 1
+            stage = random_.randrange(len(SRS_STAGE_NAMES))
+            started = START + timedelta(days=random_.uniform(0, 600))
+            passed = started + timedelta(days=random_.uniform(3, 30)) if stage >= 5 else None
+            burned = started + timedelta(days=random_.uniform(120, 400)) if stage == 9 else None
+
+            return self._resource('assignment', number, {
+                'created_at': _format(started),
+                'subject_id': subject_id,
+                'subject_type': SUBJECT_TYPES[subject_id % 3],
+                'srs_stage': stage,
+                'srs_stage_name': SRS_STAGE_NAMES[stage],
+                'unlocked_at': _format(started),
+                'started_at': _format(started),
+                'passed_at': _format(passed),
+                'burned_at': _format(burned),
+                'available_at': _format(started + timedelta(days=random_.uniform(0, 700))) if stage < 9 else None,
+                'resurrected_at': None,
+                'hidden': False
+            })
+
+        return self._pages('assignments', self.assignments, self._id_base(self.assignments, 10000), item)
+
+    def get_reviews(self):
+        assignment_base = self._id_base(self.assignments, 10000)
+
+        def item(number, random_):
+            assignment = number % self.assignments
+            stage = 1 + number % 8
+
+            return self._resource('review', number, {
+                'created_at': _format(START + timedelta(minutes=5 * number)),
+                'assignment_id': assignment_base + assignment,
+                'subject_id': assignment + 1,
+                'spaced_repetition_system_id': 1,
+                'starting_srs_stage': stage,
+                'starting_srs_stage_name': SRS_STAGE_NAMES[stage],
+                'ending_srs_stage': stage + 1,
+                'ending_srs_stage_name': SRS_STAGE_NAMES[stage + 1],
+                'incorrect_meaning_answers': int(random_.expovariate(3)),
+                'incorrect_reading_answers': int(random_.expovariate(2)) if assignment % 3 else 0
+            })
+
+        return self._pages('reviews', self.reviews, self._id_base(self.reviews, 1000000), item)
+
+    def get_subjects(self):
+        def item(number, random_):
+            subject_type = SUBJECT_TYPES[(number + 1) % 3]
+            characters = None if subject_type == 'radical' and number % 10 == 0 else chr(0x4E00 + number % 20000)
+
+            return {
+                'id': number + 1,
+                'object': subject_type,
+                'url': f'https://api.wanikani.com/v2/subjects/{number + 1}',
+                'data_updated_at': _format(START),
+                'data': {
+                    'created_at': _format(START),
+                    'level': 1 + number % 60,
+                    'slug': f'subject-{number + 1}',
+                    'characters': characters,
+                    'character_images': [
+                        {'url': f'https://files.wanikani.com/{number + 1}.svg', 'content_type': 'image/svg+xml',
+                         'metadata': {'inline_styles': False}},
+                        {'url': f'https://files.wanikani.com/{number + 1}.png', 'content_type': 'image/png',
+                         'metadata': {'color': '#000000', 'dimensions': '64x64', 'style_name': '64px'}}
+                    ] if subject_type == 'radical' else [],
+                    'meanings': [{'meaning': f'Meaning {number + 1}', 'primary': True, 'accepted_answer': True}],
+                    'document_url': f'https://www.wanikani.com/subjects/{number + 1}'
+                }
+            }
+
+        return self._pages('subjects', self.subjects, 1, item, ids=False)
+
+    def get_srs_stages(self) -> dict:
+        return {
+            'object': 'collection',
+            'url': 'https://api.wanikani.com/v2/srs_stages',
+            'data': [
+                {'srs_stage': stage, 'srs_stage_name': name, 'interval': 0, 'accelerated_interval': 0}
+                for stage, name in enumerate(SRS_STAGE_NAMES)
+            ]
+        }
+
+    def _id_base(self, per_account: int, minimum: int) -> int:
+        # Leave room between accounts so the global primary keys never collide.
+        return self.account * max(per_account, minimum)
+
+    def _resource(self, object_type: str, number: int, data: dict) -> dict:
+        return {'id': number, 'object': object_type, 'data_updated_at': data['created_at'], 'data': data}
+
+    def _pages(self, endpoint: str, total: int, id_base: int, item, ids: bool = True):
+        """
+        Yields the endpoint's pages, generating each item as it's reached.
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint name.
+        total : int
+            The total number of items.
+        id_base : int
+            The ID of the first item.
+        item : Callable
+            Creates the item with the given number from a random number generator.
+        ids : bool
+            Whether to offset the item IDs by id_base - subjects have their own global IDs.
+
+        Returns
+        -------
+        dict
+            The JSON response for the current page.
+
+        """
+        size = PAGE_SIZES[endpoint]
+        url = f'https://api.wanikani.com/v2/{endpoint}'
+        random_ = random.Random(f'{self._seed}:{self.account}:{endpoint}')
+
+        for start in range(0, total, size) or [0]:
+            data = []
+
+            for number in range(start, min(start + size, total)):
+                resource = item(number, random_)
+
+                if ids:
+                    resource['id'] = id_base + number
+
+                data.append(resource)
+
+            end = start + len(data)
+
+            yield {
+                'object': 'collection',
+                'url': url,
+                'pages': {
+                    'per_page': size,
+                    'next_url': f'{url}?page_after_id={data[-1]["id"]}' if end < total else None,
+                    'previous_url': None
+                },
+                'total_count': total,
+                'data_updated_at': _format(START),
+                'data': data
+            }
+
+
+def _format(date: datetime):
+    return date.strftime(DATE_FORMAT) if date else None
@@ -0,0 +1,148 @@
+"""
+Planning versus execution time of the analytics queries, ad hoc and as prepared statements.
+
+Seeds a synthetic multi-user dataset and captures every parameterized query the `_analyze_*` methods issue for
+one user. Each query is explained with its parameters inlined, the way it was planned on every request before,
+and again through `EXPLAIN EXECUTE` once its prepared statement has settled on a plan. The full set of analyses
+is then timed end to end with prepared statements turned off and on.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.prepared [--users 50] [--repeat 20]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from app import create_app, database
+from app.analyzer import Analyzer
+from app.psql import PostgresClient
+from benchmarks.common import seed, first_account
+from benchmarks.query_plans import RecordingClient
+
+# Postgres plans the first five executions of a prepared statement with their parameters before it considers
+# switching to a generic plan, so warm each statement up past that point.
+WARM_UP = 6
+
+
+def analyze_all(analyzer: Analyzer, user):
+    """
+    Runs every analysis the stats page shows for the user.
+
+    Parameters
+    ----------
+    analyzer : Analyzer
+        The analyzer to run.
+    user : Account
+        The user's Account ORM object.
+
+    Returns
+    -------
+    None
+
+    """
+    for analyze in (analyzer._analyze_level_progressions, analyzer._analyze_assignments, analyzer._analyze_reviews):
+        analyze(user=user)
+
+
+def timings(cursor, sql: str, params=None) -> tuple:
+    """
+    Runs EXPLAIN ANALYZE on the statement.
+
+    Parameters
+    ----------
+    cursor : cursor
+        A DB-API cursor.
+    sql : str
+        The statement to explain.
+    params : Union[tuple, list, dict]
+        The values of the statement's parameters.
+
+    Returns
+    -------
+    tuple
+        The planning and execution times in milliseconds.
+
+    """
+    cursor.execute(f'EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) {sql}', params)
+    result = cursor.fetchone()[0][0]
+
+    return result['Planning Time'], result['Execution Time']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50, help='number of synthetic accounts to seed')
+    parser.add_argument('--assignments', type=int, default=2000, help='assignments per account')
+    parser.add_argument('--reviews', type=int, default=20000, help='reviews per account')
+    parser.add_argument('--repeat', type=int, default=20, help='end-to-end runs of the analyses per mode')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        if not args.skip_seed:
+            seed(users=args.users, assignments=args.assignments, reviews=args.reviews)
+
+        user = first_account()
+        report = {'queries': [], 'end_to_end': {}}
+
+        with PostgresClient.from_pool(database.engine) as db:
+            recorder = RecordingClient(db)
+
+            for _ in range(WARM_UP):
+                analyze_all(Analyzer(wanikani=None, db=recorder), user=user)
+
+            cursor = db._connection.cursor()
+
+            try:
+                for sql, params in dict.fromkeys((sql, json.dumps(params)) for sql, params in recorder.queries if params):
+                    params = json.loads(params)
+
+                    if sql not in db._prepared:
+                        continue  # Streamed through a server-side cursor, which can't use a prepared statement.
+
+                    name, keys = db._prepared[sql]
+                    ad_hoc = timings(cursor, sql, params)
+                    values = [params[key] for key in keys]
+                    prepared = timings(cursor, f"EXECUTE {name}({', '.join(['%s'] * len(values))})", values)
+
+                    report['queries'].append({
+                        'sql': ' '.join(sql.split()),
+                        'ad_hoc': {'planning_ms': ad_hoc[0], 'execution_ms': ad_hoc[1]},
+                        'prepared': {'planning_ms': prepared[0], 'execution_ms': prepared[1]}
+                    })
+                    print(f'{ad_hoc[0]:>8.3f} / {ad_hoc[1]:>8.3f} ms ad hoc | {prepared[0]:>8.3f} / {prepared[1]:>8.3f} ms prepared'
+                          f" | {' '.join(sql.split())[:60]}")
+            finally:
+                cursor.close()
+
+        for mode, prepare in (('ad_hoc', False), ('prepared', True)):
+            with PostgresClient.from_pool(database.engine, prepare=prepare) as db:
+                analyzer = Analyzer(wanikani=None, db=db)
+                analyze_all(analyzer, user=user)  # Warm the caches and any statements the connection hasn't prepared.
+                durations = []
+
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    analyze_all(analyzer, user=user)
+                    durations.append((time.perf_counter() - start) * 1000)
+
+            report['end_to_end'][mode] = {'median_ms': statistics.median(durations), 'min_ms': min(durations)}
+
+    planning = {mode: sum(query[mode]['planning_ms'] for query in report['queries']) for mode in ('ad_hoc', 'prepared')}
+    execution = {mode: sum(query[mode]['execution_ms'] for query in report['queries']) for mode in ('ad_hoc', 'prepared')}
+
+    print(f"\n{len(report['queries'])} parameterized queries per view")
+    print(f"Total planning:  {planning['ad_hoc']:>8.3f} ms ad hoc | {planning['prepared']:>8.3f} ms prepared")
+    print(f"Total execution: {execution['ad_hoc']:>8.3f} ms ad hoc | {execution['prepared']:>8.3f} ms prepared")
+
+    for mode, result in report['end_to_end'].items():
+        print(f"End to end ({mode}): {result['median_ms']:.1f} ms median, {result['min_ms']:.1f} ms min")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Query plan regression check for the analytics queries.
+
+Seeds a synthetic multi-user dataset, captures every query the `_analyze_*` methods issue for one user
+and runs `EXPLAIN (ANALYZE, BUFFERS)` on each of them.
+Exits with a non-zero status if any query sequentially scans a per-user table or exceeds the cost budget.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.query_plans [--users 50] [--cost-budget 20000]
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import event
+
+from app import create_app, database
+from app.analyzer import Analyzer
+from benchmarks.common import seed, first_account, postgres_client
+
+# Seq scans on these are always a regression since they grow with the number of users.
+PER_USER_TABLES = {'assignment', 'level_progression', 'review'}
+
+
+class RecordingClient:
+    """
+    Wraps a database client and records every query sent through it.
+
+    Parameters
+    ----------
+    db : PostgresClient
+        The client to delegate to.
+    """
+    def __init__(self, db):
+        self._db = db
+        self.dialect = db.dialect
+        self.queries = []
+
+    def query_all(self, sql: str, params=None) -> list:
+        self.queries.append((sql, params))
+        return self._db.query_all(sql, params)
+
+    def query_one(self, sql: str, params=None) -> dict:
+        self.queries.append((sql, params))
+        return self._db.query_one(sql, params)
+
+    def query_iter(self, sql: str, params=None, **kwargs):
+        self.queries.append((sql, params))
+        return self._db.query_iter(sql, params, **kwargs)
+
+
+def capture_queries(user) -> list:
+    """
+    Runs every analysis for the user and captures the SQL issued both by the client and by the ORM.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object.
+
+    Returns
+    -------
+    list
+        The unique SQL statements in the order they were first issued.
+
+    """
+    db = RecordingClient(postgres_client())
+    analyzer = Analyzer(wanikani=None, db=db)
+    orm_queries = []
+
+    def record_orm_query(conn, cursor, statement, parameters, context, executemany):
+        orm_queries.append(cursor.mogrify(statement, parameters).decode())
+
+    event.listen(database.engine, 'before_cursor_execute', record_orm_query)
+
+    try:
+        for analyze in (analyzer._analyze_level_progressions, analyzer._analyze_assignments, analyzer._analyze_reviews,
+                        analyzer.forecast):
+            analyze(user=user)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', record_orm_query)
+
+    connection = database.engine.raw_connection()
+    cursor = connection.cursor()
+
+    try:
+        client_queries = [cursor.mogrify(sql, params).decode() for sql, params in db.queries]
+    finally:
+        cursor.close()
+        connection.close()
+
+    return list(dict.fromkeys(orm_queries + client_queries))
+
+
+def walk(plan: dict):
+    """
+    Yields every node of an EXPLAIN plan tree.
+
+    Parameters
+    ----------
+    plan : dict
+        The root plan node in EXPLAIN's JSON format.
+
+    Returns
+    -------
+    dict
+        The current plan node.
+
+    """
+    yield plan
+
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+def explain(cursor, sql: str) -> dict:
+    """
+    Runs EXPLAIN (ANALYZE, BUFFERS) on the query.
+
+    Parameters
+    ----------
+    cursor : cursor
+        A DB-API cursor.
+    sql : str
+        The query to explain.
+
+    Returns
+    -------
+    dict
+        The plan and timing info in EXPLAIN's JSON format.
+
+    """
+    cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+    return cursor.fetchone()[0][0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50, help='number of synthetic accounts to seed')
+    parser.add_argument('--assignments', type=int, default=2000, help='assignments per account')
+    parser.add_argument('--reviews', type=int, default=20000, help='reviews per account')
+    parser.add_argument('--cost-budget', type=float, default=20000, help='maximum planner cost for any single query')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', help='write the full plans to this JSON file')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        if not args.skip_seed:
+            seed(users=args.users, assignments=args.assignments, reviews=args.reviews)
+
+        queries = capture_queries(user=first_account())
+
+        connection = database.engine.raw_connection()
+        cursor = connection.cursor()
+        failures = []
+        report = []
+
+        try:
+            for sql in queries:
+                result = explain(cursor, sql)
+                plan = result['Plan']
+                seq_scans = sorted({
+                    node['Relation Name'] for node in walk(plan)
+                    if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in PER_USER_TABLES
+                })
+
+                report.append({'sql': sql, 'result': result})
+                print(f"{plan['Total Cost']:>10.1f} cost | {result['Execution Time']:>9.3f} ms | "
+                      f"{plan['Shared Hit Blocks']:>6} hit | {plan['Shared Read Blocks']:>6} read | {' '.join(sql.split())[:80]}")
+
+                if seq_scans:
+                    failures.append(f"Sequential scan on {', '.join(seq_scans)}: {sql}")
+
+                if plan['Total Cost'] > args.cost_budget:
+                    failures.append(f"Cost {plan['Total Cost']:.1f} is over the budget of {args.cost_budget}: {sql}")
+        finally:
+            cursor.close()
+            connection.close()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+
+    print(f'\n{len(queries)} queries checked, {len(failures)} failures.')
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Time-to-first-byte and bytes-on-the-wire benchmark for the stats page.
+
+Seeds a large account, analyzes it and renders the full stats page (every section inline) with the buffered
+render_template and with the streamed renderer for each content encoding, including repeat renders from the cache.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.rendering [--reviews 200000] [--top 3]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from flask import render_template
+
+from app import create_app
+from app.analyzer import Analyzer
+from app.serialization import dumps, to_json
+from app.streaming import brotli, render_streamed
+from benchmarks.common import seed, first_account, postgres_client
+
+
+def account_data(top: int) -> dict:
+    """
+    Analyzes the first seeded account the same way the stats page does.
+
+    Parameters
+    ----------
+    top : int
+        The number of highest and lowest values to include.
+
+    Returns
+    -------
+    dict
+        The JSON the stats page is rendered with.
+
+    """
+    user = first_account()
+    db = postgres_client()
+
+    try:
+        analyzer = Analyzer(wanikani=None, db=db)
+
+        return to_json({
+            'user': {'id': user.id, 'level': user.level, 'username': user.username, 'start_date': user.start_date},
+            'level_progressions': analyzer.analyze(user=user, section='level_progressions', top=top),
+            'assignments': analyzer.analyze(user=user, section='assignments', top=top),
+            'reviews': analyzer.analyze(user=user, section='reviews', top=top)
+        })
+    finally:
+        db.close()
+
+
+def measure(app, render, encoding: str) -> tuple:
+    """
+    Renders the page once, timing the first chunk and the whole body.
+
+    Parameters
+    ----------
+    app : Flask
+        The application to render with.
+    render : Callable
+        Returns the response body as an iterable of chunks.
+    encoding : str
+        The Accept-Encoding to send.
+
+    Returns
+    -------
+    tuple
+        The time to first byte and total time in milliseconds, and the body size in bytes.
+
+    """
+    with app.test_request_context('/', headers={'Accept-Encoding': encoding}):
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+
+        for chunk in render():
+            if first_byte is None:
+                first_byte = time.perf_counter()
+
+            size += len(chunk)
+
+        end = time.perf_counter()
+
+    return (first_byte - start) * 1000, (end - start) * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assignments', type=int, default=9000, help='assignments in the account')
+    parser.add_argument('--reviews', type=int, default=200000, help='reviews in the account')
+    parser.add_argument('--top', type=int, default=3, help='highest and lowest values per list')
+    parser.add_argument('--repeat', type=int, default=20, help='renders per measurement')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data from a previous run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+    app = create_app()
+
+    with app.app_context():
+        if not args.skip_seed:
+            seed(users=1, assignments=args.assignments, reviews=args.reviews)
+
+        data = account_data(top=args.top)
+
+    context = {'title': 'Overall Stats', 'profile_pic': app.config['LOGO'], 'data': data}
+    cache_key = dumps(data)
+
+    def buffered():
+        return [render_template('overall_stats.html', **context).encode()]
+
+    def streamed():
+        app.extensions['render_cache'].clear()  # Measure uncached renders.
+        return render_streamed('overall_stats.html', cache_key=cache_key, **context).response
+
+    def cached():
+        return render_streamed('overall_stats.html', cache_key=cache_key, **context).response
+
+    results = []
+    encodings = ['identity', 'gzip'] + (['br'] if brotli else [])
+
+    for name, render, encodings in (('buffered', buffered, ['identity']),
+                                    ('streamed', streamed, encodings),
+                                    ('cached', cached, encodings)):
+        for encoding in encodings:
+            runs = [measure(app, render, encoding) for _ in range(args.repeat)]
+            result = {
+                'renderer': name,
+                'encoding': encoding,
+                'ttfb_ms': statistics.median(run[0] for run in runs),
+                'total_ms': statistics.median(run[1] for run in runs),
+                'bytes': runs[-1][2]
+            }
+            results.append(result)
+            print(f"{name:>8} | {encoding:>8} | TTFB {result['ttfb_ms']:>8.2f} ms | "
+                  f"total {result['total_ms']:>8.2f} ms | {result['bytes']:>8} bytes")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Synthetic ingest and analytics benchmark suite.
+
+Empties the database, then syncs synthetic accounts through the real Analyzer ingest with WaniKani-shaped payloads
+and runs each `_analyze_*` method against them. Reports ingest throughput, analysis latency percentiles and the
+peak Python memory of each step, and saves everything as JSON. Pass the JSON of a previous run with --compare
+to print the change of each measurement.
+
+Usage: DATABASE_URL=<scratch database> python -m benchmarks.suite [--accounts 1] [--levels 60] [--assignments 10000]
+       [--reviews 200000] [--repeat 20] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+from app import create_app
+from app.analyzer import Analyzer
+from app.models import Account
+from benchmarks.common import reset, postgres_client
+from benchmarks.payloads import SyntheticWaniKaniClient
+
+ANALYSES = ('_analyze_level_progressions', '_analyze_assignments', '_analyze_reviews')
+
+
+@contextlib.contextmanager
+def measured(result: dict):
+    """
+    Records the wall time and peak traced memory of the block into the result.
+
+    Parameters
+    ----------
+    result : dict
+        Receives the seconds and peak_memory_bytes keys.
+
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+
+def percentiles(samples: list) -> dict:
+    """
+    Summarizes latency samples.
+
+    Parameters
+    ----------
+    samples : list
+        The latencies in seconds.
+
+    Returns
+    -------
+    dict
+        The p50, p90 and p99 latencies and the mean, in milliseconds.
+
+    """
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'mean_ms': statistics.mean(ordered) * 1000
+    }
+
+
+def ingest(clients: list) -> dict:
+    """
+    Syncs each synthetic account through the Analyzer, one after another.
+
+    Parameters
+    ----------
+    clients : list
+        The SyntheticWaniKaniClient of each account.
+
+    Returns
+    -------
+    dict
+        The ingest measurements.
+
+    """
+    result = {'accounts': len(clients), 'rows': sum(client.rows for client in clients)}
+    latencies = []
+
+    # The ingest prints every row it writes, which is part of its cost but would drown out the report.
+    with measured(result), contextlib.redirect_stdout(io.StringIO()) as output:
+        for client in clients:
+            start = time.perf_counter()
+
+            with postgres_client() as db:
+                Analyzer(wanikani=client, db=db).sync_user_info()
+
+            latencies.append(time.perf_counter() - start)
+            output.seek(0)
+            output.truncate()
+
+    result['rows_per_second'] = result['rows'] / result['seconds']
+    result['per_account'] = percentiles(latencies)
+
+    return result
+
+
+def analyze(user: Account, repeat: int) -> dict:
+    """
+    Times each analysis for the user.
+
+    Parameters
+    ----------
+    user : Account
+        The user's Account ORM object.
+    repeat : int
+        The number of timed runs of each analysis.
+
+    Returns
+    -------
+    dict
+        The measurements of each analysis.
+
+    """
+    results = {}
+
+    with postgres_client() as db:
+        analyzer = Analyzer(wanikani=None, db=db)
+
+        for name in ANALYSES:
+            analysis = getattr(analyzer, name)
+            analysis(user=user)  # Warm the caches and prepare the statements.
+            latencies = []
+            result = {}
+
+            with measured(result):
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    analysis(user=user)
+                    latencies.append(time.perf_counter() - start)
+
+            result.update(percentiles(latencies))
+            result['runs_per_second'] = repeat / result.pop('seconds')
+            results[name] = result
+
+    return results
+
+
+def compare(current: dict, previous: dict):
+    """
+    Prints the change of each measurement from a previous run.
+
+    Parameters
+    ----------
+    current : dict
+        This run's results.
+    previous : dict
+        The previous run's results.
+
+    Returns
+    -------
+    None
+
+    """
+    print(f"\nCompared to {previous['meta'].get('commit') or 'the previous run'}:")
+
+    rows = [('ingest rows/s', current['ingest']['rows_per_second'], previous['ingest']['rows_per_second']),
+            ('ingest peak memory', current['ingest']['peak_memory_bytes'], previous['ingest']['peak_memory_bytes'])]
+
+    for name in ANALYSES:
+        if name in previous['analyses']:
+            for key in ('p50_ms', 'p99_ms', 'peak_memory_bytes'):
+                rows.append((f'{name} {key}', current['analyses'][name][key], previous['analyses'][name][key]))
+
+    for label, now, before in rows:
+        change = (now - before) / before * 100 if before else 0
+        print(f'{label:>45} | {before:>14.2f} -> {now:>14.2f} | {change:>+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=1, help='synthetic accounts to ingest')
+    parser.add_argument('--levels', type=int, default=60, help='level progressions per account')
+    parser.add_argument('--assignments', type=int, default=10000, help='assignments per account')
+    parser.add_argument('--reviews', type=int, default=200000, help='reviews per account')
+    parser.add_argument('--subjects', type=int, default=9000, help='shared subjects')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs of each analysis')
+    parser.add_argument('--seed', type=int, default=0, help='seeds the synthetic data')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='the JSON results of a previous run to compare with')
+    args = parser.parse_args()
+
+    clients = [
+        SyntheticWaniKaniClient(account=account, levels=args.levels, assignments=args.assignments,
+                                reviews=args.reviews, subjects=args.subjects, seed=args.seed)
+        for account in range(1, args.accounts + 1)
+    ]
+
+    with create_app().app_context():
+        reset()
+
+        results = {
+            'meta': {
+                'commit': _commit(),
+                'date': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'arguments': vars(args)
+            },
+            'ingest': ingest(clients)
+        }
+
+        user = Account.query.filter_by(username=clients[0].get_user()['username']).one()
+        results['analyses'] = analyze(user=user, repeat=args.repeat)
+
+    ingested = results['ingest']
+    print(f"Ingest: {ingested['rows']} rows in {ingested['seconds']:.1f} s ({ingested['rows_per_second']:.0f} rows/s), "
+          f"p50 {ingested['per_account']['p50_ms']:.0f} ms per account, "
+          f"peak {ingested['peak_memory_bytes'] / 2 ** 20:.1f} MiB")
+
+    for name, result in results['analyses'].items():
+        print(f"{name:>28} | p50 {result['p50_ms']:>8.2f} ms | p90 {result['p90_ms']:>8.2f} ms | "
+              f"p99 {result['p99_ms']:>8.2f} ms | {result['runs_per_second']:>7.1f}/s | "
+              f"peak {result['peak_memory_bytes'] / 2 ** 20:>6.2f} MiB")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    main()